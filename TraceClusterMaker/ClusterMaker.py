@@ -1,4 +1,6 @@
 import argparse
+import concurrent.futures
+import itertools
 import json
 import logging
 import os
@@ -6,8 +8,11 @@ import re
 import time
 import typing
 import numpy
+import scipy.sparse
 import cluster
+import ClusterModel
 import DCFG
+import DCFGCache
 import GKA
 
 logging.basicConfig(
@@ -15,6 +20,29 @@ logging.basicConfig(
     format = '%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s'
 )
 
+def _build_hit_tables(
+    graph      :typing.Type[DCFG.DCFG],
+    trace      :str,
+    chunk_size :typing.Optional[int],
+    cache      :typing.Optional[DCFGCache.DCFGCache],
+    window     :typing.Optional[int] =None,
+    entry_addr :typing.Optional[int] =None
+) -> typing.Tuple[dict, int, int] :
+    """ Worker of `MakeCluster._build_dcfg_all` in a process pool
+
+    Returns the compact hit tables of one trace (see `DCFG.export_hit_tables`)
+    rather than a graph object, so little has to be pickled back, along with
+    the cache hits and misses of this worker's copy of the cache.
+    """
+    if cache is not None:
+        cache.hits = cache.misses = 0
+    o = graph(trace, chunk_size=chunk_size, cache=cache, window=window, entry_addr=entry_addr)
+    o.traverse_trace()
+    if cache is None:
+        return o.export_hit_tables(), 0, 0
+    return o.export_hit_tables(), cache.hits, cache.misses
+
+
 class MakeCluster:
     """ Wrapper of methods about trace file clustering
     """
@@ -25,7 +53,31 @@ class MakeCluster:
         kernel        :typing.Type[GKA.GKA],
         method        :typing.Type[cluster.ClusterWrapper],
         outlier_ratio :float =0.0,
-        max_cluster   :int =16
+        max_cluster   :int =16,
+        chunk_size    :typing.Optional[int] =None,
+        cache         :typing.Optional[DCFGCache.DCFGCache] =None,
+        jobs          :int =1,
+        dedup         :bool =False,
+        window        :typing.Optional[int] =None,
+        window_entry  :typing.Optional[int] =None,
+        load_features :typing.Optional[str] =None,
+        load_matrix   :typing.Optional[str] =None,
+        save_features :typing.Optional[str] =None,
+        save_matrix   :typing.Optional[str] =None,
+        nystroem      :typing.Optional[int] =None,
+        nystroem_sample :int =500,
+        lsh_bands     :typing.Optional[int] =None,
+        lsh_band_size :int =4,
+        block_size    :typing.Optional[int] =None,
+        memmap_dir    :typing.Optional[str] =None,
+        memmap_dtype  :typing.Any =numpy.float64,
+        knn           :typing.Optional[int] =None,
+        eigengap      :bool =False,
+        silhouette_sample :typing.Optional[int] =None,
+        outlier_space :str ="matrix",
+        outlier_dim   :int =32,
+        linkage       :str ="average",
+        representatives :int =3
     ) -> None :
         """ Constructor
 
@@ -35,6 +87,65 @@ class MakeCluster:
         :param graph:  graph type from `DCFG.py`
         :param kernel:  graph kernel algorithm from `GKA.py`
         :param method:  clustering algorithm wrapper from `cluster.py`
+        :param chunk_size:  `None` to load each trace at once, or the number of
+                            trace entries per chunk to stream each trace
+        :param cache:  `None`, or a DCFG cache shared by all traces
+        :param jobs:  number of processes building DCFGs and evaluating the
+                      rounds of the cluster-count sweep in parallel
+        :param dedup:  collapse duplicate traces and duplicate DCFGs so that
+                       only unique representatives are clustered
+        :param window:  `None`, or the number of last entries of each trace
+                        to build its DCFG from
+        :param window_entry:  `None`, or an address (e.g. a function entry);
+                              each DCFG is built from the last occurrence
+                              of it on
+        :param load_features:  `None`, or a `.npz` file saved by `save_features`
+                               to start from instead of building DCFGs and
+                               WL features; traces it does not cover are
+                               built and added incrementally (`GKA.GKA_SparseWL` only)
+        :param load_matrix:  `None`, or a `.npz` file saved by `save_matrix` to
+                             start from; it must cover all traces (see
+                             `load_features` to add traces)
+        :param save_features:  `None`, or a `.npz` file to save the WL feature
+                               matrix and vocabulary to (`GKA.GKA_SparseWL` only)
+        :param save_matrix:  `None`, or a `.npz` file to save the similarity matrix to
+        :param nystroem:  `None` for the exact kernel, or the number of landmark
+                          graphs of the Nystroem approximation (`GKA.GKA_SparseWL`
+                          only); outlier detection and clustering then run on
+                          the low-rank factor, and no N x N matrix is built
+        :param nystroem_sample:  number of graphs on which the approximation
+                                 is compared with the exact kernel
+        :param lsh_bands:  `None` for all pairs, or the number of LSH bands of
+                           `GKA.MinHashLSH` (`GKA.GKA_SparseWL` only); the
+                           kernel is then computed for candidate pairs only,
+                           and the similarity matrix is sparse
+        :param lsh_band_size:  number of MinHash values per LSH band
+        :param block_size:  `None` to keep the similarity matrix in memory, or
+                            the number of rows per tile of an out-of-core matrix
+                            (`GKA.GKA_SparseWL` only): the matrix is written to a
+                            temporary `numpy.memmap` and read tile by tile
+        :param memmap_dir:  directory of the temporary matrices, or `None` for
+                            the system default (`block_size` only)
+        :param memmap_dtype:  dtype of the temporary matrices, e.g. `numpy.float32`
+                              to halve their size (`block_size` only)
+        :param knn:  `None` for the dense similarity matrix, or the number of
+                     nearest neighbors of each graph to keep in a sparse
+                     affinity graph (`GKA.GKA_SparseWL` only)
+        :param eigengap:  also try the number of clusters at the largest
+                          eigengap of the spectral embedding when the
+                          silhouette sweep stops before it
+        :param silhouette_sample:  `None` for exact silhouette scores, or the
+                                   number of rows of a stratified sample to
+                                   estimate them from (dense matrix only)
+        :param outlier_space:  samples of outlier detection: "matrix" for the
+                               rows of the distance matrix, "spectral" or "mds"
+                               for an `outlier_dim`-dimensional embedding, or
+                               "knn" for the distances to the `outlier_dim`
+                               nearest neighbors (dense matrix only)
+        :param outlier_dim:  see `outlier_space`
+        :param linkage:  linkage criterion of `cluster.ClusterWrapper_hierarchical`
+        :param representatives:  number of most central traces of each cluster
+                                 to report (see `self.central`), 0 for none
         """
         self._graph  = graph
         self._kernel = kernel
@@ -46,105 +157,529 @@ class MakeCluster:
 
         self.outlier = outlier_ratio
         self.cluster_num_limit = max_cluster
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self.jobs = jobs
+        self.dedup = dedup
+        self.window = window
+        self.window_entry = window_entry
+        self.load_features = load_features
+        self.load_matrix = load_matrix
+        self.save_features = save_features
+        self.save_matrix = save_matrix
+        self.nystroem = nystroem
+        self.nystroem_sample = nystroem_sample
+        # Approximation quality report (`nystroem` only)
+        self.nystroem_quality = None
+        self.lsh_bands = lsh_bands
+        self.lsh_band_size = lsh_band_size
+        # Candidate pair report (`lsh_bands` only)
+        self.lsh_stat = None
+        self.block_size = block_size
+        self.memmap_dir = memmap_dir
+        self.memmap_dtype = memmap_dtype
+        self.knn = knn
+        self.eigengap = eigengap
+        self.silhouette_sample = silhouette_sample
+        self.outlier_space = outlier_space
+        self.outlier_dim = outlier_dim
+        self.linkage = linkage
+        self.representatives = representatives
+        # Cluster-ID String => its most central traces, medoid first, set by `launcher`
+        self.central = None
+        # Dendrogram of `cluster.ClusterWrapper_hierarchical` for the report, set by `launcher`
+        self.dendrogram = None
+        # Cluster-ID String of each graph (row of the similarity matrix), set by `launcher`
+        self.graph_tag = None
+        # Row of the similarity matrix of each trace, set by `launcher`
+        self.uniq = None
+        # Kernel instance of the similarity matrix of all graphs
+        self.gka = None
+        # Rep trace path => paths of all traces collapsed into it (`dedup` only)
+        self.duplicates = {}
+        # Node labels of all graphs in this run are interned ids
+        self.addr_table = DCFG.AddressTable()
+
+    def _build_dcfg(self, trace :str) -> DCFG.DCFG :
+        """ Build one DCFG object from a trace file
+        """
+        o = self._graph(trace, chunk_size=self.chunk_size, cache=self.cache, addr_table=self.addr_table,
+                        window=self.window, entry_addr=self.window_entry)
+        o.construct_dcfg()
+        return o
+
+    def _build_dcfg_all(self, trace_lst :typing.Optional[typing.List[str]] =None) -> list :
+        """ Build DCFG data list from `trace_lst` (default: `self._trace_lst`)
+
+        Each DCFG object (with its hit tables and raw trace) is dropped as
+        soon as its graph is built, so peak memory is bounded by the graphs
+        rather than by the traces.
 
-    def _build_dcfg_lst(self) -> typing.List[DCFG.DCFG] :
-        """ Build DCFG objects from `self._trace_lst`
+        With more than one job, the traces are parsed in a process pool whose
+        workers send back compact hit tables, and the graphs are built from
+        them here. The order of the list still follows `trace_lst`.
         """
-        objs = []
-        for t in self._trace_lst:
-            o = self._graph(t)
-            o.construct_dcfg()
-            objs.append(o)
-        return objs
+        if trace_lst is None:
+            trace_lst = self._trace_lst
+        if self.jobs <= 1:
+            return [self._build_dcfg(t).return_dcfg() for t in trace_lst]
+
+        graphs = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs) as pool:
+            results = pool.map(
+                _build_hit_tables,
+                itertools.repeat(self._graph),
+                trace_lst,
+                itertools.repeat(self.chunk_size),
+                itertools.repeat(self.cache),
+                itertools.repeat(self.window),
+                itertools.repeat(self.window_entry),
+                chunksize = max(1, len(trace_lst) // (4 * self.jobs))
+            )
+            for t, (tables, hits, misses) in zip(trace_lst, results):
+                o = self._graph(t, addr_table=self.addr_table)
+                o.import_hit_tables(tables)
+                o.construct_dcfg()
+                graphs.append(o.return_dcfg())
+                if self.cache is not None:
+                    self.cache.hits += hits
+                    self.cache.misses += misses
+        return graphs
     
-    def _get_dcfg_all(self, objs :typing.List[DCFG.DCFG]) -> list :
-        """ Get DCFG data list from DCFG objects list
+    @staticmethod
+    def _collapse(keys :list) -> typing.Tuple[typing.List[int], typing.List[int]] :
+        """ Collapse equal keys
+
+        :return: (index of the first occurrence of each distinct key,
+                  index into the former list for each key)
         """
-        return [o.return_dcfg()  for o in objs]
+        first = {}
+        reps = []
+        inv = []
+        for i, k in enumerate(keys):
+            if k not in first:
+                first[k] = len(reps)
+                reps.append(i)
+            inv.append(first[k])
+        return reps, inv
 
-    def _build_similarity_matrix(self, g_list :list) -> numpy.ndarray :
-        """ Build Similarity Matrix
+    def _build_unique_dcfg_all(self) -> typing.Tuple[list, numpy.ndarray] :
+        """ Build the DCFG data list of unique representatives only
+
+        Traces with identical content are collapsed before parsing, then
+        traces whose DCFGs are identical after hit-counting (same canonical
+        signature, see `DCFG.dcfg_signature`) are collapsed as well.
+        `self.duplicates` records every group of more than one trace.
+
+        :return: (unique graphs, index into them for each trace in `self._trace_lst`)
+        """
+        trace_reps, trace_inv = \
+            self._collapse([DCFGCache.DCFGCache.hash_file(t) for t in self._trace_lst])
+        logging.info("{} unique traces out of {}".format(len(trace_reps), len(self._trace_lst)))
+
+        graphs = self._build_dcfg_all([self._trace_lst[i] for i in trace_reps])
+        graph_reps, graph_inv = self._collapse([DCFG.dcfg_signature(g) for g in graphs])
+        logging.info("{} unique DCFGs out of {}".format(len(graph_reps), len(self._trace_lst)))
+
+        uniq = numpy.array([graph_inv[trace_inv[i]] for i in range(len(self._trace_lst))])
+        self._set_duplicates(uniq)
+
+        return [graphs[i] for i in graph_reps], uniq
+
+    def _set_duplicates(self, uniq :numpy.ndarray) -> None :
+        """ Record in `self.duplicates` every group of traces sharing one graph
+
+        :param uniq: index of the graph of each trace in `self._trace_lst`
+        """
+        members = {}
+        for i, u in enumerate(uniq.tolist()):
+            members.setdefault(u, []).append(self._trace_lst[i])
+        self.duplicates = {m[0]: m for m in members.values() if len(m) > 1}
 
-        :param g_list: Graph list
+    def _new_kernel(self) -> GKA.GKA :
+        """ New instance of the graph kernel algorithm
         """
         if (GKA.GKA_GraKeL == self._kernel):
             # Parallelization
-            K = self._kernel(isVerbose=False, setJoblib=8)
-        else:
-            K = self._kernel()
-        K.graph_lst = g_list
+            return self._kernel(isVerbose=False, setJoblib=8)
+        return self._kernel()
+
+    def _apply_kernel(self, K :GKA.GKA) -> typing.Union[numpy.ndarray, scipy.sparse.csr_matrix] :
+        """ Compute the kernel of the graphs of a kernel instance
+
+        :return: the similarity matrix, its low-rank factor with `nystroem`,
+                 or the sparse similarity matrix with `lsh_bands` or `knn`
+        """
+        if self.nystroem is not None:
+            K.apply_WL_Subtree_Kernel_Nystroem(self.nystroem)
+            self.nystroem_quality = K.nystroem_quality(self.nystroem_sample)
+            logging.info("Nystroem approximation: {}".format(self.nystroem_quality))
+            return K.get_factor()
+        if self.lsh_bands is not None:
+            pairs = GKA.MinHashLSH(self.lsh_bands, self.lsh_band_size).candidate_pairs(K.graph_lst)
+            K.apply_WL_Subtree_Kernel_Pairs(pairs)
+            n = len(K.graph_lst)
+            self.lsh_stat = {
+                "Candidate Pairs": int(len(pairs)),
+                "All Pairs"      : n * (n - 1) // 2,
+                "Non-zero"       : int(K.get_sparse().nnz)
+            }
+            logging.info("LSH candidates: {}".format(self.lsh_stat))
+            return K.get_sparse()
+        if self.knn is not None:
+            K.apply_WL_Subtree_Kernel_KNN(self.knn)
+            logging.info("{} non-zero similarities in the {}-NN graph".format(K.get_sparse().nnz, self.knn))
+            return K.get_sparse()
+        if self.block_size is not None:
+            n = len(K.graph_lst)
+            K.apply_WL_Subtree_Kernel_Blocked(
+                cluster.temp_memmap((n, n), self.memmap_dtype, self.memmap_dir), self.block_size)
+            return K.get_matrix()
         K.apply_WL_Subtree_Kernel()
         return K.get_matrix()
 
+    def _blocked_submatrix(self, mat :numpy.ndarray, keep :typing.List[int]) -> numpy.memmap :
+        """ `mat[numpy.ix_(keep, keep)]` copied into a new temporary `numpy.memmap`, `block_size` rows at a time
+        """
+        sub = cluster.temp_memmap((len(keep), len(keep)), mat.dtype, self.memmap_dir)
+        for begin in range(0, len(keep), self.block_size):
+            rows = keep[begin:begin + self.block_size]
+            sub[begin:begin + len(rows)] = mat[rows][:, keep]
+        return sub
+
+    def _load_similarity_matrix(self) -> typing.Tuple[numpy.ndarray, numpy.ndarray] :
+        """ Start from saved features (`self.load_features`) or a saved matrix (`self.load_matrix`)
+
+        The saved rows are mapped onto `self._trace_lst` by trace path. Rows
+        of traces no longer in the list are dropped. Traces not covered by
+        saved features get their DCFGs built and added to the kernel
+        incrementally, one row each after the saved rows; with the matrix
+        saved along the features, only their rows of it are computed.
+        Without `dedup` every trace gets a row of its own, as if the matrix
+        had been built from scratch.
+
+        :return: (similarity matrix or its low-rank factor with `nystroem`,
+                  index of the row of each trace in `self._trace_lst`)
+        """
+        path = self.load_features if self.load_features is not None else self.load_matrix
+        logging.info("Loading {}".format(path))
+        with numpy.load(path, allow_pickle=False) as npz:
+            saved = {k: npz[k] for k in npz.files}
+        saved_row = dict(zip(saved.pop("trace").tolist(), saved.pop("uniq").tolist()))
+        rows = [saved_row.get(t, -1) for t in self._trace_lst]
+        missing = [t for t, r in zip(self._trace_lst, rows) if r < 0]
+
+        if self.load_features is not None:
+            self.gka = self._new_kernel()
+            self.gka.import_features(saved, self.addr_table)
+            n_saved = len(self.gka.graph_lst)
+            new_row = dict(zip(missing, range(n_saved, n_saved + len(missing))))
+            rows = [new_row[t] if r < 0 else r for t, r in zip(self._trace_lst, rows)]
+        else:
+            if missing:
+                raise Exception("Saved matrix does not cover trace: {} (use --load_features to add traces)".format(missing[0]))
+            mat = saved["matrix"]
+
+        # Keep the rows in use, in order of first use
+        if self.dedup:
+            keep, uniq = self._collapse(rows)
+            keep = [rows[i] for i in keep]
+            uniq = numpy.array(uniq)
+            self._set_duplicates(uniq)
+        else:
+            keep = rows
+            uniq = numpy.arange(len(self._trace_lst))
+        if self.gka is None:
+            return mat[numpy.ix_(keep, keep)], uniq
+
+        # Saved rows first, so that the saved matrix still covers them, then the new traces
+        order = [i for i, k in enumerate(keep) if k < n_saved] + [i for i, k in enumerate(keep) if k >= n_saved]
+        self.gka.select([keep[i] for i in order if keep[i] < n_saved])
+        if missing:
+            logging.info("Adding {} traces not covered by the saved features".format(len(missing)))
+            for g in self._build_dcfg_all(missing):
+                self.gka.add_dcfg(g)
+        uniq = numpy.argsort(order)[uniq]
+        return self._apply_kernel(self.gka), uniq
+
+    def _save_artifacts(self, mat :numpy.ndarray, uniq :numpy.ndarray) -> None :
+        """ Save the features (`self.save_features`) and the matrix (`self.save_matrix`) for later runs
+
+        Both `.npz` files also hold the trace paths (`trace`) and the row of
+        each trace (`uniq`). The features come with the matrix, but for the
+        out-of-core one, so that `load_features` only computes new rows.
+        """
+        trace = numpy.array(self._trace_lst)
+        if self.save_features is not None and self.gka is not None:
+            logging.info("Saving WL features: {}".format(self.save_features))
+            numpy.savez(self.save_features, trace=trace, uniq=uniq,
+                        **self.gka.export_features(self.addr_table, with_matrix=self.block_size is None))
+        if self.save_matrix is not None:
+            logging.info("Saving similarity matrix: {}".format(self.save_matrix))
+            numpy.savez(self.save_matrix, trace=trace, uniq=uniq, matrix=mat)
+
     def launcher(self) -> list :
         """ Launcher for clustering those trace files
 
         Cluster-ID String for each trace file will be saved in 
         list `self._trace_tag` with the same order as `self._trace_lst` and 
         `self._trace_tag` will be returned finally by this method.
+
+        With `dedup`, only unique representatives go through the similarity
+        matrix, outlier detection and clustering, weighted by how many traces
+        they stand for, and their Cluster-IDs are expanded back to every trace.
+
+        With saved features or a saved matrix, the DCFG and kernel stages
+        are skipped (but for traces not covered by saved features).
+
+        With `nystroem`, the stages after the kernel work on the rows of its
+        low-rank factor instead of the similarity matrix. With `lsh_bands`,
+        they work on the sparse similarity matrix of the candidate pairs, and
+        with `knn` on the sparse k-nearest-neighbor graph. With
+        `block_size`, they read the out-of-core matrix tile by tile.
         """
 
-        '''----- 1st Build DCFG -----'''
-        logging.info("Building DCFG objects")
-        dcfg_obj_lst = self._build_dcfg_lst()
-        
-        logging.info("Building DCFG graphs")
-        dcfg_all_origin = self._get_dcfg_all(dcfg_obj_lst)
+        if self.load_features is not None or self.load_matrix is not None:
+            '''----- 1st & 2nd Load Similarity Matrix -----'''
+            mat_all_origin, uniq = self._load_similarity_matrix()
+        else:
+            '''----- 1st Build DCFG -----'''
+            logging.info("Building DCFG graphs")
+            if self.dedup:
+                dcfg_all_origin, uniq = self._build_unique_dcfg_all()
+            else:
+                dcfg_all_origin = self._build_dcfg_all()
+                uniq = numpy.arange(len(self._trace_lst))
+            logging.info("Interned {} distinct addresses".format(len(self.addr_table)))
+
+            '''----- 2nd Build Similarity Matrix -----'''
+            logging.info("Building similarity matrix")
+            self.gka = self._new_kernel()
+            self.gka.graph_lst = dcfg_all_origin
+            mat_all_origin = self._apply_kernel(self.gka)
+        weights = numpy.bincount(uniq) if self.dedup else None
+        self._save_artifacts(mat_all_origin, uniq)
 
-        '''----- 2nd Build Similarity Matrix -----'''
-        logging.info("Building similarity matrix")
-        mat_all_origin = self._build_similarity_matrix(dcfg_all_origin)
+        # Cluster-ID String of each graph (row of `mat_all_origin`)
+        graph_tag = ["" for i in range(mat_all_origin.shape[0])]
         
         '''----- 3rd Check the outliers -----'''
         logging.info("Checking outliers")
                 
-        checker = cluster.ConvergerWrapper(mat_all_origin, outlier_ratio=self.outlier)
+        if self.nystroem is not None:
+            checker = cluster.ConvergerWrapper_lowrank(mat_all_origin, outlier_ratio=self.outlier, weights=weights)
+        elif "knn" == self.outlier_space:
+            checker = cluster.ConvergerWrapper_knn(
+                mat_all_origin, outlier_ratio=self.outlier, weights=weights,
+                k=self.outlier_dim, block_size=self.block_size or 4096)
+        elif "matrix" != self.outlier_space:
+            checker = cluster.ConvergerWrapper_embedding(
+                mat_all_origin, outlier_ratio=self.outlier, weights=weights,
+                method=self.outlier_space, n_components=self.outlier_dim, block_size=self.block_size)
+        elif scipy.sparse.issparse(mat_all_origin):
+            checker = cluster.ConvergerWrapper_sparse(mat_all_origin, outlier_ratio=self.outlier, weights=weights)
+        elif self.block_size is not None:
+            checker = cluster.ConvergerWrapper_blocked(
+                mat_all_origin, outlier_ratio=self.outlier, weights=weights,
+                block_size=self.block_size, memmap_dir=self.memmap_dir)
+        else:
+            checker = cluster.ConvergerWrapper(mat_all_origin, outlier_ratio=self.outlier, weights=weights)
         checker.do_converging()
 
-        if (None == checker.outliers_result):
+        if checker.outliers_result is None:
             logging.info("No outliers were found")
             # No outliers
             mat_all_rm_outlier = mat_all_origin
+            weights_rm_outlier = weights
         else:
             logging.info("Some outliers were found")
             # Have outliers so mark and filter out them (just skip but keep the order)
-            dcfg_obj_lst_rm_outlier = []
-            for i in range(len(self._trace_lst)):
+            keep = []
+            for i in range(mat_all_origin.shape[0]):
                 if -1 == checker.outliers_result[i]:
-                    self._trace_tag[i] = "inf"
+                    graph_tag[i] = "inf"
                 else:
-                    dcfg_obj_lst_rm_outlier.append(dcfg_obj_lst[i])
+                    keep.append(i)
+            if weights is None:
+                weights_rm_outlier = None
+            else:
+                weights_rm_outlier = weights[checker.outliers_result != -1]
             
-            logging.info("Rebuilding similarity matrix")
-            mat_all_rm_outlier = \
-                self._build_similarity_matrix(self._get_dcfg_all(dcfg_obj_lst_rm_outlier))
+            if self.nystroem is not None:
+                # Rows of the low-rank factor are the graphs, no rebuilding
+                mat_all_rm_outlier = mat_all_origin[keep]
+            elif scipy.sparse.issparse(mat_all_origin):
+                # Pairs not kept stay 0 in the sub-matrix too
+                mat_all_rm_outlier = mat_all_origin[keep][:, keep]
+            elif self.block_size is not None:
+                mat_all_rm_outlier = self._blocked_submatrix(mat_all_origin, keep)
+            else:
+                # The kernel is normalized pairwise, so the sub-matrix is the
+                # same as the matrix rebuilt from the kept graphs
+                mat_all_rm_outlier = mat_all_origin[numpy.ix_(keep, keep)]
+
+        # Row of `mat_all_origin` of each row of `mat_all_rm_outlier`
+        kept = range(mat_all_origin.shape[0]) if checker.outliers_result is None else keep
 
         '''----- 4th Clustering -----'''
         logging.info("Do clustering")
-        executor = \
-            self._method(
-                mat_all_rm_outlier, 
-                max_cluster = self.cluster_num_limit)
-        executor.do_clustering()
+        if mat_all_rm_outlier.shape[0] < 3:
+            # Too few distinct graphs left (e.g. after `dedup`) for silhouette scores
+            logging.info("Fewer than 3 distinct DCFGs, all in one cluster")
+            clusters_result = numpy.zeros(mat_all_rm_outlier.shape[0])
+        else:
+            options = {"eigengap": self.eigengap, "jobs": self.jobs}
+            if self.nystroem is not None:
+                method = cluster.ClusterWrapper_spectral_lowrank
+            elif scipy.sparse.issparse(mat_all_rm_outlier):
+                method = cluster.ClusterWrapper_spectral_sparse
+            elif self.block_size is not None:
+                method = cluster.ClusterWrapper_spectral_blocked
+                # The sweep reads the out-of-core matrix in this process only
+                del options["jobs"]
+                options["block_size"] = self.block_size
+            elif issubclass(self._method, cluster.ClusterWrapper_hierarchical):
+                method = self._method
+                options = {"linkage": self.linkage}
+            else:
+                method = self._method
+                options["silhouette_sample"] = self.silhouette_sample
+            executor = \
+                method(
+                    mat_all_rm_outlier, 
+                    max_cluster = min(self.cluster_num_limit, mat_all_rm_outlier.shape[0] - 1),
+                    weights = weights_rm_outlier,
+                    **options)
+            executor.do_clustering()
+            if isinstance(executor, cluster.ClusterWrapper_hierarchical):
+                self.dendrogram = self._dendrogram_report(executor.linkage_matrix, kept, uniq)
+            else:
+                logging.info("Eigengap estimate: {} clusters".format(executor.eigengap_estimate))
+            clusters_result = executor.clusters_result
 
         '''----- 5th Save the results -----'''
         # Pre-check to reduce the number of comparison operations
-        if "inf" not in self._trace_tag:
+        if "inf" not in graph_tag:
             # no outliers so copy directly
-            for i in range(len(self._trace_lst)):
-                self._trace_tag[i] = str(executor.clusters_result[i])
+            for i in range(mat_all_origin.shape[0]):
+                graph_tag[i] = str(clusters_result[i])
         else:
             # the tags do not include outliers
             tag_this = 0
-            for i in range(len(self._trace_lst)):
-                if "inf" == self._trace_tag[i]:
+            for i in range(mat_all_origin.shape[0]):
+                if "inf" == graph_tag[i]:
                     continue
                 else:
-                    self._trace_tag[i] = str(executor.clusters_result[tag_this])
+                    graph_tag[i] = str(clusters_result[tag_this])
                     tag_this += 1
 
+        # Expand the tags of unique graphs back to every trace
+        for i in range(len(self._trace_lst)):
+            self._trace_tag[i] = graph_tag[uniq[i]]
+
+        if self.representatives > 0 and len(kept) > 0:
+            self.central = self._central_report(
+                mat_all_rm_outlier, weights_rm_outlier, [graph_tag[i] for i in kept], kept, uniq)
+
+        self.graph_tag = graph_tag
+        self.uniq = uniq
         return self._trace_tag
 
+    def make_model(self, n_prototypes :int =3, quantile :float =1.0) -> ClusterModel.ClusterModel :
+        """ Model of the clustering done by `launcher`, to assign new traces to its clusters
+
+        The prototypes of each cluster are its `n_prototypes` most central
+        graphs (see `cluster.central_members`), and its distance threshold
+        is the `quantile` of the distances of its traces to their nearest
+        prototype. Outliers belong to no cluster. Needs `GKA.GKA_SparseWL`.
+
+        :param n_prototypes: number of prototypes per cluster
+        :param quantile: 1.0 for the largest distance of a member, or lower
+                         to leave the farthest members out
+        """
+        assert (self.graph_tag is not None) , "Call `launcher` first"
+        assert (isinstance(self.gka, GKA.GKA_SparseWL)) , "Cluster model needs the native kernel"
+        weights = numpy.bincount(self.uniq, minlength=len(self.graph_tag))
+        members = numpy.array([i for i, t in enumerate(self.graph_tag) if "inf" != t], dtype=numpy.int64)
+        tags = numpy.array([self.graph_tag[i] for i in members])
+        weights = weights[members]
+        X = self.gka.normalized_features(members)
+        central = cluster.central_members(tags, n_prototypes, weights, features=X)
+
+        # Cluster-ID Strings in sorted order, as `central` has them
+        clusters = list(central)
+        cluster_of = numpy.searchsorted(clusters, tags)
+        protos = numpy.concatenate([central[c] for c in clusters])
+        proto_cluster = cluster_of[protos]
+
+        # Distance of each member to the nearest prototype of its cluster
+        own = (proto_cluster[None, :] == cluster_of[:, None])
+        similarity = numpy.where(own, (X @ X[protos].T).toarray(), -numpy.inf).max(axis=1)
+        distance = numpy.maximum(1 - similarity, 0)
+        threshold = [numpy.quantile(numpy.repeat(distance[cluster_of == c], weights[cluster_of == c]), quantile)
+                     for c in range(len(clusters))]
+
+        return ClusterModel.ClusterModel(
+            self.gka.export_features(self.addr_table, members[protos]),
+            clusters      = clusters,
+            proto_cluster = proto_cluster,
+            proto_trace   = self._row_traces(members[protos], self.uniq),
+            threshold     = numpy.array(threshold),
+            options       = {"graph": self._graph.__name__, "window": self.window, "window_entry": self.window_entry},
+            chunk_size    = self.chunk_size,
+            cache         = self.cache)
+
+
+    def _dendrogram_report(self, linkage_matrix :numpy.ndarray, rows :typing.Iterable[int], uniq :numpy.ndarray) -> dict :
+        """ Make a report about a dendrogram as a dict compatible with JSON
+
+        "Linkage" is the linkage matrix of `scipy.cluster.hierarchy`, one
+        merge [cluster, cluster, distance, number of leaves] per row, and
+        "Leaves" the (representative) trace of each of its leaves.
+
+        :param rows: row of `mat_all_origin` of each leaf
+        :param uniq: row of `mat_all_origin` of each trace
+        """
+        return {
+            "Linkage": [[int(a), int(b), float(d), int(n)] for a, b, d, n in linkage_matrix],
+            "Leaves" : self._row_traces(rows, uniq)
+        }
+
+    def _central_report(
+        self,
+        mat     :typing.Union[numpy.ndarray, scipy.sparse.csr_matrix],
+        weights :typing.Optional[numpy.ndarray],
+        tags    :typing.List[str],
+        rows    :typing.Sequence[int],
+        uniq    :numpy.ndarray
+    ) -> typing.Dict[str, typing.List[str]] :
+        """ Cluster-ID String => (representative) traces of its `representatives` most central graphs, medoid first
+
+        Computed by `cluster.central_members` without any kernel computation:
+        from the WL feature vectors with `GKA.GKA_SparseWL`, in linear time,
+        and otherwise from the matrix clustering ran on (GraKeL kernels or a
+        saved matrix), in time quadratic in the size of each cluster.
+
+        :param mat: similarity matrix of the clustered graphs, only used without WL features
+        :param weights: number of traces each row of `mat` stands for, or `None` for all 1
+        :param tags: Cluster-ID String of each row of `mat`
+        :param rows: row of `mat_all_origin` of each row of `mat`
+        :param uniq: row of `mat_all_origin` of each trace
+        """
+        if isinstance(self.gka, GKA.GKA_SparseWL):
+            central = cluster.central_members(tags, self.representatives, weights,
+                                              features=self.gka.normalized_features(numpy.asarray(rows)))
+        else:
+            central = cluster.central_members(tags, self.representatives, weights, similarity_mat=mat,
+                                              block_size=self.block_size or 4096)
+        return {c: self._row_traces([rows[i] for i in index], uniq) for c, index in central.items()}
+
+    def _row_traces(self, rows :typing.Iterable[int], uniq :numpy.ndarray) -> typing.List[str] :
+        """ First trace of each row of `mat_all_origin`, the representative of its duplicates
+        """
+        first = numpy.unique(uniq, return_index=True)[1]
+        return [self._trace_lst[first[r]] for r in rows]
+
 
 def MakeTruth(trace_lst :typing.List[str], regex_str :str) -> typing.List[str] :
     """ Get benchmark tag for each trace file in the file path list
@@ -165,22 +700,53 @@ def MakeTruth(trace_lst :typing.List[str], regex_str :str) -> typing.List[str] :
 def MakeScoresReport(rlst :typing.List[str], tlst :typing.List[str]) -> dict :
     """ Make a report about those scores as a dict compatible with JSON
 
+     All scores come from one contingency table of the result against the truth.
+
      :param rlist: result list
      :param tlist: truth list
     """
+    table = cluster.ContingencyTable(rlst, tlst)
     scores = {}
-    scores["Precision"     ] = cluster.Calculate__Precision     (rlst, tlst)
-    scores["Recall"        ] = cluster.Calculate__Recall        (rlst, tlst)
-    scores["F-measure"     ] = cluster.Calculate__F_Measure     (rlst, tlst)
-    scores["Purity"        ] = cluster.Calculate__Purity        (rlst, tlst)
-    scores["Inverse Purity"] = cluster.Calculate__Inverse_Purity(rlst, tlst)
+    scores["Precision"     ] = table.precision()
+    scores["Recall"        ] = table.recall()
+    scores["F-measure"     ] = table.f_measure()
+    scores["Purity"        ] = table.purity()
+    scores["Inverse Purity"] = table.inverse_purity()
+    scores["Rand Index"    ] = table.rand_index()
+    scores["ARI"           ] = table.adjusted_rand_index()
+    scores["NMI"           ] = table.normalized_mutual_info()
+    scores["BCubed Precision"], scores["BCubed Recall"], scores["BCubed F-measure"] = table.bcubed()
     return scores
 
 
-def MakeBaseReport(trace_lst :typing.List[str], result_lst :typing.List[str]) -> dict :
+def _AttachRepresentatives(report :dict, central :typing.Optional[dict]) -> dict :
+    """ Add the most central traces of each cluster (see `MakeCluster.central`) to a report
+    """
+    if central:
+        report["Representative"] = {c: {"Medoid": t[0], "Central": t} for c, t in central.items()}
+    return report
+
+
+def _AttachDuplicates(report :dict, duplicates :typing.Optional[dict]) -> dict :
+    """ Add groups of duplicate traces (see `MakeCluster.duplicates`) to a report
+    """
+    if duplicates:
+        report["Duplicate"] = duplicates
+    return report
+
+
+def MakeBaseReport(
+    trace_lst  :typing.List[str],
+    result_lst :typing.List[str],
+    duplicates :typing.Optional[dict] =None,
+    central    :typing.Optional[dict] =None
+) -> dict :
     """ Make a report about the results as a dict compatible with JSON
 
     The outliers will be marked specially in the report if they exist.
+    Each group of duplicate traces collapsed before clustering is listed
+    under its representative if `duplicates` is given. The medoid and the
+    most central traces of each cluster are listed if `central` is given.
     """
     groups = {}
 
@@ -192,7 +758,7 @@ def MakeBaseReport(trace_lst :typing.List[str], result_lst :typing.List[str]) ->
             else:
                 groups[result_lst[i]].append(trace_lst[i])
         # make report dict
-        return {"Result":groups}
+        return _AttachRepresentatives(_AttachDuplicates({"Result":groups}, duplicates), central)
     
     else:
         # get the groups with special treatment for outliers
@@ -207,14 +773,24 @@ def MakeBaseReport(trace_lst :typing.List[str], result_lst :typing.List[str]) ->
                 else:
                     groups[res].append(trace_lst[i])
         # make report dict
-        return {"Result":groups, "Outlier":olist}
+        return _AttachRepresentatives(_AttachDuplicates({"Result":groups, "Outlier":olist}, duplicates), central)
 
 
-def MakeFullReport(trace_lst :typing.List[str], result_lst :typing.List[str], truth_lst  :typing.List[str]) -> dict :
+def MakeFullReport(
+    trace_lst  :typing.List[str],
+    result_lst :typing.List[str],
+    truth_lst  :typing.List[str],
+    duplicates :typing.Optional[dict] =None,
+    central    :typing.Optional[dict] =None
+) -> dict :
     """ Make a full report about the results & scores as a dict compatible with JSON
 
     The outliers will be marked specially in the report if they exist.
     Of course calculation of scores will not involve outliers.
+    Each group of duplicate traces collapsed before clustering is listed
+    under its representative if `duplicates` is given. Scores count every
+    trace, duplicates included. The medoid and the most central traces of
+    each cluster are listed if `central` is given.
     """
     groups = {}
 
@@ -226,7 +802,8 @@ def MakeFullReport(trace_lst :typing.List[str], result_lst :typing.List[str], tr
             else:
                 groups[result_lst[i]].append(trace_lst[i])
         # make report dict
-        return {"Result":groups, "Score":MakeScoresReport(result_lst, truth_lst)}
+        return _AttachRepresentatives(
+            _AttachDuplicates({"Result":groups, "Score":MakeScoresReport(result_lst, truth_lst)}, duplicates), central)
     
     else:
         # get the groups with special treatment for outliers
@@ -248,7 +825,8 @@ def MakeFullReport(trace_lst :typing.List[str], result_lst :typing.List[str], tr
                 else:
                     groups[res].append(trace_lst[i])
         # make report dict
-        return {"Result":groups, "Outlier":odict, "Score":MakeScoresReport(rlist, tlist)}
+        return _AttachRepresentatives(
+            _AttachDuplicates({"Result":groups, "Outlier":odict, "Score":MakeScoresReport(rlist, tlist)}, duplicates), central)
 
 
 if __name__ == "__main__":
@@ -300,6 +878,30 @@ if __name__ == "__main__":
                         required=False
     )
 
+    parser.add_argument("--outlier_space", \
+                        help="""
+                            Samples of outlier detection: 'matrix' for the
+                            rows of the distance matrix (default), 'spectral'
+                            or 'mds' for a spectral or classical MDS embedding
+                            of --outlier_dim dimensions, or 'knn' for the
+                            distances to the --outlier_dim nearest neighbors.
+                        """,
+                        type=str,
+                        choices=["matrix", "spectral", "mds", "knn"],
+                        default="matrix",
+                        required=False
+    )
+
+    parser.add_argument("--outlier_dim", \
+                        help="""
+                            Dimension of the embedding, or number of
+                            neighbors, of --outlier_space. (Default is 32)
+                        """,
+                        type=int,
+                        default=32,
+                        required=False
+    )
+
     parser.add_argument("--cluster_limit", \
                         help="""
                             Maximum number of clusters as a limit.
@@ -310,6 +912,347 @@ if __name__ == "__main__":
                         required=False
     )
 
+    parser.add_argument("--eigengap", \
+                        help="""
+                            Also try the number of clusters at the largest
+                            gap between the Laplacian eigenvalues, if the
+                            silhouette sweep stops before reaching it.
+                        """,
+                        action="store_true",
+                        required=False
+    )
+
+    parser.add_argument("--chunk_size", \
+                        help="""
+                            Stream each trace in chunks of this many
+                            entries so that memory is bounded by graph
+                            size rather than trace length. Value 0 means
+                            loading each trace at once (default).
+                        """,
+                        type=int,
+                        default=0,
+                        required=False
+    )
+
+    parser.add_argument("--cache_dir", \
+                        help="""
+                            Directory of a persistent DCFG cache. The node
+                            and edge hit tables of each trace are saved there,
+                            keyed by trace content, and reused by later runs
+                            instead of re-reading the traces. Inspect or
+                            prune it with DCFGCache.py. No cache by default.
+                        """,
+                        type=str,
+                        default=None,
+                        required=False
+    )
+
+    parser.add_argument("--cache_size", \
+                        help="""
+                            Size cap of the DCFG cache, e.g. 512M or 2G.
+                            Least recently used entries are evicted when
+                            it is exceeded. With --jobs, every worker checks
+                            the cap against its own writes, so the cache may
+                            exceed it up to that many times. (Default is 1G)
+                        """,
+                        type=str,
+                        default="1G",
+                        required=False
+    )
+
+    parser.add_argument("--jobs", \
+                        help="""
+                            Number of processes building DCFGs, and evaluating
+                            the numbers of clusters of the spectral clustering
+                            sweep, in parallel. (Default is 1)
+                        """,
+                        type=int,
+                        default=1,
+                        required=False
+    )
+
+    parser.add_argument("--graph", \
+                        help="""
+                            DCFG representation: 'nx' builds NetworkX
+                            graphs (default), 'csr' keeps compact CSR
+                            arrays and feeds them to the graph kernel
+                            without NetworkX.
+                        """,
+                        type=str,
+                        choices=["nx", "csr"],
+                        default="nx",
+                        required=False
+    )
+
+    parser.add_argument("--method", \
+                        help="""
+                            Clustering algorithm: 'spectral' runs spectral
+                            clustering once per number of clusters (default),
+                            'hierarchical' builds one dendrogram and scores
+                            all its cuts, and keeps it in the report.
+                        """,
+                        type=str,
+                        choices=["spectral", "hierarchical"],
+                        default="spectral",
+                        required=False
+    )
+
+    parser.add_argument("--linkage", \
+                        help="""
+                            Linkage criterion of --method hierarchical.
+                            (Default is average)
+                        """,
+                        type=str,
+                        choices=cluster.LINKAGE_METHODS,
+                        default="average",
+                        required=False
+    )
+
+    parser.add_argument("--kernel", \
+                        help="""
+                            Engine of the WL subtree kernel: 'grakel' uses
+                            GraKeL (default), 'native' computes the same
+                            kernel on NumPy arrays with a sparse feature
+                            matrix.
+                        """,
+                        type=str,
+                        choices=["grakel", "native"],
+                        default="grakel",
+                        required=False
+    )
+
+    parser.add_argument("--save_features", \
+                        help="""
+                            Save the WL feature matrix, label vocabulary and
+                            similarity matrix of this run to this .npz file,
+                            for later runs with --load_features. Needs
+                            --kernel native.
+                        """,
+                        type=str,
+                        default=None,
+                        required=False
+    )
+
+    parser.add_argument("--representatives", \
+                        help="""
+                            Number of most central traces of each cluster
+                            listed in the report, the first one being its
+                            medoid. Value 0 means none. (Default is 3)
+                        """,
+                        type=int,
+                        default=3,
+                        required=False
+    )
+
+    parser.add_argument("--save_model", \
+                        help="""
+                            Save a model of the clusters of this run to this
+                            .npz file, to assign new traces to them later
+                            with ClusterModel.py. Needs --kernel native.
+                        """,
+                        type=str,
+                        default=None,
+                        required=False
+    )
+
+    parser.add_argument("--model_prototypes", \
+                        help="""
+                            Number of most central traces kept per cluster
+                            in the model of --save_model. (Default is 3)
+                        """,
+                        type=int,
+                        default=3,
+                        required=False
+    )
+
+    parser.add_argument("--model_quantile", \
+                        help="""
+                            Quantile of the distances of the members of a
+                            cluster to its prototypes, beyond which a new
+                            trace is a new cluster. (Default is 1.0, the
+                            farthest member)
+                        """,
+                        type=float,
+                        default=1.0,
+                        required=False
+    )
+
+    parser.add_argument("--load_features", \
+                        help="""
+                            Start from WL features saved by --save_features
+                            instead of building DCFGs and the kernel. Traces
+                            not covered by the file are built and added
+                            incrementally, only their similarities being
+                            computed. Needs --kernel native.
+                        """,
+                        type=str,
+                        default=None,
+                        required=False
+    )
+
+    parser.add_argument("--save_matrix", \
+                        help="""
+                            Save the similarity matrix of this run to this
+                            .npz file, for later runs with --load_matrix.
+                        """,
+                        type=str,
+                        default=None,
+                        required=False
+    )
+
+    parser.add_argument("--load_matrix", \
+                        help="""
+                            Start from a similarity matrix saved by
+                            --save_matrix instead of building DCFGs and the
+                            kernel. It must cover all traces; use
+                            --load_features to add new traces.
+                        """,
+                        type=str,
+                        default=None,
+                        required=False
+    )
+
+    parser.add_argument("--dedup", \
+                        help="""
+                            Collapse traces with identical content and
+                            traces with identical DCFGs, cluster only one
+                            representative of each group weighted by group
+                            size, and list the groups in the report.
+                        """,
+                        action="store_true",
+                        required=False
+    )
+
+    parser.add_argument("--window", \
+                        help="""
+                            Build each DCFG from the last this many trace
+                            entries only, i.e. the crash-proximal part of
+                            the trace. The traces are read from the end so
+                            the unused prefix is never parsed. Value 0 means
+                            the whole trace (default).
+                        """,
+                        type=int,
+                        default=0,
+                        required=False
+    )
+
+    parser.add_argument("--window_entry", \
+                        help="""
+                            Hex address of a function entry, e.g. 0x47c308.
+                            Build each DCFG from the last entry into it on
+                            (the whole trace if it is never entered). Can be
+                            combined with --window, the shorter part is used.
+                        """,
+                        type=str,
+                        default=None,
+                        required=False
+    )
+
+    parser.add_argument("--lsh", \
+                        help="""
+                            Number of LSH bands. Bucket the DCFGs by MinHash
+                            signatures of their edge sets and compute the
+                            kernel only for pairs sharing a bucket, giving a
+                            sparse similarity matrix; pairs never compared
+                            count as dissimilar. For very large trace sets.
+                            Needs --kernel native. Value 0 means all pairs
+                            (default).
+                        """,
+                        type=int,
+                        default=0,
+                        required=False
+    )
+
+    parser.add_argument("--lsh_rows", \
+                        help="""
+                            MinHash values per LSH band. More rows give
+                            fewer, more similar candidate pairs.
+                            (Default is 4)
+                        """,
+                        type=int,
+                        default=4,
+                        required=False
+    )
+
+    parser.add_argument("--block_size", \
+                        help="""
+                            Keep the similarity matrix out of core: compute
+                            it in tiles of this many rows into a temporary
+                            memory-mapped file, and convert distances, score
+                            outliers and silhouettes one block of rows at a
+                            time, so memory is bounded by the block size and
+                            not N^2. Needs --kernel native. Value 0 means the
+                            matrix is kept in memory (default).
+                        """,
+                        type=int,
+                        default=0,
+                        required=False
+    )
+
+    parser.add_argument("--memmap_dir", \
+                        help="""
+                            Directory of the temporary memory-mapped matrices
+                            of --block_size. (Default is the system temporary
+                            directory)
+                        """,
+                        type=str,
+                        default=None,
+                        required=False
+    )
+
+    parser.add_argument("--float32", \
+                        help="""
+                            Store the memory-mapped matrices of --block_size
+                            in float32 instead of float64, halving their size.
+                        """,
+                        action="store_true",
+                        required=False
+    )
+
+    parser.add_argument("--silhouette_sample", \
+                        help="""
+                            Estimate the silhouette scores of the clustering
+                            sweep from a sample of this many traces,
+                            stratified by cluster, and print their 95%%
+                            confidence intervals. For large trace sets with
+                            the dense similarity matrix. Value 0 means exact
+                            scores (default).
+                        """,
+                        type=int,
+                        default=0,
+                        required=False
+    )
+
+    parser.add_argument("--knn", \
+                        help="""
+                            Keep only the this many largest similarities of
+                            each trace, as a sparse symmetric k-nearest-
+                            neighbor affinity graph (e.g. 30), and run outlier
+                            detection, spectral clustering and silhouette
+                            scores on it. For trace sets whose dense matrix
+                            does not fit in memory. Needs --kernel native.
+                            Value 0 means the dense matrix (default).
+                        """,
+                        type=int,
+                        default=0,
+                        required=False
+    )
+
+    parser.add_argument("--nystroem", \
+                        help="""
+                            Approximate the kernel from this many landmark
+                            graphs (Nystroem) and run outlier detection and
+                            clustering on the low-rank factor, without an
+                            N x N matrix. For very large trace sets. The
+                            approximation error on a sample of graphs is
+                            written to the report. Needs --kernel native.
+                            Value 0 means the exact kernel (default).
+                        """,
+                        type=int,
+                        default=0,
+                        required=False
+    )
+
     args = parser.parse_args()
 
     root_dir = args.i
@@ -318,6 +1261,115 @@ if __name__ == "__main__":
     if (args.outlier < 0.0 or args.outlier > 1.0):
         raise Exception("Invalid outlier ratio")
 
+    if ("hierarchical" == args.method and (args.nystroem > 0 or args.lsh > 0 or args.knn > 0 or args.block_size > 0)):
+        raise Exception("Hierarchical clustering needs the dense similarity matrix in memory")
+
+    if ("hierarchical" == args.method and (args.eigengap or args.silhouette_sample > 0)):
+        raise Exception("--eigengap and --silhouette_sample are for spectral clustering")
+
+    if (args.outlier_dim < 1):
+        raise Exception("Invalid outlier space dimension")
+
+    if ("matrix" != args.outlier_space and args.nystroem > 0):
+        raise Exception("Outlier detection runs on the rows of the Nystroem factor, use --outlier_space matrix")
+
+    if ("knn" == args.outlier_space and (args.lsh > 0 or args.knn > 0)):
+        raise Exception("Nearest-neighbor distances of --outlier_space need the dense similarity matrix")
+
+    if (args.chunk_size < 0):
+        raise Exception("Invalid chunk size")
+
+    if (args.jobs < 1):
+        raise Exception("Invalid number of jobs")
+
+    if ((args.save_features is not None or args.load_features is not None) and "native" != args.kernel):
+        raise Exception("Saving or loading WL features needs --kernel native")
+
+    if (args.save_model is not None and "native" != args.kernel):
+        raise Exception("Cluster model needs --kernel native")
+
+    if (args.save_model is not None and args.load_matrix is not None):
+        raise Exception("Cluster model needs WL features, not a saved matrix")
+
+    if (args.representatives < 0):
+        raise Exception("Invalid number of representatives")
+
+    if (args.model_prototypes < 1):
+        raise Exception("Invalid number of prototypes")
+
+    if (args.model_quantile < 0.0 or args.model_quantile > 1.0):
+        raise Exception("Invalid model quantile")
+
+    if (args.load_features is not None and args.load_matrix is not None):
+        raise Exception("Load either features or a matrix")
+
+    if (args.save_features is not None and args.load_matrix is not None):
+        raise Exception("No WL features to save when starting from a saved matrix")
+
+    if (args.nystroem < 0):
+        raise Exception("Invalid number of landmarks")
+
+    if (args.nystroem > 0 and "native" != args.kernel):
+        raise Exception("Nystroem approximation needs --kernel native")
+
+    if (args.nystroem > 0 and (args.save_matrix is not None or args.load_matrix is not None)):
+        raise Exception("No similarity matrix to save or load with Nystroem approximation")
+
+    if (args.lsh < 0 or args.lsh_rows < 1):
+        raise Exception("Invalid LSH bands")
+
+    if (args.lsh > 0 and "native" != args.kernel):
+        raise Exception("LSH candidate pairs need --kernel native")
+
+    if (args.lsh > 0 and args.nystroem > 0):
+        raise Exception("Use either LSH or Nystroem approximation")
+
+    if (args.lsh > 0 and (args.save_matrix is not None or args.load_matrix is not None or args.load_features is not None)):
+        raise Exception("LSH candidate pairs need DCFGs and give no dense matrix to save")
+
+    if (args.block_size < 0):
+        raise Exception("Invalid block size")
+
+    if (args.block_size > 0 and "native" != args.kernel):
+        raise Exception("Out-of-core similarity matrix needs --kernel native")
+
+    if (args.block_size > 0 and (args.nystroem > 0 or args.lsh > 0)):
+        raise Exception("Use only one of out-of-core matrix, LSH and Nystroem approximation")
+
+    if (args.knn < 0):
+        raise Exception("Invalid number of neighbors")
+
+    if (args.knn > 0 and "native" != args.kernel):
+        raise Exception("k-nearest-neighbor graph needs --kernel native")
+
+    if (args.knn > 0 and (args.block_size > 0 or args.nystroem > 0 or args.lsh > 0)):
+        raise Exception("Use only one of k-nearest-neighbor graph, out-of-core matrix, LSH and Nystroem approximation")
+
+    if (args.knn > 0 and (args.save_matrix is not None or args.load_matrix is not None)):
+        raise Exception("No dense similarity matrix to save or load with k-nearest-neighbor graph")
+
+    if (args.silhouette_sample < 0 or 1 == args.silhouette_sample):
+        raise Exception("Invalid silhouette sample size")
+
+    if (args.silhouette_sample > 0 and (args.block_size > 0 or args.nystroem > 0 or args.lsh > 0 or args.knn > 0)):
+        raise Exception("Sampled silhouette scores need the dense similarity matrix")
+
+    if (args.window < 0):
+        raise Exception("Invalid window size")
+
+    if (args.window_entry is None):
+        window_entry = None
+    else:
+        try:
+            window_entry = int(args.window_entry, 16)
+        except ValueError:
+            raise Exception("Invalid window entry address")
+
+    if (args.cache_dir is None):
+        dcfg_cache = None
+    else:
+        dcfg_cache = DCFGCache.DCFGCache(args.cache_dir, DCFGCache.parse_size(args.cache_size))
+
     # Get trace file
     T_file = []
     for root, dirs, files in os.walk(root_dir, followlinks=True):
@@ -337,21 +1389,54 @@ if __name__ == "__main__":
         logging.info("Benchmark has been built.")
 
     # Get the results
-    T_result = MakeCluster(
+    T_maker = MakeCluster(
         T_file,
-        DCFG.DCFG_NX,
-        GKA.GKA_GraKeL,
-        cluster.ClusterWrapper_spectral,
+        DCFG.DCFG_CSR if "csr" == args.graph else DCFG.DCFG_NX,
+        GKA.GKA_SparseWL if "native" == args.kernel else GKA.GKA_GraKeL,
+        cluster.ClusterWrapper_hierarchical if "hierarchical" == args.method else cluster.ClusterWrapper_spectral,
         outlier_ratio = args.outlier,
-        max_cluster   = args.cluster_limit
-    ).launcher()
+        max_cluster   = args.cluster_limit,
+        chunk_size    = args.chunk_size if args.chunk_size > 0 else None,
+        cache         = dcfg_cache,
+        jobs          = args.jobs,
+        dedup         = args.dedup,
+        window        = args.window if args.window > 0 else None,
+        window_entry  = window_entry,
+        load_features = args.load_features,
+        load_matrix   = args.load_matrix,
+        save_features = args.save_features,
+        save_matrix   = args.save_matrix,
+        nystroem      = args.nystroem if args.nystroem > 0 else None,
+        lsh_bands     = args.lsh if args.lsh > 0 else None,
+        lsh_band_size = args.lsh_rows,
+        block_size    = args.block_size if args.block_size > 0 else None,
+        memmap_dir    = args.memmap_dir,
+        memmap_dtype  = numpy.float32 if args.float32 else numpy.float64,
+        knn           = args.knn if args.knn > 0 else None,
+        eigengap      = args.eigengap,
+        silhouette_sample = args.silhouette_sample if args.silhouette_sample > 0 else None,
+        outlier_space = args.outlier_space,
+        outlier_dim   = args.outlier_dim,
+        linkage       = args.linkage,
+        representatives = args.representatives
+    )
+    T_result = T_maker.launcher()
+
+    if dcfg_cache is not None:
+        logging.info("DCFG cache: {} hits, {} misses".format(dcfg_cache.hits, dcfg_cache.misses))
 
     # Get the report
     logging.info("Generating report")
     if in_benchmark:
-        T_report = MakeFullReport(T_file, T_result, T_mark)
+        T_report = MakeFullReport(T_file, T_result, T_mark, T_maker.duplicates, T_maker.central)
     else:
-        T_report = MakeBaseReport(T_file, T_result)
+        T_report = MakeBaseReport(T_file, T_result, T_maker.duplicates, T_maker.central)
+    if T_maker.nystroem_quality is not None:
+        T_report["Nystroem"] = T_maker.nystroem_quality
+    if T_maker.lsh_stat is not None:
+        T_report["LSH"] = T_maker.lsh_stat
+    if T_maker.dendrogram is not None:
+        T_report["Dendrogram"] = T_maker.dendrogram
 
     # Make a brief report
     logging.info("Report preview:")
@@ -367,4 +1452,8 @@ if __name__ == "__main__":
     with open(report_path, mode="w") as f:
         f.write(json.dumps(T_report, sort_keys=True, indent=4, separators=(',', ': ')))
 
+    if args.save_model is not None:
+        logging.info("Saving cluster model: {}".format(args.save_model))
+        T_maker.make_model(args.model_prototypes, args.model_quantile).save(args.save_model)
+
     logging.info("All jobs have been done")
\ No newline at end of file
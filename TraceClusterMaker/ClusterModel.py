@@ -0,0 +1,180 @@
+import argparse
+import json
+import logging
+import typing
+import numpy
+
+import DCFG
+import DCFGCache
+import GKA
+
+# Verdict of `ClusterModel.assign` for a trace near no cluster
+NEW_CLUSTER = "new"
+
+
+class ClusterModel:
+    """ Persisted model of a clustering, to assign newly arriving traces to its clusters
+
+    Each cluster is represented by its most central members (prototypes,
+    the first one is its medoid) as WL feature vectors in a
+    `GKA.GKA_SparseWL` that holds the label vocabulary of the whole
+    clustering run. A new trace only costs its own DCFG and its kernel
+    values against the prototypes.
+
+    The distance of a trace to a cluster is 1 minus its largest kernel
+    value with a prototype of the cluster. A trace is assigned to the
+    nearest cluster if the distance is within the threshold of that
+    cluster, which is derived from the distances of its own members, and is
+    `NEW_CLUSTER` otherwise.
+
+    Saved as one `.npz` file:
+
+        (see `GKA.GKA_SparseWL.export_features`)
+                       feature vectors of the prototypes and the vocabulary
+        proto_cluster  index into `clusters` of each prototype
+        proto_trace    trace path of each prototype
+        clusters       Cluster-ID string of each cluster
+        threshold      distance threshold of each cluster
+        options        JSON of the options the DCFGs were built with
+    """
+    def __init__(
+        self,
+        tables        :typing.Dict[str, numpy.ndarray],
+        clusters      :typing.List[str],
+        proto_cluster :numpy.ndarray,
+        proto_trace   :typing.List[str],
+        threshold     :numpy.ndarray,
+        options       :dict,
+        chunk_size    :typing.Optional[int] =None,
+        cache         :typing.Optional[DCFGCache.DCFGCache] =None
+    ) -> None :
+        """ Constructor
+
+        :param tables: features of the prototypes, from `GKA.GKA_SparseWL.export_features`
+                       with the `DCFG.AddressTable` of their run
+        :param clusters: Cluster-ID string of each cluster
+        :param proto_cluster: index into `clusters` of each prototype
+        :param proto_trace: trace path of each prototype
+        :param threshold: distance threshold of each cluster
+        :param options: options of the DCFGs, "graph" (class name in `DCFG`),
+                        "window" and "window_entry" (see `DCFG.DCFG`)
+        :param chunk_size: see `DCFG.DCFG`, to build the DCFGs of new traces
+        :param cache: see `DCFG.DCFG`, to build the DCFGs of new traces
+        """
+        self.clusters = list(clusters)
+        self.proto_cluster = numpy.asarray(proto_cluster, dtype=numpy.int64)
+        self.proto_trace = list(proto_trace)
+        self.threshold = numpy.asarray(threshold, dtype=numpy.float64)
+        self.options = dict(options)
+        self.chunk_size = chunk_size
+        self.cache = cache
+
+        # New traces are labeled with this table, so their labels line up with the prototypes'.
+        # It is frozen, so that their unseen addresses do not pile up in it.
+        self.addr_table = DCFG.AddressTable()
+        self.kernel = GKA.GKA_SparseWL(int(tables["n_iter"]))
+        self.kernel.import_features(tables, self.addr_table)
+        self.addr_table.frozen = True
+        self._tables = tables
+
+    def save(self, path :str) -> None :
+        """ Save the model to a `.npz` file
+        """
+        numpy.savez(
+            path,
+            proto_cluster = self.proto_cluster,
+            proto_trace   = numpy.array(self.proto_trace, dtype=str),
+            clusters      = numpy.array(self.clusters, dtype=str),
+            threshold     = self.threshold,
+            options       = numpy.array(json.dumps(self.options, sort_keys=True)),
+            **self._tables)
+
+    @classmethod
+    def load(
+        cls,
+        path       :str,
+        chunk_size :typing.Optional[int] =None,
+        cache      :typing.Optional[DCFGCache.DCFGCache] =None
+    ) -> "ClusterModel" :
+        """ Load a model saved by `save`
+        """
+        with numpy.load(path, allow_pickle=False) as npz:
+            tables = {k: npz[k] for k in npz.files}
+        return cls(
+            tables,
+            clusters      = tables.pop("clusters").tolist(),
+            proto_cluster = tables.pop("proto_cluster"),
+            proto_trace   = tables.pop("proto_trace").tolist(),
+            threshold     = tables.pop("threshold"),
+            options       = json.loads(str(tables.pop("options"))),
+            chunk_size    = chunk_size,
+            cache         = cache)
+
+    def build_dcfg(self, trace :str) -> typing.Any :
+        """ DCFG data of a trace, built the same way as the prototypes'
+        """
+        o = getattr(DCFG, self.options["graph"])(
+            trace, chunk_size=self.chunk_size, cache=self.cache, addr_table=self.addr_table,
+            window=self.options.get("window"), entry_addr=self.options.get("window_entry"))
+        o.construct_dcfg()
+        return o.return_dcfg()
+
+    def nearest(self, graphs :list) -> typing.Tuple[numpy.ndarray, numpy.ndarray] :
+        """ Nearest cluster of some DCFGs
+
+        :return: (index into `clusters`, distance) of each DCFG
+        """
+        similarity = self.kernel.kernel_to(graphs)
+        best = numpy.full((len(graphs), len(self.clusters)), -numpy.inf)
+        for c in range(len(self.clusters)):
+            best[:, c] = similarity[:, self.proto_cluster == c].max(axis=1)
+        index = best.argmax(axis=1)
+        return index, numpy.maximum(1 - best[numpy.arange(len(graphs)), index], 0)
+
+    def verdict(self, graphs :list) -> typing.List[typing.Tuple[str, str, float]] :
+        """ Verdict on DCFGs built by `build_dcfg`
+
+        :return: (Cluster-ID string of the cluster or `NEW_CLUSTER`,
+                  Cluster-ID string of the nearest cluster, distance to it) of each DCFG
+        """
+        index, distance = self.nearest(graphs)
+        return [(self.clusters[c] if d <= self.threshold[c] else NEW_CLUSTER, self.clusters[c], d)
+                for c, d in zip(index.tolist(), distance.tolist())]
+
+    def assign(self, trace :str) -> str :
+        """ Cluster-ID string of the cluster a trace belongs to, or `NEW_CLUSTER`
+        """
+        return self.assign_graphs([self.build_dcfg(trace)])[0]
+
+    def assign_graphs(self, graphs :list) -> typing.List[str] :
+        """ `assign` for DCFGs built by `build_dcfg`
+        """
+        return [cluster for cluster, _, _ in self.verdict(graphs)]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level = logging.INFO,
+        format = '%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Assign traces to the clusters of a model saved by ClusterMaker --save_model")
+    parser.add_argument("-m", help="model file", type=str, required=True)
+    parser.add_argument("traces", help="trace files", type=str, nargs="+")
+    parser.add_argument("--chunk_size", help="number of trace entries per chunk to stream each trace", type=int, default=0)
+    args = parser.parse_args()
+
+    if (args.chunk_size < 0):
+        raise Exception("Invalid chunk size")
+
+    M = ClusterModel.load(args.m, chunk_size=args.chunk_size if args.chunk_size > 0 else None)
+    logging.info("Loaded {} clusters, {} prototypes".format(len(M.clusters), len(M.proto_trace)))
+    result = {}
+    for T in args.traces:
+        cluster, nearest, distance = M.verdict([M.build_dcfg(T)])[0]
+        result[T] = {
+            "Cluster" : cluster,
+            "Nearest" : nearest,
+            "Distance": distance
+        }
+    print(json.dumps(result, sort_keys=True, indent=4, separators=(',', ': ')))
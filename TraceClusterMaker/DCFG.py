@@ -1,19 +1,156 @@
+import hashlib
 import os
 import typing
 import networkx
+import numpy
+import DCFGCache
+import TraceIO
+
+
+class AddressTable:
+    """ Run-wide interning table of trace addresses
+
+    Maps each distinct 64-bit address to a dense int32 id, in order of first
+    appearance, so every graph of a clustering run can label its nodes with
+    small ids instead of storing the addresses again. `lookup` is the reverse
+    map for output.
+
+    A frozen table assigns no new ids: unseen addresses get ids from
+    `len(self)` on that are only valid within one `intern` call, e.g. for a
+    graph that is compared against the interned ones but never kept.
+    """
+    def __init__(self) -> None :
+        #Key: address [int]
+        #Val: id [int]
+        self._index = {}
+        self._addrs = []
+        self.frozen = False
+
+    def __len__(self) -> int :
+        return len(self._addrs)
+
+    def intern(self, addrs :numpy.ndarray) -> numpy.ndarray :
+        """ Addresses => ids, assigning new ids to unseen addresses (for this call only if frozen)
+        """
+        index = self._index
+        unseen = {}
+        ids = numpy.empty(len(addrs), dtype=numpy.int32)
+        for i, a in enumerate(numpy.asarray(addrs).tolist()):
+            x = index.get(a)
+            if x is None and self.frozen:
+                x = unseen.setdefault(a, len(self._addrs) + len(unseen))
+            elif x is None:
+                x = index[a] = len(self._addrs)
+                self._addrs.append(a)
+            ids[i] = x
+        return ids
+
+    def lookup(self, ids :numpy.ndarray) -> numpy.ndarray :
+        """ Ids => addresses
+        """
+        return numpy.array(self._addrs, dtype=numpy.uint64)[numpy.asarray(ids, dtype=numpy.int64)]
+
+
+class CSRGraph(typing.NamedTuple):
+    """ DCFG stored as CSR (Compressed Sparse Row) arrays
+
+    Node ids are dense int32 indexes. The out-edges of node `u` are
+    `indices[indptr[u]:indptr[u+1]]` with hit counts `edge_hit[indptr[u]:indptr[u+1]]`.
+    """
+    node_label :numpy.ndarray # address [uint64] or interned id [int32] of each node
+    node_hit   :numpy.ndarray # hit count of each node [int64]
+    indptr     :numpy.ndarray # row pointers, length |V|+1 [int32]
+    indices    :numpy.ndarray # destination node id of each edge [int32]
+    edge_hit   :numpy.ndarray # hit count of each edge [int64]
+
+    @classmethod
+    def from_edges(
+        cls,
+        node_label :numpy.ndarray,
+        node_hit   :numpy.ndarray,
+        edge_src   :numpy.ndarray,
+        edge_dst   :numpy.ndarray,
+        edge_hit   :numpy.ndarray
+    ) -> "CSRGraph" :
+        """ Build from edge list arrays, e.g. those of `DCFG.get_hit_arrays`
+        """
+        card_V = len(node_label)
+        order = numpy.argsort(edge_src, kind="stable")
+        indptr = numpy.zeros(card_V + 1, dtype=numpy.int32)
+        numpy.cumsum(numpy.bincount(edge_src, minlength=card_V), out=indptr[1:])
+        return cls(
+            node_label,
+            node_hit,
+            indptr,
+            numpy.asarray(edge_dst, dtype=numpy.int32)[order],
+            numpy.asarray(edge_hit, dtype=numpy.int64)[order]
+        )
+
+    def edge_src(self) -> numpy.ndarray :
+        """ Source node id of each edge, i.e. the expanded row pointers
+        """
+        return numpy.repeat(numpy.arange(len(self.node_label), dtype=numpy.int32),
+                            numpy.diff(self.indptr))
+
+    def to_grakel(self) -> list :
+        """ Input of GraKeL kernels: [edge dict, node labels, edge labels]
+
+        The same structure `grakel.graph_from_networkx` produces from a `DCFG_NX`
+        graph (node label `addr`, edge label `hit`, edge weight 1.0), built
+        straight from the arrays.
+        """
+        label = self.node_label.tolist()
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        hits = self.edge_hit.tolist()
+        graph_object, el = {}, {}
+        for u in range(len(label)):
+            nbrs = graph_object[u] = {}
+            for k in range(indptr[u], indptr[u+1]):
+                nbrs[indices[k]] = 1.0
+                el[(u, indices[k])] = hits[k]
+        return [graph_object, dict(enumerate(label)), el]
+
 
 class DCFG:
     """ Base class for DCFG (Dynamic Control-Flow Graph)
     """
-    def __init__(self, trace :str) -> None:
+    def __init__(
+        self,
+        trace      :str,
+        chunk_size :typing.Optional[int] =None,
+        cache      :typing.Optional[DCFGCache.DCFGCache] =None,
+        addr_table :typing.Optional[AddressTable] =None,
+        window     :typing.Optional[int] =None,
+        entry_addr :typing.Optional[int] =None
+    ) -> None:
         """ Init from a trace file
 
         :param trace: trace file
+        :param chunk_size: `None` to load the whole trace at once, or the number
+                           of trace entries per chunk to stream the trace with
+                           constant memory (see `traverse_trace_stream`)
+        :param cache: `None`, or a cache from which hit tables are loaded
+                      instead of re-reading the trace, and to which newly
+                      built hit tables are saved
+        :param addr_table: `None` to label nodes with their addresses, or a
+                           run-wide table to label them with interned ids
+        :param window: `None`, or the number of last trace entries to build
+                       the DCFG from
+        :param entry_addr: `None`, or an address (e.g. a function entry) from
+                           whose last occurrence on the DCFG is built
         :return: None
         """
         self._trace_path = os.path.abspath(trace)
         self._trace_name = os.path.basename(self._trace_path)
         self._trace_list = None
+        self._chunk_size = chunk_size
+        self._cache = cache
+        self._addr_table = addr_table
+        self._window = window
+        self._entry_addr = entry_addr
+        # Set once the hit tables are built or imported
+        self._traversed = False
 
         self._node_head = None
         self._node_tail = None
@@ -50,25 +187,248 @@ class DCFG:
         else:
             d[x] = 1  
 
+    @staticmethod
+    def count_hit_arrays(addrs :numpy.ndarray) -> typing.Tuple[numpy.ndarray, ...] :
+        """ Count node and edge hits of an address array with NumPy
+
+        Node hits come from `numpy.unique` over the addresses. Each entry is
+        then replaced by a dense node id, so a directed edge (prev, next) can be
+        packed into a single int64 key `prev_id * |V| + next_id` and counted
+        with `numpy.unique` as well.
+
+        Nodes and edges are ordered by their first appearance in the trace,
+        i.e. the same order in which `traverse_trace_file` inserts them into
+        `_node_hit`/`_edge_hit`.
+
+        :return: (node_addr, node_hit, edge_src, edge_dst, edge_hit) where
+                 `edge_src`/`edge_dst` are indexes into `node_addr`
+        """
+        addrs = numpy.asarray(addrs)
+        nodes, first, inverse, counts = \
+            numpy.unique(addrs, return_index=True, return_inverse=True, return_counts=True)
+        order = numpy.argsort(first, kind="stable")
+        rank = numpy.empty_like(order)
+        rank[order] = numpy.arange(len(order))
+        ids = rank[inverse.reshape(-1)].astype(numpy.int64)
+
+        card_V = len(nodes)
+        keys = ids[:-1] * card_V + ids[1:]
+        edges, efirst, ecounts = numpy.unique(keys, return_index=True, return_counts=True)
+        eorder = numpy.argsort(efirst, kind="stable")
+        edges = edges[eorder]
+
+        return (nodes[order], counts[order],
+                edges // card_V, edges % card_V, ecounts[eorder])
+
+    def set_hit_tables(
+        self,
+        node_addr :numpy.ndarray,
+        node_hit  :numpy.ndarray,
+        edge_src  :numpy.ndarray,
+        edge_dst  :numpy.ndarray,
+        edge_hit  :numpy.ndarray
+    ) -> None :
+        """ Fill `_node_hit`/`_edge_hit` from the arrays of `count_hit_arrays`
+        """
+        addr = node_addr.tolist()
+        self._node_hit = dict(zip(addr, node_hit.tolist()))
+        self._edge_hit = dict(zip(
+            [(addr[s], addr[d]) for s, d in zip(edge_src.tolist(), edge_dst.tolist())],
+            edge_hit.tolist()))
+
+    def get_hit_arrays(self) -> typing.Tuple[numpy.ndarray, ...] :
+        """ Inverse of `set_hit_tables`: `_node_hit`/`_edge_hit` => compact arrays
+
+        :return: (node_addr, node_hit, edge_src, edge_dst, edge_hit), see `count_hit_arrays`
+        """
+        addr = list(self._node_hit)
+        index = {a: i for i, a in enumerate(addr)}
+        return (
+            numpy.array(addr, dtype=numpy.uint64),
+            numpy.array(list(self._node_hit.values()), dtype=numpy.int64),
+            numpy.array([index[e[0]] for e in self._edge_hit], dtype=numpy.int32),
+            numpy.array([index[e[1]] for e in self._edge_hit], dtype=numpy.int32),
+            numpy.array(list(self._edge_hit.values()), dtype=numpy.int64)
+        )
+
+    def export_hit_tables(self) -> typing.Dict[str, numpy.ndarray] :
+        """ Export the hit tables as a dict of compact NumPy arrays
+
+        Used to store the tables in `DCFGCache` and to send them between
+        processes without pickling graph objects:
+
+            node_addr  uint64  address of each node
+            node_hit   int64   hit count of each node
+            edge_src   int32   index into `node_addr` of each edge source
+            edge_dst   int32   index into `node_addr` of each edge destination
+            edge_hit   int64   hit count of each edge
+            head_tail  uint64  first and last address of the trace
+        """
+        node_addr, node_hit, edge_src, edge_dst, edge_hit = self.get_hit_arrays()
+        return {
+            "node_addr": node_addr,
+            "node_hit" : node_hit,
+            "edge_src" : edge_src,
+            "edge_dst" : edge_dst,
+            "edge_hit" : edge_hit,
+            "head_tail": numpy.array([self._node_head, self._node_tail], dtype=numpy.uint64)
+        }
+
+    def import_hit_tables(self, tables :typing.Dict[str, numpy.ndarray]) -> None :
+        """ Inverse of `export_hit_tables`
+
+        `traverse_trace` does nothing afterwards, so `construct_dcfg` builds
+        the graph directly from the imported tables.
+        """
+        self._node_head, self._node_tail = tables["head_tail"].tolist()
+        self.set_hit_tables(tables["node_addr"], tables["node_hit"],
+                            tables["edge_src"], tables["edge_dst"], tables["edge_hit"])
+        self._traversed = True
+
+    def node_labels(self, node_addr :numpy.ndarray) -> numpy.ndarray :
+        """ Node addresses => node labels
+
+        Interned ids if an `AddressTable` was given to the constructor, the
+        addresses themselves otherwise.
+        """
+        if self._addr_table is None:
+            return node_addr
+        return self._addr_table.intern(node_addr)
+
+    def parse_options(self) -> dict :
+        """ Options that change the hit tables built from a trace
+
+        Part of the cache key. `chunk_size` is not included since every
+        engine builds the same tables.
+        """
+        options = {}
+        if self._window is not None:
+            options["window"] = self._window
+        if self._entry_addr is not None:
+            options["entry_addr"] = self._entry_addr
+        return options
+
+    def is_windowed(self) -> bool :
+        """ Whether only the crash-proximal end of the trace is used
+        """
+        return self._window is not None or self._entry_addr is not None
+
+    def load_trace_array(self) -> numpy.ndarray :
+        """ Load the trace (or its window) as a uint64 address array
+
+        A packed trace (see `TraceIO.py`) is memory-mapped without copying,
+        while a hex text trace is parsed into a new array. In window mode
+        only the tail is read, from the end of the file.
+        """
+        if self.is_windowed():
+            return TraceIO.load_trace_tail(self._trace_path, self._window, self._entry_addr)
+        return TraceIO.load_trace(self._trace_path)
+
     def traverse_trace_file(self) -> None :
         """ Extract DCFG data from a trace record file
         """
-        with open(self._trace_path, mode="rb") as f:
-            self._trace_list = f.readlines()
-        
-        self._node_head = self.trace_line_interpreter(self._trace_list[0])
-        self._node_tail = self.trace_line_interpreter(self._trace_list[-1])
+        if TraceIO.is_packed_trace(self._trace_path):
+            self._trace_list = self.load_trace_array()
+            interpreter = int
+        else:
+            with TraceIO.open_trace(self._trace_path) as f:
+                self._trace_list = f.readlines()
+            interpreter = self.trace_line_interpreter
+
+        self._node_head = interpreter(self._trace_list[0])
+        self._node_tail = interpreter(self._trace_list[-1])
 
         lastN = self._node_head
         self.set_hit_count(self._node_hit, lastN)
 
         for i in range(1, len(self._trace_list)):
-            thisN = self.trace_line_interpreter(self._trace_list[i])
+            thisN = interpreter(self._trace_list[i])
             #Current directed edge: (lastN, thisN)
             self.set_hit_count(self._edge_hit, (lastN,thisN))
             lastN = thisN
             self.set_hit_count(self._node_hit, lastN)
 
+    def traverse_trace_array(self) -> None :
+        """ Extract DCFG data from a trace record file with NumPy
+
+        Produces the same `_node_hit`/`_edge_hit` content as `traverse_trace_file`,
+        but counts hits with `count_hit_arrays` instead of one dict update per line.
+        """
+        self._trace_list = self.load_trace_array()
+
+        self._node_head = int(self._trace_list[0])
+        self._node_tail = int(self._trace_list[-1])
+
+        self.set_hit_tables(*self.count_hit_arrays(self._trace_list))
+
+    def traverse_trace_stream(self, chunk_size :int) -> None :
+        """ Extract DCFG data from a trace record file chunk by chunk
+
+        Memory is bounded by `chunk_size` plus the size of the hit tables rather
+        than by the trace length. The last address of each chunk is carried into
+        the next one so the edge across the chunk boundary is counted; its node
+        hit is subtracted again since it was already counted in the previous chunk.
+        The raw trace is never kept, i.e. `_trace_list` stays `None`.
+        """
+        self._trace_list = None
+        self._node_hit = {}
+        self._edge_hit = {}
+
+        lastN = None
+        for chunk in TraceIO.iter_trace_chunks(self._trace_path, chunk_size):
+            if lastN is None:
+                self._node_head = int(chunk[0])
+                addrs = chunk
+            else:
+                addrs = numpy.concatenate((numpy.array([lastN], dtype=chunk.dtype), chunk))
+            lastN = int(chunk[-1])
+
+            node_addr, node_hit, edge_src, edge_dst, edge_hit = self.count_hit_arrays(addrs)
+            if len(addrs) != len(chunk):
+                # the carried address is always the first node of this chunk
+                node_hit[0] -= 1
+
+            addr = node_addr.tolist()
+            for a, c in zip(addr, node_hit.tolist()):
+                self._node_hit[a] = self._node_hit.get(a, 0) + c
+            for s, d, c in zip(edge_src.tolist(), edge_dst.tolist(), edge_hit.tolist()):
+                e = (addr[s], addr[d])
+                self._edge_hit[e] = self._edge_hit.get(e, 0) + c
+
+        if lastN is None:
+            raise IndexError("Empty trace: {}".format(self._trace_path))
+        self._node_tail = lastN
+
+    def traverse_trace(self) -> None :
+        """ Extract DCFG data with the whole-trace or the streaming engine
+
+        Chosen by `chunk_size` given to the constructor. In window mode the
+        whole-trace engine always runs on the window, which is bounded by
+        `window` or ends at the crash anyway. With a cache, the
+        hit tables are loaded from it when the trace content and parse
+        options are unchanged, and saved to it otherwise. Nothing is done
+        if the tables are already built or imported.
+        """
+        if self._traversed:
+            return
+
+        if self._cache is not None:
+            key = self._cache.make_key(
+                self._cache.hash_file(self._trace_path), self.parse_options())
+            tables = self._cache.get(key)
+            if tables is not None:
+                self.import_hit_tables(tables)
+                return
+
+        if self._chunk_size is None or self.is_windowed():
+            self.traverse_trace_array()
+        else:
+            self.traverse_trace_stream(self._chunk_size)
+        self._traversed = True
+
+        if self._cache is not None:
+            self._cache.put(key, self.export_hit_tables())
+
     def is_dense(self) -> typing.Optional[bool] :
         """ Determining whether the DCFG (i.e. `self.DCFG_RAW`) is sparse or dense
 
@@ -98,16 +458,20 @@ class DCFG_NX(DCFG):
         """ Construct DCFG with 2 attributes for node and 1 for edge
 
         One raw value of the attributes for node is used as unique 
-        identifier for node in NetworX, too.
+        identifier for node in NetworX, too. The value is the address,
+        or its interned id when an `AddressTable` is used.
         """
-        self.traverse_trace_file()
+        self.traverse_trace()
         self.DCFG_RAW = networkx.DiGraph()
 
+        addrs = list(self._node_hit)
+        label = dict(zip(addrs, self.node_labels(numpy.array(addrs, dtype=numpy.uint64)).tolist()))
+
         for vtx in self._node_hit:
-            self.DCFG_RAW.add_node(vtx, addr=vtx, hit=self._node_hit[vtx])
+            self.DCFG_RAW.add_node(label[vtx], addr=label[vtx], hit=self._node_hit[vtx])
 
         for edg in self._edge_hit:
-            self.DCFG_RAW.add_edge(edg[0], edg[1], hit=self._edge_hit[edg])
+            self.DCFG_RAW.add_edge(label[edg[0]], label[edg[1]], hit=self._edge_hit[edg])
 
     def return_dcfg(self) -> networkx.DiGraph :
         """ Provide DCFG for outside request.
@@ -115,5 +479,52 @@ class DCFG_NX(DCFG):
         return self.DCFG_RAW
 
 
+class DCFG_CSR(DCFG):
+    """ DCFG by CSR arrays (see `CSRGraph`)
+
+    Far more compact than `DCFG_NX` since no per-node or per-edge Python
+    objects are kept, and it is fed to the graph kernel without NetworkX.
+    """
+    def construct_dcfg(self) -> None :
+        """ Construct DCFG with the same node and edge attributes as `DCFG_NX`
+        """
+        self.traverse_trace()
+        node_addr, node_hit, edge_src, edge_dst, edge_hit = self.get_hit_arrays()
+        self.DCFG_RAW = CSRGraph.from_edges(
+            self.node_labels(node_addr), node_hit, edge_src, edge_dst, edge_hit)
+
+    def return_dcfg(self) -> CSRGraph :
+        """ Provide DCFG for outside request.
+        """
+        return self.DCFG_RAW
+
+
+def dcfg_signature(g :typing.Union[networkx.DiGraph, CSRGraph]) -> str :
+    """ Canonical SHA-256 signature of a DCFG built by `DCFG_NX` or `DCFG_CSR`
+
+    Two DCFGs get the same signature iff they have the same labelled nodes
+    with the same hit counts and the same edges with the same hit counts,
+    whatever the order in which they were added, so identical graphs can
+    be collapsed before kernel computation.
+    """
+    if isinstance(g, CSRGraph):
+        label = numpy.asarray(g.node_label, dtype=numpy.uint64)
+        nodes = numpy.stack([label, g.node_hit.astype(numpy.uint64)], axis=1)
+        edges = numpy.stack([label[g.edge_src()], label[g.indices],
+                             g.edge_hit.astype(numpy.uint64)], axis=1)
+    else:
+        nodes = numpy.array([(g.nodes[n]["addr"], g.nodes[n]["hit"]) for n in g.nodes],
+                            dtype=numpy.uint64).reshape(-1, 2)
+        edges = numpy.array([(g.nodes[u]["addr"], g.nodes[v]["addr"], h) for u, v, h in g.edges(data="hit")],
+                            dtype=numpy.uint64).reshape(-1, 3)
+    nodes = nodes[numpy.lexsort(nodes.T[::-1])]
+    edges = edges[numpy.lexsort(edges.T[::-1])]
+    h = hashlib.sha256()
+    h.update(numpy.array([len(nodes), len(edges)], dtype=numpy.uint64).tobytes())
+    h.update(numpy.ascontiguousarray(nodes).tobytes())
+    h.update(numpy.ascontiguousarray(edges).tobytes())
+    return h.hexdigest()
+
+
 if __name__ == "__main__":
     pass
\ No newline at end of file
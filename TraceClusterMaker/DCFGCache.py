@@ -0,0 +1,225 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import typing
+import zipfile
+import numpy
+
+# Bump when the layout of cached tables or the way they are computed changes,
+# so that stale entries are never loaded.
+CACHE_VERSION = 1
+
+# Block size (bytes) used to hash trace files
+HASH_BLOCK_BYTES = 1 << 20
+
+# Suffix of a cache entry file
+ENTRY_SUFFIX = ".npz"
+
+# Share of the size cap the cache is pruned down to once the cap is exceeded,
+# so that the directory is walked once per many puts rather than on every put
+PRUNE_LOW_WATER = 0.9
+
+
+class DCFGCache:
+    """ Persistent content-addressed cache of DCFG hit tables
+
+    An entry is keyed by the SHA-256 of the trace file content plus the
+    parse options that change the tables (see `DCFG.parse_options`), and
+    holds the node-hit and edge-hit tables as NumPy arrays in one `.npz`
+    file under `<cache_dir>/<key[:2]>/<key>.npz`:
+
+        node_addr  uint64  address of each node
+        node_hit   int64   hit count of each node
+        edge_src   int32   index into `node_addr` of each edge source
+        edge_dst   int32   index into `node_addr` of each edge destination
+        edge_hit   int64   hit count of each edge
+        head_tail  uint64  first and last address of the trace
+
+    The total size of the cache is capped: when it is exceeded, the least
+    recently used entries are evicted down to `PRUNE_LOW_WATER` of the cap.
+    Using an entry refreshes its mtime, which is what recency is based on.
+
+    The total size is tracked per instance, from one walk of the directory
+    at construction plus its own puts, and only pruning walks it again. So
+    with several processes writing at once (e.g. ClusterMaker `--jobs`),
+    each one only sees its own puts, and the cache may grow up to about
+    that many times the cap before one of them prunes.
+    """
+    def __init__(self, cache_dir :str, max_size :typing.Optional[int] =None) -> None :
+        """ Constructor
+
+        :param cache_dir: cache root directory, created if it does not exist
+        :param max_size: size cap in bytes, or `None` for no cap
+        """
+        self._cache_dir = os.path.abspath(cache_dir)
+        self._max_size = max_size
+        os.makedirs(self._cache_dir, exist_ok=True)
+        self._total_size = sum(size for _, size, _ in self._entries())
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def hash_file(path :str) -> str :
+        """ SHA-256 hex digest of a file's content
+        """
+        h = hashlib.sha256()
+        with open(path, mode="rb") as f:
+            while True:
+                block = f.read(HASH_BLOCK_BYTES)
+                if not block:
+                    break
+                h.update(block)
+        return h.hexdigest()
+
+    @staticmethod
+    def make_key(content_hash :str, options :typing.Optional[dict] =None) -> str :
+        """ Combine a trace content hash and parse options into a cache key
+        """
+        h = hashlib.sha256()
+        h.update(content_hash.encode())
+        h.update(json.dumps({"version": CACHE_VERSION, "options": options or {}},
+                            sort_keys=True).encode())
+        return h.hexdigest()
+
+    def _entry_path(self, key :str) -> str :
+        return os.path.join(self._cache_dir, key[:2], key + ENTRY_SUFFIX)
+
+    def _entries(self) -> typing.List[typing.Tuple[str,int,float]] :
+        """ List all entries as (path, size, mtime)
+        """
+        entries = []
+        for root, dirs, files in os.walk(self._cache_dir):
+            for name in files:
+                if not name.endswith(ENTRY_SUFFIX):
+                    continue
+                p = os.path.join(root, name)
+                try:
+                    st = os.stat(p)
+                except FileNotFoundError:
+                    continue
+                entries.append((p, st.st_size, st.st_mtime))
+        return entries
+
+    def get(self, key :str) -> typing.Optional[typing.Dict[str, numpy.ndarray]] :
+        """ Load the tables of an entry, or `None` on a miss
+        """
+        p = self._entry_path(key)
+        try:
+            with numpy.load(p) as npz:
+                tables = {k: npz[k] for k in npz.files}
+        except (OSError, ValueError, zipfile.BadZipFile):
+            self.misses += 1
+            return None
+        try:
+            # refresh recency for LRU eviction
+            os.utime(p)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return tables
+
+    def put(self, key :str, tables :typing.Dict[str, numpy.ndarray]) -> None :
+        """ Store the tables of an entry, then evict down to the low-water mark if over the size cap
+
+        The entry is written to a temporary file and renamed into place, so
+        concurrent readers never see a partial entry.
+        """
+        p = self._entry_path(key)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(p))
+        try:
+            with os.fdopen(fd, mode="wb") as f:
+                numpy.savez(f, **tables)
+            old_size = os.path.getsize(p) if os.path.exists(p) else 0
+            os.replace(tmp, p)
+        except BaseException:
+            # e.g. disk full: `prune` only sees entries, so never leave the temporary file behind
+            try:
+                os.remove(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+        self._total_size += os.path.getsize(p) - old_size
+
+        if self._max_size is not None and self._total_size > self._max_size:
+            self.prune(int(self._max_size * PRUNE_LOW_WATER))
+
+    def prune(self, max_size :int) -> typing.Tuple[int,int] :
+        """ Evict least recently used entries until the cache fits in `max_size` bytes
+
+        :return: (number of evicted entries, number of bytes freed)
+        """
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        evicted = freed = 0
+        for p, size, _ in entries:
+            if total <= max_size:
+                break
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+            freed += size
+        self._total_size = total
+        return evicted, freed
+
+    def stat(self) -> dict :
+        """ Summary of the cache as a dict compatible with JSON
+        """
+        entries = self._entries()
+        mtimes = [m for _, _, m in entries]
+        return {
+            "Directory": self._cache_dir,
+            "Entries"  : len(entries),
+            "Bytes"    : sum(size for _, size, _ in entries),
+            "Oldest"   : min(mtimes) if mtimes else None,
+            "Newest"   : max(mtimes) if mtimes else None
+        }
+
+
+def parse_size(s :str) -> int :
+    """ Size string => bytes
+
+    e.g. "512" => 512, "64K" => 65536, "1.5G" => 1610612736
+    """
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    s = s.strip().upper().rstrip("B")
+    if s and s[-1] in units:
+        return int(float(s[:-1]) * units[s[-1]])
+    return int(s)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level = logging.INFO,
+        format = '%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Inspect or prune the DCFG cache of ClusterMaker")
+    parser.add_argument("-d", help="cache directory", type=str, required=True)
+    parser.add_argument("action", choices=["stat", "prune", "clear"],
+                        help="""
+                            stat: print a summary of the cache;
+                            prune: evict least recently used entries down to --max_size;
+                            clear: remove all entries
+                        """)
+    parser.add_argument("--max_size", help="size cap for 'prune', e.g. 512M or 2G", type=str, default=None)
+    args = parser.parse_args()
+
+    C = DCFGCache(args.d)
+    if "stat" == args.action:
+        print(json.dumps(C.stat(), sort_keys=True, indent=4, separators=(',', ': ')))
+    elif "prune" == args.action:
+        if args.max_size is None:
+            raise Exception("'prune' needs --max_size")
+        evicted, freed = C.prune(parse_size(args.max_size))
+        logging.info("Evicted {} entries, freed {} bytes".format(evicted, freed))
+    else:
+        evicted, freed = C.prune(0)
+        logging.info("Evicted {} entries, freed {} bytes".format(evicted, freed))
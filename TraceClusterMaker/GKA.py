@@ -2,6 +2,8 @@ import typing
 import numpy
 import networkx
 import grakel
+import scipy.sparse
+import DCFG
 
 class GKA:
     """ Base class for GKA (Graph Kernel Algorithm)
@@ -9,23 +11,55 @@ class GKA:
     def __init__(self) -> None :
         self.graph_lst = []
         self.graph_mat = None
+        # Low-rank factor F of an approximate similarity matrix F F^T, if any
+        self.graph_factor = None
     
     def add_dcfg(self, g) -> None :
         """ Add a DCFG to internal graph list (`self.graph_lst`)
+
+        The similarity matrix covers it after the next `apply_<Kernel Name>_Kernel`.
         """
         self.graph_lst.append(g)
 
+    def _index_of(self, g) -> int :
+        """ Index of a DCFG in `self.graph_lst` by identity
+
+        Graphs are not compared by value: `DCFG.CSRGraph` holds arrays.
+        """
+        for i, x in enumerate(self.graph_lst):
+            if x is g:
+                return i
+        raise ValueError("DCFG not in graph list")
+
     def del_dcfg(self, g) -> None :
         """ Remove a DCFG from internal graph list (`self.graph_lst)`
+
+        Its row and column are dropped from the similarity matrix, which
+        stays valid since the kernels are normalized pairwise.
         """
-        if g in self.graph_lst:
-            self.graph_lst.remove(g)
+        i = self._index_of(g)
+        del self.graph_lst[i]
+        if self.graph_mat is not None and i < len(self.graph_mat):
+            self.graph_mat = numpy.delete(numpy.delete(self.graph_mat, i, axis=0), i, axis=1)
 
     def get_matrix(self) -> typing.Optional[numpy.ndarray] :
         """ return the similarity matrix
         """
         return self.graph_mat
 
+    def get_factor(self) -> typing.Optional[numpy.ndarray] :
+        """ return the low-rank factor of the approximate similarity matrix
+        """
+        return self.graph_factor
+
+    def select(self, index :typing.Sequence[int]) -> None :
+        """ Keep (or reorder, or repeat) the DCFGs at `index` only, with their rows and columns of the matrix
+        """
+        index = numpy.asarray(index, dtype=numpy.int64)
+        self.graph_lst = [self.graph_lst[i] for i in index.tolist()]
+        if self.graph_mat is not None:
+            self.graph_mat = self.graph_mat[numpy.ix_(index, index)]
+
 
 class GKA_GraKeL(GKA):
     """ Use graph kernel algorithms from GraKeL
@@ -85,23 +119,36 @@ class GKA_GraKeL(GKA):
         self._isVerbose = isVerbose
         self._setJoblib = setJoblib
     
-    def add_dcfg(self, nxg :networkx.DiGraph) -> None :
-        """ Add a DCFG (DiGraph from NetworkX) to the internal graph list
+    def add_dcfg(self, nxg :typing.Union[networkx.DiGraph, DCFG.CSRGraph]) -> None :
+        """ Add a DCFG (DiGraph from NetworkX or `DCFG.CSRGraph`) to the internal graph list
         """
         self.graph_lst.append(nxg)
     
-    def del_dcfg(self, nxg :networkx.DiGraph) -> None :
-        """ Remove a DCFG (DiGraph from NetworkX) from the internal graph list
+    def del_dcfg(self, nxg :typing.Union[networkx.DiGraph, DCFG.CSRGraph]) -> None :
+        """ Remove a DCFG (DiGraph from NetworkX or `DCFG.CSRGraph`) from the internal graph list
         """
-        self.graph_lst.remove(nxg)
+        super().del_dcfg(nxg)
 
     def _fit_graph_list(self) -> None :
         """ Transform `graph_lst` into a container, i.e., `_graph_container`, suitable for GraKeL
+
+        `DCFG.CSRGraph` items are converted directly from their arrays, without NetworkX.
+        """
+        if not any(isinstance(g, DCFG.CSRGraph) for g in self.graph_lst):
+            self._graph_container = \
+                grakel.graph_from_networkx(self.graph_lst, 
+                                           node_labels_tag = "addr",
+                                           edge_labels_tag = "hit")
+        else:
+            self._graph_container = (self._to_grakel(g) for g in self.graph_lst)
+
+    @staticmethod
+    def _to_grakel(g :typing.Union[networkx.DiGraph, DCFG.CSRGraph]) -> list :
+        """ One DCFG => GraKeL input
         """
-        self._graph_container = \
-            grakel.graph_from_networkx(self.graph_lst, 
-                                       node_labels_tag = "addr",
-                                       edge_labels_tag = "hit")
+        if isinstance(g, DCFG.CSRGraph):
+            return g.to_grakel()
+        return next(grakel.graph_from_networkx([g], node_labels_tag="addr", edge_labels_tag="hit"))
     
     def apply_WL_Subtree_Kernel(self) -> None :
         """ Use Weisfeiler-Lehman Subtree Kernel to calculate the similarity matrix
@@ -146,5 +193,661 @@ class GKA_GraKeL(GKA):
         pass
 
 
+class WLVocabulary:
+    """ Vocabulary of WL labels => feature matrix columns
+
+    A label is a key of `KEY_WIDTH` uint64 values:
+
+        (0, node label, 0, 0, 0)                             iteration 0
+        (h, column of own label at h-1, out-degree,
+            multiset hash 1, multiset hash 2)                iteration h >= 1
+
+    Columns are numbered in the order labels are first seen, and never change.
+    """
+    KEY_WIDTH = 5
+
+    def __init__(self) -> None :
+        # Keys sorted by their raw bytes, and the column of each
+        self.keys = numpy.empty((0, self.KEY_WIDTH), dtype=numpy.uint64)
+        self.cols = numpy.empty(0, dtype=numpy.int64)
+
+    def __len__(self) -> int :
+        return len(self.cols)
+
+    @staticmethod
+    def _void(keys :numpy.ndarray) -> numpy.ndarray :
+        """ Rows of keys => one comparable raw-bytes scalar per row
+        """
+        keys = numpy.ascontiguousarray(keys, dtype=numpy.uint64)
+        return keys.view("V{}".format(keys.shape[1] * keys.itemsize)).reshape(-1)
+
+    def lookup(self, keys :numpy.ndarray, add :bool =True) -> numpy.ndarray :
+        """ Columns of rows of keys
+
+        :param add: add unknown keys as new columns, or map them to -1
+        """
+        keys = numpy.ascontiguousarray(keys, dtype=numpy.uint64)
+        uniq, first, inverse = numpy.unique(self._void(keys), return_index=True, return_inverse=True)
+        known = self._void(self.keys)
+        pos = numpy.searchsorted(known, uniq)
+        found = pos < len(known)
+        found[found] = (known[pos[found]] == uniq[found])
+
+        cols = numpy.full(len(uniq), -1, dtype=numpy.int64)
+        cols[found] = self.cols[pos[found]]
+        if add and not found.all():
+            new = ~found
+            cols[new] = numpy.arange(len(self), len(self) + new.sum())
+            all_keys = numpy.concatenate((self.keys, keys[first[new]]))
+            order = numpy.argsort(self._void(all_keys), kind="stable")
+            self.keys = all_keys[order]
+            self.cols = numpy.concatenate((self.cols, cols[new]))[order]
+        return cols[inverse.reshape(-1)]
+
+
+def _mix64(x :numpy.ndarray) -> numpy.ndarray :
+    """ SplitMix64 finalizer over a uint64 array, wrapping on overflow
+    """
+    z = x + numpy.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> numpy.uint64(30))) * numpy.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> numpy.uint64(27))) * numpy.uint64(0x94D049BB133111EB)
+    return z ^ (z >> numpy.uint64(31))
+
+
+class GKA_SparseWL(GKA):
+    """ Native Weisfeiler-Lehman Subtree Kernel on NumPy arrays
+
+    Computes the same normalized kernel as `GKA_GraKeL.apply_WL_Subtree_Kernel`
+    (`grakel.WeisfeilerLehman` with `VertexHistogram`) without any per-node
+    Python objects:
+
+        iteration 0:  the label of a node is its `addr` label
+        iteration h:  the label of a node is a new id for the pair
+                      (own label at h-1, multiset of the labels of its
+                      successors at h-1)
+
+    Every label of every iteration is one column of a `scipy.sparse` feature
+    matrix (graphs x labels) holding how often it occurs in each graph. The
+    kernel is the sum of the label histogram dot products over all
+    iterations, i.e. one sparse product of the feature matrix with its
+    transpose, normalized by the self-similarities.
+
+    The multiset of successor labels is identified by two independent 64-bit
+    multiset hashes (sums of SplitMix64-mixed labels) and the out-degree, so
+    each relabeling is a handful of vectorized passes over the edge arrays.
+
+    The label vocabulary and the feature vectors are kept, so that graphs
+    added with `add_dcfg` later only cost their own rows and columns of the
+    matrix, and `del_dcfg` drops a row and column without any kernel work.
+    """
+    def __init__(self, n_iter :int =1) -> None :
+        """ Constructor
+
+        :param n_iter: number of WL relabeling iterations, 1 as in `GKA_GraKeL`
+        """
+        super().__init__()
+        assert (n_iter >= 0) , "Number of iterations must be no less than 0"
+        self._n_iter = n_iter
+        self.vocabulary = WLVocabulary()
+        # Rows follow `graph_lst`; only its first `feature_mat.shape[0]` graphs are fitted
+        self.feature_mat = None
+        # Unnormalized self-similarity of each fitted graph
+        self._diag = None
+        # Indexes of the landmark graphs of `apply_WL_Subtree_Kernel_Nystroem`
+        self.landmarks = None
+        # Sparse similarity matrix of `apply_WL_Subtree_Kernel_Pairs`
+        self.graph_sparse = None
+
+    @staticmethod
+    def _graph_arrays(g :typing.Union[networkx.DiGraph, DCFG.CSRGraph]) -> typing.Tuple[numpy.ndarray, ...] :
+        """ One DCFG => (node labels [uint64], edge sources [int64], edge destinations [int64])
+
+        Edges are ordered by source node.
+        """
+        if isinstance(g, DCFG.CSRGraph):
+            return (numpy.asarray(g.node_label, dtype=numpy.uint64),
+                    g.edge_src().astype(numpy.int64),
+                    g.indices.astype(numpy.int64))
+        index = {n: i for i, n in enumerate(g.nodes)}
+        label = numpy.array([g.nodes[n]["addr"] for n in g.nodes], dtype=numpy.uint64)
+        edges = numpy.array([(index[u], index[v]) for u, v in g.edges], dtype=numpy.int64).reshape(-1, 2)
+        order = numpy.argsort(edges[:, 0], kind="stable")
+        return label, edges[order, 0], edges[order, 1]
+
+    def _wl_labels(self, graphs :list, add :bool =True) -> typing.Tuple[numpy.ndarray, typing.List[numpy.ndarray], int] :
+        """ WL labels of all nodes of all graphs in every iteration
+
+        Labels are looked up in `self.vocabulary`, and labels never seen
+        before are added to it, so the columns of graphs from different
+        calls line up. Without `add`, the vocabulary is left as is and
+        labels never seen before get columns from `len(self.vocabulary)` on
+        that are only valid within this call.
+
+        :return: (graph index of each node,
+                  column index of each node's label for each iteration,
+                  number of columns)
+        """
+        n_col = len(self.vocabulary)
+
+        def lookup(keys :numpy.ndarray) -> numpy.ndarray :
+            nonlocal n_col
+            ids = self.vocabulary.lookup(keys, add)
+            unseen = (ids < 0)
+            if unseen.any():
+                inverse = numpy.unique(WLVocabulary._void(keys[unseen]), return_inverse=True)[1].reshape(-1)
+                ids[unseen] = n_col + inverse
+                n_col += int(inverse.max()) + 1
+            return ids
+
+        arrays = [self._graph_arrays(g) for g in graphs]
+        sizes = numpy.array([len(a[0]) for a in arrays], dtype=numpy.int64)
+        offsets = numpy.concatenate(([0], numpy.cumsum(sizes)))
+        node_graph = numpy.repeat(numpy.arange(len(arrays)), sizes)
+        label = numpy.concatenate([a[0] for a in arrays])
+        src = numpy.concatenate([a[1] + offsets[i] for i, a in enumerate(arrays)])
+        dst = numpy.concatenate([a[2] + offsets[i] for i, a in enumerate(arrays)])
+        card_V = len(label)
+
+        # edges sorted by source => out-edges of node v are [indptr[v], indptr[v+1])
+        indptr = numpy.zeros(card_V + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(src, minlength=card_V), out=indptr[1:])
+        degree = numpy.diff(indptr).astype(numpy.uint64)
+
+        zero = numpy.zeros(card_V, dtype=numpy.uint64)
+        ids = lookup(numpy.stack([zero, label, zero, zero, zero], axis=1))
+        cols = [ids]
+        for h in range(1, 1 + self._n_iter):
+            prev = ids.astype(numpy.uint64)
+            key = [numpy.full(card_V, h, dtype=numpy.uint64), prev, degree]
+            for salt in (0x5851F42D4C957F2D, 0x14057B7EF767814F):
+                mixed = numpy.zeros(len(dst) + 1, dtype=numpy.uint64)
+                numpy.cumsum(_mix64(prev[dst] ^ numpy.uint64(salt)), out=mixed[1:])
+                key.append(mixed[indptr[1:]] - mixed[indptr[:-1]])
+            ids = lookup(numpy.stack(key, axis=1))
+            cols.append(ids)
+        return node_graph, cols, max(n_col, len(self.vocabulary))
+
+    def _features(self, graphs :list, add :bool =True) -> scipy.sparse.csr_matrix :
+        """ WL feature matrix (graphs x `self.vocabulary` columns) of some graphs
+
+        Without `add`, see `_wl_labels`: the columns past the vocabulary
+        only count in the self-similarities of the graphs.
+        """
+        node_graph, cols, n_col = self._wl_labels(graphs, add)
+        rows = numpy.tile(node_graph, len(cols))
+        return scipy.sparse.csr_matrix(
+            (numpy.ones(len(rows)), (rows, numpy.concatenate(cols))),
+            shape=(len(graphs), n_col))
+
+    @staticmethod
+    def _normalize(K :numpy.ndarray, diag_row :numpy.ndarray, diag_col :numpy.ndarray) -> numpy.ndarray :
+        """ Normalize a block of the kernel matrix exactly as GraKeL does
+        """
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            return numpy.nan_to_num(numpy.divide(K, numpy.sqrt(numpy.outer(diag_row, diag_col))))
+
+    def apply_WL_Subtree_Kernel(self) -> None :
+        """ Use Weisfeiler-Lehman Subtree Kernel to calculate the similarity matrix
+
+        Same kernel as `GKA_GraKeL.apply_WL_Subtree_Kernel`. The feature
+        matrix is kept in `self.feature_mat`.
+
+        Incremental: only the graphs added since the last call get their
+        features computed, and only the new x old and new x new blocks of the
+        matrix are computed. Label counts are exact in float64 and every
+        entry is normalized on its own, so the result is the same as
+        computing the whole matrix at once, with a diagonal of exactly 1.
+        """
+        n_old = 0 if self.graph_mat is None else len(self.graph_mat)
+        if n_old == len(self.graph_lst) and self.graph_mat is not None:
+            return
+        self._fit_features()
+
+        X_old = self.feature_mat[:n_old]
+        X_new = self.feature_mat[n_old:]
+        diag_old = self._diag[:n_old]
+        diag_new = self._diag[n_old:]
+        mat_new = self._normalize((X_new @ X_new.T).toarray(), diag_new, diag_new)
+        self.graph_factor = None
+
+        if 0 == n_old:
+            self.graph_mat = mat_new
+            return
+
+        mat_cross = self._normalize((X_new @ X_old.T).toarray(), diag_new, diag_old)
+        self.graph_mat = numpy.block([[self.graph_mat, mat_cross.T],
+                                      [mat_cross,      mat_new    ]])
+
+    def _fit_features(self) -> None :
+        """ Compute the feature vectors of the graphs added since the last call
+        """
+        n_old = 0 if self.feature_mat is None else self.feature_mat.shape[0]
+        if n_old == len(self.graph_lst):
+            return
+
+        X_new = self._features(self.graph_lst[n_old:])
+        diag_new = numpy.asarray(X_new.multiply(X_new).sum(axis=1), dtype=numpy.float64).reshape(-1)
+        if 0 == n_old:
+            self.feature_mat = X_new
+            self._diag = diag_new
+            return
+
+        X_old = self.feature_mat
+        X_old.resize((n_old, len(self.vocabulary)))
+        self.feature_mat = scipy.sparse.vstack([X_old, X_new], format="csr")
+        self._diag = numpy.concatenate((self._diag, diag_new))
+
+    def normalized_features(self, index :typing.Optional[numpy.ndarray] =None) -> scipy.sparse.csr_matrix :
+        """ Feature vectors scaled to unit norm, so that their dot products are the normalized kernel
+        """
+        X = self.feature_mat if index is None else self.feature_mat[index]
+        diag = self._diag if index is None else self._diag[index]
+        with numpy.errstate(divide="ignore"):
+            scale = numpy.nan_to_num(1.0 / numpy.sqrt(diag), posinf=0.0)
+        return scipy.sparse.diags(scale) @ X
+
+    def kernel_to(self, graphs :list) -> numpy.ndarray :
+        """ Normalized kernel values of other graphs (rows) against the fitted graphs (columns)
+
+        The graphs are not added, and neither are labels never seen before
+        to the vocabulary: they only count in the self-similarities of the
+        graphs.
+        """
+        self._fit_features()
+        X = self._features(graphs, add=False)
+        diag = numpy.asarray(X.multiply(X).sum(axis=1), dtype=numpy.float64).reshape(-1)
+        X_fit = self.feature_mat
+        K = (X[:, :X_fit.shape[1]] @ X_fit.T).toarray()
+        return self._normalize(K, diag, self._diag)
+
+    def apply_WL_Subtree_Kernel_Blocked(self, out :numpy.ndarray, block_size :int =4096) -> None :
+        """ Compute the WL Subtree Kernel tile by tile into a given array, e.g. a `numpy.memmap`
+
+        The matrix is computed in `block_size` x `block_size` tiles, each
+        written to `out` (N x N, any float dtype) before the next one is
+        computed, so the memory in use is bounded by the tile size and not
+        N^2. The entries are those of `apply_WL_Subtree_Kernel`, cast to the
+        dtype of `out`, which becomes `self.graph_mat`.
+        """
+        assert (block_size > 0) , "Block size must be positive"
+        self._fit_features()
+        n = self.feature_mat.shape[0]
+        assert (out.shape == (n, n)) , "Output array must be {} x {}".format(n, n)
+        X = self.feature_mat
+        for i in range(0, n, block_size):
+            rows = slice(i, i + block_size)
+            for j in range(i, n, block_size):
+                cols = slice(j, j + block_size)
+                tile = self._normalize((X[rows] @ X[cols].T).toarray(), self._diag[rows], self._diag[cols])
+                out[rows, cols] = tile
+                out[cols, rows] = tile.T
+        self.graph_mat = out
+        self.graph_factor = None
+
+    def apply_WL_Subtree_Kernel_Nystroem(self, n_landmarks :int, random_state :int =0) -> None :
+        """ Approximate the WL Subtree Kernel with the Nystroem method
+
+        `Williams, Christopher, and Matthias Seeger. "Using the Nystroem method to speed up kernel machines." NIPS 13 (2001).`
+
+        `n_landmarks` graphs are sampled uniformly as landmarks and only the
+        N x m block C between all graphs and the landmarks is computed. With
+        W the m x m block between the landmarks, the kernel is approximated by
+        C W^+ C^T = F F^T, and the N x r factor F = C W^(-1/2) (r <= m, the
+        numerical rank of W) is kept in `self.graph_factor` instead of the
+        N x N matrix, i.e. memory is O(N m). Rows of F are independent of each
+        other, so the factor of a subset of graphs is a subset of rows.
+        """
+        assert (n_landmarks > 0) , "Number of landmarks must be positive"
+        self._fit_features()
+        n = self.feature_mat.shape[0]
+        rng = numpy.random.default_rng(random_state)
+        self.landmarks = numpy.sort(rng.choice(n, size=min(n_landmarks, n), replace=False))
+
+        C = (self.normalized_features() @ self.normalized_features(self.landmarks).T).toarray()
+        vals, vecs = numpy.linalg.eigh(C[self.landmarks])
+        keep = vals > vals.max() * 1e-10
+        self.graph_factor = C @ (vecs[:, keep] / numpy.sqrt(vals[keep]))
+        self.graph_mat = None
+
+    def apply_WL_Subtree_Kernel_Pairs(self, pairs :numpy.ndarray, chunk_nnz :int =1 << 22) -> None :
+        """ Compute the WL Subtree Kernel for some pairs of graphs only
+
+        e.g. the candidate pairs of `MinHashLSH`. The result is kept in
+        `self.graph_sparse`, a symmetric `scipy.sparse` CSR matrix holding
+        the diagonal and the non-zero similarities of the pairs (i, j); all
+        other entries are taken as 0. Its entries equal those of
+        `apply_WL_Subtree_Kernel`.
+
+        The pairs are multiplied in chunks holding at most about `chunk_nnz`
+        non-zeros of feature vectors (a pair alone may exceed it), so memory
+        is O(N + number of pairs + chunk_nnz) whatever the size of the graphs.
+
+        :param pairs: graph index pairs, one row (i, j) per pair, in any order
+        :param chunk_nnz: number of feature vector non-zeros multiplied at once
+        """
+        self._fit_features()
+        n = self.feature_mat.shape[0]
+        pairs = numpy.asarray(pairs, dtype=numpy.int64).reshape(-1, 2)
+        pairs = numpy.unique(numpy.sort(pairs, axis=1), axis=0)
+        pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+        row = numpy.concatenate((numpy.arange(n), pairs[:, 0]))
+        col = numpy.concatenate((numpy.arange(n), pairs[:, 1]))
+
+        X = self.feature_mat
+        K = numpy.empty(len(row))
+        K[:n] = self._diag
+        # Chunk ends: cumulative non-zeros of both feature vectors of the pairs
+        nnz = numpy.diff(X.indptr)
+        total = numpy.cumsum(nnz[pairs[:, 0]] + nnz[pairs[:, 1]])
+        begin = 0
+        while begin < len(pairs):
+            start = total[begin - 1] if begin > 0 else 0
+            end = max(int(numpy.searchsorted(total, start + chunk_nnz, side="right")), begin + 1)
+            r = pairs[begin:end, 0]
+            c = pairs[begin:end, 1]
+            K[n + begin:n + end] = numpy.asarray(X[r].multiply(X[c]).sum(axis=1)).reshape(-1)
+            begin = end
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            K = numpy.nan_to_num(numpy.divide(K, numpy.sqrt(self._diag[row] * self._diag[col])))
+
+        off = slice(n, None)
+        S = scipy.sparse.coo_matrix(
+            (numpy.concatenate((K, K[off])),
+             (numpy.concatenate((row, col[off])), numpy.concatenate((col, row[off])))),
+            shape=(n, n)).tocsr()
+        S.eliminate_zeros()
+        self.graph_sparse = S
+        self.graph_mat = None
+        self.graph_factor = None
+
+    def apply_WL_Subtree_Kernel_KNN(self, k :int, block_size :int =1024) -> None :
+        """ Keep the `k` largest similarities of each graph only, as a sparse k-nearest-neighbor graph
+
+        The matrix is computed in `block_size` x `block_size` tiles, and each
+        graph's `k` best neighbors so far are merged with every tile, so
+        memory is O(N k + block_size^2) instead of N^2. The result is kept in
+        `self.graph_sparse` like with `apply_WL_Subtree_Kernel_Pairs`, made
+        symmetric by keeping (i, j) if either graph is among the `k` nearest
+        of the other; its entries equal those of `apply_WL_Subtree_Kernel`.
+        """
+        assert (k > 0 and block_size > 0) , "Number of neighbors and block size must be positive"
+        self._fit_features()
+        X = self.feature_mat
+        n = X.shape[0]
+        k = min(k, n - 1)
+        row, col, val = [], [], []
+        for i in range(0, n, block_size):
+            rows = slice(i, i + block_size)
+            m = len(self._diag[rows])
+            best_val = numpy.full((m, 0), -numpy.inf)
+            best_col = numpy.zeros((m, 0), dtype=numpy.int64)
+            for j in range(0, n, block_size):
+                cols = slice(j, j + block_size)
+                tile = self._normalize((X[rows] @ X[cols].T).toarray(), self._diag[rows], self._diag[cols])
+                if i == j:
+                    # a graph is no neighbor of its own
+                    numpy.fill_diagonal(tile, -numpy.inf)
+                cand_val = numpy.hstack((best_val, tile))
+                cand_col = numpy.hstack((best_col, numpy.broadcast_to(numpy.arange(j, j + tile.shape[1]), tile.shape)))
+                if cand_val.shape[1] > k:
+                    top = numpy.argpartition(-cand_val, k - 1, axis=1)[:, :k]
+                    cand_val = numpy.take_along_axis(cand_val, top, axis=1)
+                    cand_col = numpy.take_along_axis(cand_col, top, axis=1)
+                best_val, best_col = cand_val, cand_col
+            row.append(numpy.repeat(numpy.arange(i, i + m), best_col.shape[1]))
+            col.append(best_col.reshape(-1))
+            val.append(best_val.reshape(-1))
+
+        S = scipy.sparse.coo_matrix(
+            (numpy.concatenate(val), (numpy.concatenate(row), numpy.concatenate(col))), shape=(n, n)).tocsr()
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            self_sim = numpy.nan_to_num(numpy.divide(self._diag, numpy.sqrt(self._diag * self._diag)))
+        S = (S.maximum(S.T) + scipy.sparse.diags(self_sim)).tocsr()
+        S.eliminate_zeros()
+        self.graph_sparse = S
+        self.graph_mat = None
+        self.graph_factor = None
+
+    def get_sparse(self) -> typing.Optional[scipy.sparse.csr_matrix] :
+        """ return the sparse similarity matrix of `apply_WL_Subtree_Kernel_Pairs` or `apply_WL_Subtree_Kernel_KNN`
+        """
+        return self.graph_sparse
+
+    def nystroem_quality(self, n_sample :int =500, random_state :int =0) -> dict :
+        """ Compare the Nystroem approximation with the exact kernel on a random subsample of graphs
+
+        Only the `n_sample` x `n_sample` exact block is computed.
+
+        :return: a dict compatible with JSON
+        """
+        assert (self.graph_factor is not None) , "Call `apply_WL_Subtree_Kernel_Nystroem` first"
+        n = len(self.graph_factor)
+        rng = numpy.random.default_rng(random_state)
+        index = numpy.sort(rng.choice(n, size=min(n_sample, n), replace=False))
+
+        exact = self._normalize((self.feature_mat[index] @ self.feature_mat[index].T).toarray(),
+                                self._diag[index], self._diag[index])
+        F = self.graph_factor[index]
+        error = F @ F.T - exact
+        return {
+            "Landmarks"               : int(len(self.landmarks)),
+            "Rank"                    : int(self.graph_factor.shape[1]),
+            "Sample"                  : int(len(index)),
+            "Relative Frobenius Error": float(numpy.linalg.norm(error) / numpy.linalg.norm(exact)),
+            "Max Abs Error"           : float(numpy.abs(error).max()),
+            "Mean Abs Error"          : float(numpy.abs(error).mean())
+        }
+
+    def select(self, index :typing.Sequence[int]) -> None :
+        """ Keep (or reorder, or repeat) the DCFGs at `index` only, with their feature vectors
+
+        DCFGs added since the last fit get their feature vectors computed
+        first; a matrix not covering them is dropped, to be recomputed by the
+        next `apply_<Kernel Name>_Kernel`.
+        """
+        self._fit_features()
+        if self.graph_mat is not None and len(self.graph_mat) != len(self.graph_lst):
+            self.graph_mat = None
+        if self.graph_factor is not None and len(self.graph_factor) != len(self.graph_lst):
+            self.graph_factor = None
+        if self.graph_sparse is not None and self.graph_sparse.shape[0] != len(self.graph_lst):
+            self.graph_sparse = None
+        super().select(index)
+        index = numpy.asarray(index, dtype=numpy.int64)
+        if self.feature_mat is not None:
+            self.feature_mat = self.feature_mat[index]
+            self._diag = self._diag[index]
+        if self.graph_factor is not None:
+            self.graph_factor = self.graph_factor[index]
+        if self.graph_sparse is not None:
+            self.graph_sparse = self.graph_sparse[index][:, index]
+
+    def export_features(
+        self,
+        addr_table  :typing.Optional[DCFG.AddressTable] =None,
+        index       :typing.Optional[typing.Sequence[int]] =None,
+        with_matrix :bool =False
+    ) -> typing.Dict[str, numpy.ndarray] :
+        """ Export the WL feature matrix and the label vocabulary as a dict of NumPy arrays
+
+        Suited to `numpy.savez`. With the `DCFG.AddressTable` the node labels
+        were interned with, iteration 0 labels are stored as addresses, so the
+        features stay valid in a later run whose table assigns other ids.
+        With `index`, only the feature vectors of those graphs are exported,
+        with the whole vocabulary. With `with_matrix`, the similarity matrix
+        is exported too if it covers all graphs, so that a later run only
+        computes the rows of the graphs it adds.
+
+            feature_data, feature_indices, feature_indptr, feature_shape
+                           the `scipy.sparse` CSR feature matrix (graphs x labels)
+            diag           unnormalized self-similarity of each graph
+            vocab_keys     label keys (see `WLVocabulary`)
+            vocab_cols     column of each key
+            n_iter         number of WL iterations
+            matrix         normalized similarity matrix (only with `with_matrix`)
+        """
+        assert (self.feature_mat is not None) , "No features, call `apply_WL_Subtree_Kernel` first"
+        keys = self.vocabulary.keys.copy()
+        if addr_table is not None:
+            first = (0 == keys[:, 0])
+            keys[first, 1] = addr_table.lookup(keys[first, 1])
+        X = self.feature_mat
+        diag = self._diag
+        mat = self.graph_mat if with_matrix and self.graph_mat is not None \
+            and len(self.graph_mat) == X.shape[0] else None
+        if index is not None:
+            index = numpy.asarray(index, dtype=numpy.int64)
+            X = X[index]
+            diag = diag[index]
+            mat = None if mat is None else mat[numpy.ix_(index, index)]
+        tables = {
+            "feature_data"   : X.data,
+            "feature_indices": X.indices,
+            "feature_indptr" : X.indptr,
+            "feature_shape"  : numpy.array(X.shape, dtype=numpy.int64),
+            "diag"           : diag,
+            "vocab_keys"     : keys,
+            "vocab_cols"     : self.vocabulary.cols,
+            "n_iter"         : numpy.array(self._n_iter, dtype=numpy.int64)
+        }
+        if mat is not None:
+            tables["matrix"] = mat
+        return tables
+
+    def import_features(
+        self,
+        tables     :typing.Dict[str, numpy.ndarray],
+        addr_table :typing.Optional[DCFG.AddressTable] =None
+    ) -> None :
+        """ Inverse of `export_features`: replace the state with saved features
+
+        No DCFG is needed afterwards: `apply_WL_Subtree_Kernel` (or its
+        Nystroem version) works from the features. The imported rows have no
+        graph object, their `graph_lst` entries are `None`. Graphs added
+        afterwards line up with them, provided `addr_table` is the table
+        their labels are interned with. A saved matrix becomes the matrix of
+        the imported rows, so that `apply_WL_Subtree_Kernel` only computes
+        the rows of the graphs added afterwards.
+        """
+        if int(tables["n_iter"]) != self._n_iter:
+            raise ValueError("Features of {} WL iterations, expected {}".format(int(tables["n_iter"]), self._n_iter))
+        keys = numpy.array(tables["vocab_keys"], dtype=numpy.uint64).reshape(-1, WLVocabulary.KEY_WIDTH)
+        if addr_table is not None:
+            first = (0 == keys[:, 0])
+            keys[first, 1] = addr_table.intern(keys[first, 1])
+        order = numpy.argsort(WLVocabulary._void(keys), kind="stable")
+        self.vocabulary = WLVocabulary()
+        self.vocabulary.keys = keys[order]
+        self.vocabulary.cols = numpy.asarray(tables["vocab_cols"], dtype=numpy.int64)[order]
+
+        self.feature_mat = scipy.sparse.csr_matrix(
+            (tables["feature_data"], tables["feature_indices"], tables["feature_indptr"]),
+            shape=tuple(tables["feature_shape"].tolist()))
+        self._diag = numpy.asarray(tables["diag"], dtype=numpy.float64)
+        self.graph_lst = [None] * self.feature_mat.shape[0]
+        self.graph_mat = None
+        if "matrix" in tables:
+            if tables["matrix"].shape != (len(self.graph_lst), len(self.graph_lst)):
+                raise ValueError("Matrix of shape {} for {} feature vectors".format(tables["matrix"].shape, len(self.graph_lst)))
+            self.graph_mat = numpy.asarray(tables["matrix"], dtype=numpy.float64)
+        self.graph_factor = None
+
+    def del_dcfg(self, g :typing.Union[networkx.DiGraph, DCFG.CSRGraph]) -> None :
+        """ Remove a DCFG, together with its feature vector and its row and column of the matrix
+
+        The vocabulary is kept, so graphs added later still line up.
+        """
+        i = self._index_of(g)
+        super().del_dcfg(g)
+        if self.feature_mat is not None and i < self.feature_mat.shape[0]:
+            keep = numpy.delete(numpy.arange(self.feature_mat.shape[0]), i)
+            self.feature_mat = self.feature_mat[keep]
+            self._diag = self._diag[keep]
+        if self.graph_factor is not None:
+            self.graph_factor = numpy.delete(self.graph_factor, i, axis=0)
+        if self.graph_sparse is not None and i < self.graph_sparse.shape[0]:
+            keep = numpy.delete(numpy.arange(self.graph_sparse.shape[0]), i)
+            self.graph_sparse = self.graph_sparse[keep][:, keep]
+
+
+class MinHashLSH:
+    """ Candidate pairs of similar DCFGs by MinHash locality-sensitive hashing
+
+    `Broder, Andrei Z. "On the resemblance and containment of documents." Compression and Complexity of Sequences (1997).`
+
+    Each DCFG is reduced to the set of its edges (source label, destination
+    label) and summarized by `n_band * band_size` MinHash values, i.e. the
+    minimum of a random hash over the set. Two DCFGs with edge set Jaccard
+    similarity s agree on a MinHash value with probability s, so they share
+    all `band_size` values of at least one band with probability
+    1 - (1 - s^band_size)^n_band. Graphs sharing a band fall into the same
+    bucket and become a candidate pair; all other pairs are never compared,
+    so the kernel work is about linear in the number of graphs when most
+    crashes are unrelated.
+
+    DCFGs without edges all get the same signature and are candidates of each other.
+    """
+    def __init__(self, n_band :int =16, band_size :int =4, seed :int =0) -> None :
+        """ Constructor
+
+        :param n_band: number of bands; more bands find pairs of lower similarity
+        :param band_size: MinHash values per band; larger bands find fewer false candidates
+        :param seed: seed of the random hash functions
+        """
+        assert (n_band > 0 and band_size > 0) , "Number and size of bands must be positive"
+        self._n_band = n_band
+        self._band_size = band_size
+        self._salts = numpy.random.default_rng(seed).integers(
+            0, numpy.iinfo(numpy.uint64).max, size=n_band * band_size, dtype=numpy.uint64, endpoint=True)
+
+    def signatures(self, graphs :list) -> numpy.ndarray :
+        """ MinHash signatures (graphs x `n_band * band_size`, uint64) of the edge sets of some DCFGs
+        """
+        edges = []
+        for g in graphs:
+            label, src, dst = GKA_SparseWL._graph_arrays(g)
+            edges.append(_mix64(_mix64(label[src]) ^ label[dst]))
+        sizes = numpy.array([len(e) for e in edges], dtype=numpy.int64)
+        edges = numpy.concatenate(edges) if edges else numpy.zeros(0, dtype=numpy.uint64)
+        nonempty = (sizes > 0)
+        starts = (numpy.cumsum(sizes) - sizes)[nonempty]
+
+        sig = numpy.full((len(graphs), len(self._salts)), numpy.iinfo(numpy.uint64).max, dtype=numpy.uint64)
+        if len(edges):
+            for k, salt in enumerate(self._salts):
+                sig[nonempty, k] = numpy.minimum.reduceat(_mix64(edges ^ salt), starts)
+        return sig
+
+    def candidate_pairs(self, graphs :list) -> numpy.ndarray :
+        """ Index pairs (i, j), i < j, of the DCFGs sharing at least one LSH bucket
+
+        :return: one row per pair, sorted, without repeats
+        """
+        sig = self.signatures(graphs)
+        n = len(sig)
+        found = []
+        for b in range(self._n_band):
+            band = sig[:, b * self._band_size:(b + 1) * self._band_size]
+            bucket = _mix64(band[:, 0] ^ numpy.uint64(b))
+            for k in range(1, self._band_size):
+                bucket = _mix64(bucket ^ band[:, k])
+            order = numpy.argsort(bucket, kind="stable")
+            bucket = bucket[order]
+            # Members of a bucket are adjacent after sorting: pair every
+            # position with the one `d` further on while both are in the bucket
+            pos = numpy.arange(n)
+            d = 1
+            while True:
+                pos = pos[pos + d < n]
+                pos = pos[bucket[pos] == bucket[pos + d]]
+                if 0 == len(pos):
+                    break
+                found.append(numpy.stack((order[pos], order[pos + d]), axis=1))
+                d += 1
+        if not found:
+            return numpy.zeros((0, 2), dtype=numpy.int64)
+        return numpy.unique(numpy.sort(numpy.concatenate(found), axis=1), axis=0)
+
+
 if __name__ == "__main__":
     pass
\ No newline at end of file
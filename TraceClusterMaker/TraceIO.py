@@ -0,0 +1,387 @@
+import argparse
+import bz2
+import gzip
+import io
+import itertools
+import logging
+import lzma
+import os
+import struct
+import typing
+import numpy
+
+try:
+    import zstandard
+except ImportError:
+    # Optional: only needed for zstd-compressed traces
+    zstandard = None
+
+# Packed trace format
+#
+# A packed trace is a fixed-size header followed by the addresses of the
+# trace as a little-endian uint64 array, one element per line of the
+# original hex text trace:
+#
+#   offset  size  field
+#   0       8     magic   b"IGORTRC\0"
+#   8       4     version (uint32)
+#   12      4     flags   (uint32, reserved, 0)
+#   16      8     count   (uint64, number of addresses)
+#   24      8*N   addresses (uint64)
+#
+# The header is 24 bytes so the address array stays 8-byte aligned and
+# can be memory-mapped directly as a NumPy array.
+PACKED_MAGIC   = b"IGORTRC\x00"
+PACKED_VERSION = 1
+PACKED_HEADER  = struct.Struct("<8sIIQ")
+PACKED_DTYPE   = numpy.dtype("<u8")
+
+# Size hint (bytes) of the text block converted at once by `pack_trace`
+PACK_BLOCK_BYTES = 16 << 20
+
+# Block size (bytes) read at once by `load_trace_tail` going backwards
+TAIL_BLOCK_BYTES = 1 << 20
+
+# Compressed traces (text or packed) are detected by the magic bytes of
+# the compression container, whatever the file name is.
+COMPRESSION_MAGIC = (
+    (b"\x1f\x8b",             "gzip"),
+    (b"\xfd7zXZ\x00",         "xz"),
+    (b"BZh",                  "bz2"),
+    (b"\x28\xb5\x2f\xfd",     "zstd"),
+)
+COMPRESSION_SUFFIX = {"gzip": ".gz", "xz": ".xz", "bz2": ".bz2", "zstd": ".zst"}
+
+
+def _require_zstandard() -> None :
+    if zstandard is None:
+        raise ImportError("zstd-compressed traces require the `zstandard` package")
+
+
+def detect_compression(path :str) -> typing.Optional[str] :
+    """ Detect the compression of a file by its magic bytes
+
+    :return: one of the keys of `COMPRESSION_SUFFIX`, or `None` for a plain file
+    """
+    with open(path, mode="rb") as f:
+        head = f.read(8)
+    for magic, name in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def open_trace(path :str) -> typing.BinaryIO :
+    """ Open a trace for reading as a binary stream, decompressing it on the fly
+
+    The stream supports `read` and line iteration in every case.
+    """
+    compression = detect_compression(path)
+    if compression is None:
+        return open(path, mode="rb")
+    if "gzip" == compression:
+        return gzip.open(path, mode="rb")
+    if "xz" == compression:
+        return lzma.open(path, mode="rb")
+    if "bz2" == compression:
+        return bz2.open(path, mode="rb")
+    _require_zstandard()
+    reader = zstandard.ZstdDecompressor().stream_reader(
+        open(path, mode="rb"), read_across_frames=True)
+    return io.BufferedReader(reader)
+
+
+def open_trace_writer(path :str, compression :typing.Optional[str] =None, append :bool =False) -> typing.BinaryIO :
+    """ Open a trace for writing as a binary stream, compressing it on the fly
+
+    :param compression: `None` for a plain file, or one of the keys of `COMPRESSION_SUFFIX`
+    :param append: append to the file; for a compressed file a new
+                   member/frame is appended, which `open_trace` reads
+                   back transparently
+    """
+    mode = "ab" if append else "wb"
+    if compression is None:
+        return open(path, mode=mode)
+    if "gzip" == compression:
+        return gzip.open(path, mode=mode)
+    if "xz" == compression:
+        return lzma.open(path, mode=mode)
+    if "bz2" == compression:
+        return bz2.open(path, mode=mode)
+    if "zstd" == compression:
+        _require_zstandard()
+        return zstandard.ZstdCompressor().stream_writer(open(path, mode=mode))
+    raise ValueError("Unknown compression: {}".format(compression))
+
+
+def _unpack_header(raw :bytes, path :str) -> typing.Tuple[int,int,int] :
+    """ Check and unpack the raw header bytes of a packed trace
+    """
+    if len(raw) != PACKED_HEADER.size:
+        raise ValueError("Truncated packed trace header: {}".format(path))
+    magic, version, flags, count = PACKED_HEADER.unpack(raw)
+    if magic != PACKED_MAGIC:
+        raise ValueError("Not a packed trace: {}".format(path))
+    if version != PACKED_VERSION:
+        raise ValueError("Unsupported packed trace version {}: {}".format(version, path))
+    return version, flags, count
+
+
+def is_packed_trace(path :str) -> bool :
+    """ Check whether a (possibly compressed) file is a packed trace by its magic bytes
+    """
+    with open_trace(path) as f:
+        return f.read(len(PACKED_MAGIC)) == PACKED_MAGIC
+
+
+def read_packed_header(path :str) -> typing.Tuple[int,int,int] :
+    """ Read the header of a packed trace
+
+    :return: (version, flags, count)
+    """
+    with open_trace(path) as f:
+        return _unpack_header(f.read(PACKED_HEADER.size), path)
+
+
+def load_packed_trace(path :str) -> numpy.ndarray :
+    """ Memory-map the address array of a packed trace without copying
+
+    The returned array is read-only and backed by the file. A compressed
+    packed trace cannot be mapped, so it is decompressed into memory.
+    """
+    if detect_compression(path) is not None:
+        with open_trace(path) as f:
+            _, _, count = _unpack_header(f.read(PACKED_HEADER.size), path)
+            raw = f.read(count * PACKED_DTYPE.itemsize)
+        if len(raw) != count * PACKED_DTYPE.itemsize:
+            raise ValueError("Truncated packed trace body: {}".format(path))
+        return numpy.frombuffer(raw, dtype=PACKED_DTYPE)
+
+    _, _, count = read_packed_header(path)
+    expected = PACKED_HEADER.size + count * PACKED_DTYPE.itemsize
+    if os.path.getsize(path) < expected:
+        raise ValueError("Truncated packed trace body: {}".format(path))
+    if 0 == count:
+        # `numpy.memmap` cannot map a zero-length region
+        return numpy.empty(0, dtype=PACKED_DTYPE)
+    return numpy.memmap(path, dtype=PACKED_DTYPE, mode="r",
+                        offset=PACKED_HEADER.size, shape=(count,))
+
+
+def parse_text_lines(lines :typing.List[bytes]) -> numpy.ndarray :
+    """ Hex text lines ("rb" file mode) => uint64 address array
+
+    Blank lines are skipped. e.g. [b'0x00047c308\\n'] => array([4702984])
+    """
+    return numpy.array([int(l, 16) for l in lines if l.strip()], dtype=PACKED_DTYPE)
+
+
+def load_text_trace(path :str) -> numpy.ndarray :
+    """ Parse a (possibly compressed) hex text trace into a uint64 address array
+    """
+    with open_trace(path) as f:
+        return parse_text_lines(f.read().split())
+
+
+def load_trace(path :str) -> numpy.ndarray :
+    """ Load the addresses of a trace in either format as a uint64 array
+
+    Packed traces are memory-mapped, text traces are parsed.
+    """
+    if is_packed_trace(path):
+        return load_packed_trace(path)
+    return load_text_trace(path)
+
+
+def iter_trace_chunks(path :str, chunk_size :int) -> typing.Iterator[numpy.ndarray] :
+    """ Yield the addresses of a trace in either format as uint64 arrays of at most `chunk_size` entries
+
+    Only one chunk is held in memory at a time: plain packed traces are
+    sliced from the memory map, while text traces and compressed packed
+    traces are read from the (decompressing) stream chunk by chunk.
+    """
+    assert (chunk_size > 0) , "chunk size must be positive"
+    if is_packed_trace(path):
+        if detect_compression(path) is None:
+            addrs = load_packed_trace(path)
+            for i in range(0, len(addrs), chunk_size):
+                yield addrs[i:i+chunk_size]
+            return
+        with open_trace(path) as f:
+            _, _, count = _unpack_header(f.read(PACKED_HEADER.size), path)
+            while count > 0:
+                n = min(count, chunk_size)
+                raw = f.read(n * PACKED_DTYPE.itemsize)
+                if len(raw) != n * PACKED_DTYPE.itemsize:
+                    raise ValueError("Truncated packed trace body: {}".format(path))
+                yield numpy.frombuffer(raw, dtype=PACKED_DTYPE)
+                count -= n
+        return
+    with open_trace(path) as f:
+        while True:
+            block = list(itertools.islice(f, chunk_size))
+            if not block:
+                break
+            arr = parse_text_lines(block)
+            if len(arr):
+                yield arr
+
+
+def _iter_text_lines_reversed(f :typing.BinaryIO, block_size :int) -> typing.Iterator[bytes] :
+    """ Yield the non-blank lines of a seekable text trace from the last one backwards
+
+    The file is read in blocks of `block_size` bytes from its end, so only
+    the blocks holding the yielded lines are ever read.
+    """
+    pos = f.seek(0, os.SEEK_END)
+    rest = b""
+    while pos > 0:
+        step = min(block_size, pos)
+        pos -= step
+        f.seek(pos)
+        lines = (f.read(step) + rest).split(b"\n")
+        # the first piece may be cut in the middle of a line
+        rest = lines[0]
+        for l in reversed(lines[1:]):
+            if l.strip():
+                yield l
+    if rest.strip():
+        yield rest
+
+
+def load_trace_tail(
+    path       :str,
+    window     :typing.Optional[int] =None,
+    entry_addr :typing.Optional[int] =None,
+    block_size :int =TAIL_BLOCK_BYTES
+) -> numpy.ndarray :
+    """ Load only the crash-proximal end of a trace in either format as a uint64 array
+
+    The tail starts at the last occurrence of `entry_addr` (e.g. the entry of
+    a function, the address itself included) and holds at most the last
+    `window` entries. The whole trace is the tail if `entry_addr` never
+    occurs. Both `None` means the whole trace.
+
+    Plain files are read from their end: a packed trace is sliced from the
+    memory map and searched backwards block by block, a text trace is read
+    backwards block by block, so the unused prefix is never parsed.
+    A compressed trace cannot be read backwards and is streamed instead,
+    keeping only the current tail in memory.
+    """
+    assert (window is None or window > 0) , "window must be positive"
+    if window is None and entry_addr is None:
+        return load_trace(path)
+    packed = is_packed_trace(path)
+
+    if detect_compression(path) is not None:
+        tail = numpy.empty(0, dtype=PACKED_DTYPE)
+        for chunk in iter_trace_chunks(path, block_size // PACKED_DTYPE.itemsize):
+            hits = [] if entry_addr is None else numpy.flatnonzero(chunk == entry_addr)
+            if len(hits):
+                tail = chunk[hits[-1]:]
+            else:
+                tail = numpy.concatenate((tail, chunk))
+            if window is not None:
+                tail = tail[-window:]
+        return tail
+
+    if packed:
+        addrs = load_packed_trace(path)
+        start = 0 if window is None else max(0, len(addrs) - window)
+        if entry_addr is not None:
+            step = block_size // PACKED_DTYPE.itemsize
+            end = len(addrs)
+            while end > start:
+                begin = max(start, end - step)
+                hits = numpy.flatnonzero(addrs[begin:end] == entry_addr)
+                if len(hits):
+                    start = begin + int(hits[-1])
+                    break
+                end = begin
+        return addrs[start:]
+
+    tail = []
+    with open(path, mode="rb") as f:
+        for l in _iter_text_lines_reversed(f, block_size):
+            tail.append(l)
+            if entry_addr is not None and int(l, 16) == entry_addr:
+                break
+            if window is not None and len(tail) >= window:
+                break
+    return parse_text_lines(tail[::-1])
+
+
+def write_packed_trace(path :str, addrs :typing.Iterable[int], compression :typing.Optional[str] =None) -> int :
+    """ Write addresses as a packed trace
+
+    :param compression: `None` for a plain file, or one of the keys of `COMPRESSION_SUFFIX`
+    :return: number of addresses written
+    """
+    arr = numpy.asarray(addrs, dtype=PACKED_DTYPE)
+    with open_trace_writer(path, compression) as f:
+        f.write(PACKED_HEADER.pack(PACKED_MAGIC, PACKED_VERSION, 0, len(arr)))
+        f.write(arr.tobytes())
+    return len(arr)
+
+
+def pack_trace(src :str, dst :str, compression :typing.Optional[str] =None) -> int :
+    """ Convert a (possibly compressed) hex text trace into a packed trace
+
+    The text is converted block by block so the whole trace never has to
+    be held in memory. For a plain output the count field is patched in
+    once all blocks are written; a compressed output cannot be rewound,
+    so the lines are counted in a first pass instead.
+
+    :param compression: `None` for a plain file, or one of the keys of `COMPRESSION_SUFFIX`
+    :return: number of addresses written
+    """
+    count = 0
+    if compression is not None:
+        with open_trace(src) as fin:
+            for l in fin:
+                if l.strip():
+                    count += 1
+
+    written = 0
+    with open_trace(src) as fin, open_trace_writer(dst, compression) as fout:
+        fout.write(PACKED_HEADER.pack(PACKED_MAGIC, PACKED_VERSION, 0, count))
+        while True:
+            block = fin.readlines(PACK_BLOCK_BYTES)
+            if not block:
+                break
+            arr = parse_text_lines(block)
+            fout.write(arr.tobytes())
+            written += len(arr)
+        if compression is None:
+            fout.seek(0)
+            fout.write(PACKED_HEADER.pack(PACKED_MAGIC, PACKED_VERSION, 0, written))
+    return written
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level = logging.INFO,
+        format = '%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Convert hex text traces into the packed binary trace format")
+    parser.add_argument("-i", help="text trace file or traces root directory", type=str, required=True)
+    parser.add_argument("-o", help="output file or directory (auto create if not exists)", type=str, required=True)
+    parser.add_argument("-z", help="compress the packed traces", choices=sorted(COMPRESSION_SUFFIX), default=None)
+    args = parser.parse_args()
+
+    if os.path.isdir(args.i):
+        for root, dirs, files in os.walk(args.i, followlinks=True):
+            out_root = os.path.join(args.o, os.path.relpath(root, args.i))
+            os.makedirs(out_root, exist_ok=True)
+            for name in files:
+                src = os.path.join(root, name)
+                if is_packed_trace(src):
+                    logging.info("Skip packed trace: {}".format(src))
+                    continue
+                n = pack_trace(src, os.path.join(out_root, name), args.z)
+                logging.info("Packed {} addresses: {}".format(n, src))
+    else:
+        n = pack_trace(args.i, args.o, args.z)
+        logging.info("Packed {} addresses: {}".format(n, args.i))
@@ -1,9 +1,88 @@
+import concurrent.futures
+import os
+import tempfile
 import typing
+from multiprocessing import shared_memory
 import matplotlib.pyplot as plt
 import numpy as np
+import scipy.cluster.hierarchy
+import scipy.sparse
+import scipy.sparse.linalg
+import scipy.spatial.distance
 from matplotlib import cm, colors
-from sklearn import cluster, ensemble, metrics
-from sklearn.manifold import MDS
+from sklearn import ensemble
+from sklearn.manifold import MDS, spectral_embedding
+
+# Linkage criteria of `ClusterWrapper_hierarchical`, those that work on any distance matrix
+LINKAGE_METHODS = ["average", "complete", "single", "weighted"]
+
+
+def discretize(
+    vectors          :np.ndarray,
+    random_state     :np.random.RandomState,
+    max_svd_restarts :int =30,
+    n_iter_max       :int =20
+) -> np.ndarray :
+    """ Labels of the partition matrix closest to a spectral embedding
+
+    `Yu, Stella X., and Jianbo Shi. "Multiclass spectral clustering." ICCV (2003).`
+
+    Adapted from `sklearn.cluster._spectral.discretize` (scikit-learn,
+    BSD-3-Clause, Copyright (c) 2007-2024 The scikit-learn developers), which
+    is private there. It is the `assign_labels='discretize'` step of
+    `SpectralClustering`, and draws the same random numbers, so the labels
+    are the same. `vectors` is not modified.
+
+    :param vectors: embedding (samples x clusters)
+    :param random_state: picks the row the rotation matrix is initialized with
+    """
+    eps = np.finfo(float).eps
+    n_samples, n_components = vectors.shape
+
+    # Scale each eigenvector to the length of a vector of ones, pointing
+    # away from the first sample, then the rows to unit length
+    vectors = np.array(vectors, dtype=np.float64)
+    for i in range(n_components):
+        vectors[:, i] = (vectors[:, i] / np.linalg.norm(vectors[:, i])) * np.sqrt(n_samples)
+        if vectors[0, i] != 0:
+            vectors[:, i] = -1 * vectors[:, i] * np.sign(vectors[0, i])
+    vectors = vectors / np.sqrt((vectors ** 2).sum(axis=1))[:, np.newaxis]
+
+    svd_restarts = 0
+    has_converged = False
+    while (svd_restarts < max_svd_restarts) and not has_converged:
+        # Rotation initialized with a random row, then the rows as orthogonal to the previous ones as possible
+        rotation = np.zeros((n_components, n_components))
+        rotation[:, 0] = vectors[random_state.randint(n_samples), :].T
+        c = np.zeros(n_samples)
+        for j in range(1, n_components):
+            c += np.abs(np.dot(vectors, rotation[:, j - 1]))
+            rotation[:, j] = vectors[c.argmin(), :].T
+
+        last_objective_value = 0.0
+        n_iter = 0
+        while not has_converged:
+            n_iter += 1
+            labels = np.dot(vectors, rotation).argmax(axis=1)
+            vectors_discrete = scipy.sparse.csc_matrix(
+                (np.ones(len(labels)), (np.arange(0, n_samples), labels)),
+                shape=(n_samples, n_components))
+            try:
+                U, S, Vh = np.linalg.svd(vectors_discrete.T @ vectors)
+            except np.linalg.LinAlgError:
+                svd_restarts += 1
+                break
+
+            ncut_value = 2.0 * (n_samples - S.sum())
+            if (abs(ncut_value - last_objective_value) < eps) or (n_iter > n_iter_max):
+                has_converged = True
+            else:
+                last_objective_value = ncut_value
+                rotation = np.dot(Vh.T, U.T)
+
+    if not has_converged:
+        raise np.linalg.LinAlgError("SVD did not converge")
+    return labels
 
 
 class ClusterWrapper:
@@ -14,13 +93,36 @@ class ClusterWrapper:
     in which value of index i is the Cluster-ID of sample i. Result
     is `None` which indicates unprepared data.
     """
-    def __init__(self, M :np.ndarray) -> None :
+    def __init__(self, M :np.ndarray, weights :typing.Optional[np.ndarray] =None,
+                 silhouette_sample :typing.Optional[int] =None) -> None :
         """ Constructor
 
         :param M: similarity matrix, normalized and symmetric.
+        :param weights: number of samples each row of `M` stands for
+                        (e.g. collapsed duplicates), or `None` for all 1
+        :param silhouette_sample: estimate silhouette scores from a stratified
+                                  sample of this many rows when there are more,
+                                  or `None` for exact scores
         """
         self._similarity_mat = M
+        self._weights = weights
+        self._silhouette_sample = silhouette_sample
         self.clusters_result = None
+        # 95% confidence half-width of the last sampled silhouette score, `None` if exact
+        self.silhouette_error = None
+
+    def silhouette(self, distance_mat :np.ndarray, labels :np.ndarray) -> float :
+        """ Silhouette score of `labels`, weighted by `self._weights` if given
+
+        Estimated by `sampled_silhouette_score` if `silhouette_sample` is
+        smaller than the number of samples, see `silhouette_error`.
+        """
+        if self._silhouette_sample is not None and self._silhouette_sample < len(labels):
+            score, self.silhouette_error = \
+                sampled_silhouette_score(distance_mat, labels, self._weights, self._silhouette_sample)
+            return score
+        self.silhouette_error = None
+        return weighted_silhouette_score(distance_mat, labels, self._weights)
 
     def plotter(self, file_name :str) -> None :
         """ Generate clustering result plot and save to file.
@@ -32,8 +134,7 @@ class ClusterWrapper:
         color_map = plt.get_cmap('RdYlGn')
         scalar_map = cm.ScalarMappable(norm=c_norm, cmap=color_map)
 
-        mds = MDS(dissimilarity="precomputed")
-        projection = mds.fit_transform(1 - self._similarity_mat)
+        projection = self._projection()
 
         plt.figure(dpi=600)
         for label in set(labels):
@@ -48,20 +149,44 @@ class ClusterWrapper:
             )
         plt.legend()
         plt.savefig(file_name, dpi="figure", format="png")
+
+    def _projection(self) -> np.ndarray :
+        """ 2-D projection of the samples for `plotter`
+        """
+        mds = MDS(dissimilarity="precomputed")
+        return mds.fit_transform(1 - self._similarity_mat)
+
+    def _n_samples(self) -> int :
+        return len(self._similarity_mat)
     
 
 class ClusterWrapper_spectral(ClusterWrapper):
     """ Wrapper for methods about Spectral Clustering
     """
-    def __init__(self, M: np.ndarray, max_cluster: int = 16) -> None:
+    def __init__(self, M: np.ndarray, max_cluster: int = 16, weights: typing.Optional[np.ndarray] = None,
+                 eigengap: bool = False, jobs: int = 1, silhouette_sample: typing.Optional[int] = None) -> None:
         """ Constructor
 
         :param M: similarity matrix, normalized and symmetric.
-        :param max_cluster: Upper limit of the number of clusters. No less than 2.
+        :param max_cluster: Upper limit of the number of clusters. No less than 2
+                            and less than the number of samples.
+        :param weights: number of samples each row of `M` stands for, or `None` for all 1.
+                        Only the silhouette scores are weighted, the spectral
+                        embedding itself is computed on the rows as they are.
+        :param eigengap: also try the number of clusters at the largest gap
+                         between the Laplacian eigenvalues, if the sweep stops
+                         before reaching it
+        :param jobs: number of processes evaluating the rounds of the sweep
+        :param silhouette_sample: see `ClusterWrapper`
         """
-        super().__init__(M)
+        super().__init__(M, weights, silhouette_sample)
         assert (max_cluster >= 2) , "Upper limit of the number of clusters must be no less than 2"
+        assert (jobs >= 1) , "Number of jobs must be no less than 1"
         self._max_cluster = max_cluster
+        self._eigengap = eigengap
+        self._jobs = jobs
+        # Number of clusters at the largest eigengap, set by `do_clustering`
+        self.eigengap_estimate = None
         self.attempts_cnt = 0
         self.best_silhouette_score = -np.inf
         self.continuous_decrease_cnt = 0
@@ -91,8 +216,17 @@ class ClusterWrapper_spectral(ClusterWrapper):
 
         What's more, `scikit-learn` says that its Silhouette Coefficient
         is only defined if number of labels is `2 <= n_labels <= n_samples - 1`
+
+        The spectral embedding with `max_cluster` eigenvectors is computed
+        once, and each round only discretizes its first N columns.
+
+        With `jobs` > 1, all rounds are evaluated up front in a process pool
+        (see `_parallel_rounds`) and the stopping rule below is applied to
+        their scores afterwards, giving the same result.
         """
-        distance_mat = 1 - self._similarity_mat
+        self._prepare()
+        self.eigengap_estimate = _eigengap_estimate(self._eigenvalues)
+        rounds = self._parallel_rounds(range(2, 1 + self._max_cluster)) if self._jobs > 1 else {}
 
         # Pretend to put all into one cluster
         self.attempts_cnt = 1
@@ -116,26 +250,15 @@ class ClusterWrapper_spectral(ClusterWrapper):
             ''' ROUND BEGIN '''
             # Record the number of attempts
             self.attempts_cnt = N
-            # Run clustering process
-                
-            clustering = \
-                cluster.SpectralClustering(
-                    n_clusters = N,
-                    assign_labels = "discretize",
-                    random_state = 0,
-                    affinity = 'precomputed',
-                    n_jobs = 1,
-                    verbose = False
-                ).fit(self._similarity_mat)
-
-            # Get clustering result and calculate the corresponding silhouette score.
-            predicted = clustering.labels_
-            self.this_silhouette_score = \
-                metrics.silhouette_score(
-                    distance_mat,
-                    predicted,
-                    metric='precomputed'
-                )
+            if N in rounds:
+                # Evaluated by the process pool
+                predicted, self.this_silhouette_score, self.silhouette_error = rounds[N]
+            else:
+                # Run clustering process
+                predicted = self._spectral_labels(N)
+
+                # Get clustering result and calculate the corresponding silhouette score.
+                self.this_silhouette_score = self._score(predicted)
 
             if not (0 == self.prev_silhouette_score):
                 last_score_is_zero = False
@@ -156,7 +279,8 @@ class ClusterWrapper_spectral(ClusterWrapper):
                     self.continuous_decrease_cnt += 1
 
             # Print the silhouette score of this round
-            print("Round {}: silhouette score is {}".format(self.attempts_cnt, self.this_silhouette_score))
+            print("Round {}: silhouette score is {}{}".format(
+                self.attempts_cnt, self.this_silhouette_score, self._error_note()))
 
             # If a second consecutive decrease on silhouette score is encountered, 
             # stop immediately with the current best `self.clusters_result`.
@@ -166,29 +290,372 @@ class ClusterWrapper_spectral(ClusterWrapper):
             # Save this score for next round
             self.prev_silhouette_score = self.this_silhouette_score
             ''' ROUND END '''
+
+        if self._eigengap and self.eigengap_estimate > self.attempts_cnt:
+            # The sweep stopped early, try the eigengap estimate as well
+            N = self.eigengap_estimate
+            if N in rounds:
+                predicted, score, self.silhouette_error = rounds[N]
+            else:
+                predicted = self._spectral_labels(N)
+                score = self._score(predicted)
+            print("Eigengap round {}: silhouette score is {}{}".format(N, score, self._error_note()))
+            if score > self.best_silhouette_score:
+                self.best_silhouette_score = score
+                self.clusters_result = predicted
+                best_round = N
         
         print("Best -> Round {}".format(best_round))
         if (0 == self.best_silhouette_score):
             # Only one cluster in the result
             self.clusters_result = \
                 self.best_predicted_result = \
-                    np.zeros(len(self._similarity_mat))
+                    np.zeros(self._n_samples())
             print("Be careful: only 1 cluster in the result!")
 
+    def _error_note(self) -> str :
+        """ Confidence interval of the last silhouette score for the round prints
+        """
+        if self.silhouette_error is None:
+            return ""
+        return " (+/- {:.4f}, sampled)".format(self.silhouette_error)
+
+    def _prepare(self) -> None :
+        """ Work shared by all rounds of `do_clustering`
+        """
+        self._distance_mat = 1 - self._similarity_mat
+        self._embed()
+
+    def _parallel_rounds(self, rounds :typing.Iterable[int]) -> typing.Dict[int, typing.Tuple[np.ndarray, float]] :
+        """ Evaluate rounds of the sweep in `jobs` processes
+
+        The arrays of the prepared wrapper (similarity and distance matrices,
+        dense or CSR, embedding, ...) are put in `multiprocessing.shared_memory`
+        once, and every worker rebuilds the wrapper around them, so they are
+        not copied per worker. Other attributes are pickled once per worker.
+
+        :return: N => (labels, silhouette score, its `silhouette_error`)
+        """
+        blocks, shared, plain = _share_arrays(self)
+        try:
+            with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self._jobs, initializer=_attach_sweep,
+                    initargs=(type(self), shared, plain)) as pool:
+                return {N: result for N, *result in pool.map(_sweep_round, rounds)}
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+    def _embed(self) -> None :
+        """ Spectral embedding with `max_cluster` columns, as `sklearn.cluster.SpectralClustering` computes it
+
+        i.e. `SpectralClustering(affinity='precomputed', assign_labels='discretize',
+        random_state=0)`: its eigensolver draws its start vector from the
+        random state, and the labels are discretized with what is left of
+        it, which is kept for `_spectral_labels`.
+        """
+        random_state = np.random.RandomState(0)
+        self._embedding = spectral_embedding(
+            self._similarity_mat, n_components=self._max_cluster, random_state=random_state, drop_first=False)
+        self._discretize_state = random_state.get_state()
+        self._eigenvalues = _laplacian_eigenvalues(self._similarity_mat, self._embedding)
+
+    def _spectral_labels(self, N :int) -> np.ndarray :
+        """ Spectral Clustering into `N` clusters, from the first `N` columns of the embedding
+        """
+        random_state = np.random.RandomState()
+        random_state.set_state(self._discretize_state)
+        return discretize(self._embedding[:, :N], random_state=random_state)
+
+    def _score(self, labels :np.ndarray) -> float :
+        """ Silhouette score of a round
+        """
+        return self.silhouette(self._distance_mat, labels)
+
+
+class ClusterWrapper_spectral_lowrank(ClusterWrapper_spectral):
+    """ Spectral Clustering on a low-rank factor F of the similarity matrix M ~ F F^T
+
+    e.g. the Nystroem factor of `GKA.GKA_SparseWL`. Neither M nor the distance
+    matrix is ever built: every step is a product with F, i.e. O(N m) memory
+    for an N x m factor.
+
+    The spectral embedding is the same as `sklearn.cluster.SpectralClustering`
+    computes on M (normalized Laplacian without self-loops, eigenvectors
+    scaled back by the square root of the degrees, deterministic signs), with
+    ARPACK running on the implicit normalized affinity. It is computed once
+    for `max_cluster` clusters, and round N uses its first N columns.
+    """
+    def __init__(self, F: np.ndarray, max_cluster: int = 16, weights: typing.Optional[np.ndarray] = None,
+                 eigengap: bool = False, jobs: int = 1) -> None:
+        """ Constructor
+
+        :param F: factor (samples x rank) of the similarity matrix
+        :param max_cluster: Upper limit of the number of clusters. No less than 2
+                            and less than the number of samples.
+        :param weights: number of samples each row of `F` stands for, or `None` for all 1.
+        :param eigengap: see `ClusterWrapper_spectral`
+        :param jobs: see `ClusterWrapper_spectral`
+        """
+        super().__init__(None, max_cluster, weights, eigengap, jobs)
+        self._factor = F
+
+    def _n_samples(self) -> int :
+        return len(self._factor)
+
+    def _projection(self) -> np.ndarray :
+        """ First 2 non-trivial columns of the spectral embedding
+        """
+        if not hasattr(self, "_embedding"):
+            self._prepare()
+        return self._embedding[:, 1:3]
+
+    def _prepare(self) -> None :
+        F = self._factor
+        self_sim = np.einsum("ij,ij->i", F, F)
+        self._embedding, self._eigenvalues = _implicit_spectral_embedding(
+            lambda x: F @ (F.T @ x), self_sim, F @ F.sum(axis=0), min(self._max_cluster, len(F) - 1))
+
+    def _spectral_labels(self, N :int) -> np.ndarray :
+        return discretize(self._embedding[:, :N].copy(), random_state=np.random.RandomState(0))
+
+    def _score(self, labels :np.ndarray) -> float :
+        return lowrank_silhouette_score(self._factor, labels, self._weights)
+
+
+class ClusterWrapper_spectral_blocked(ClusterWrapper_spectral_lowrank):
+    """ Spectral Clustering on a similarity matrix M read tile by tile, e.g. a `np.memmap`
+
+    No step holds more than `block_size` rows of M (or of the distance
+    matrix 1 - M) in memory: the spectral embedding is computed as in
+    `ClusterWrapper_spectral_lowrank`, with products by M done one block of
+    rows at a time, and the silhouette scores sum the distances of one
+    block of rows at a time.
+    """
+    def __init__(self, M: np.ndarray, max_cluster: int = 16, weights: typing.Optional[np.ndarray] = None,
+                 eigengap: bool = False, block_size: int = 4096) -> None:
+        """ Constructor
+
+        :param M: similarity matrix, normalized and symmetric, any dtype
+        :param max_cluster: Upper limit of the number of clusters. No less than 2
+                            and less than the number of samples.
+        :param weights: number of samples each row of `M` stands for, or `None` for all 1.
+        :param eigengap: see `ClusterWrapper_spectral`
+        :param block_size: number of rows of M in memory at once
+        """
+        ClusterWrapper_spectral.__init__(self, M, max_cluster, weights, eigengap)
+        assert (block_size > 0) , "Block size must be positive"
+        self._block_size = block_size
+
+    def _n_samples(self) -> int :
+        return len(self._similarity_mat)
+
+    def _prepare(self) -> None :
+        M = self._similarity_mat
+        n = len(M)
+        self_sim = np.empty(n)
+        row_sum = np.empty(n)
+        for begin, block in _row_blocks(M, self._block_size):
+            self_sim[begin:begin + len(block)] = block[:, begin:begin + len(block)].diagonal()
+            row_sum[begin:begin + len(block)] = block.sum(axis=1)
+        self._embedding, self._eigenvalues = _implicit_spectral_embedding(
+            lambda x: blocked_matmul(M, x, self._block_size), self_sim, row_sum, min(self._max_cluster, n - 1))
+
+    def _score(self, labels :np.ndarray) -> float :
+        return blocked_silhouette_score(self._similarity_mat, labels, self._weights, self._block_size)
+
+
+class ClusterWrapper_spectral_sparse(ClusterWrapper_spectral):
+    """ Spectral Clustering on a sparse similarity matrix S
+
+    e.g. `GKA.GKA_SparseWL.apply_WL_Subtree_Kernel_Pairs` on the candidate
+    pairs of `GKA.MinHashLSH`, or the k-nearest-neighbor graph of
+    `GKA.GKA_SparseWL.apply_WL_Subtree_Kernel_KNN`: entries not stored are
+    similarity 0, i.e. distance 1. S is embedded as it is with the sparse
+    ARPACK eigensolver, and the silhouette scores are computed from S
+    without densifying it.
+    """
+    def _n_samples(self) -> int :
+        return self._similarity_mat.shape[0]
+
+    def _projection(self) -> np.ndarray :
+        """ 2-D spectral embedding of S
+        """
+        return spectral_embedding(self._similarity_mat, n_components=2, random_state=0)
+
+    def _prepare(self) -> None :
+        self._embed()
+
+    def _score(self, labels :np.ndarray) -> float :
+        return sparse_silhouette_score(self._similarity_mat, labels, self._weights)
+
+
+class ClusterWrapper_hierarchical(ClusterWrapper):
+    """ Wrapper for methods about Agglomerative (Hierarchical) Clustering
+
+    The dendrogram over the distance matrix 1 - M is built once by
+    `scipy.cluster.hierarchy.linkage` (nearest-neighbor chain, or minimum
+    spanning tree for single linkage, both O(N^2)), and its cuts into 2 to
+    `max_cluster` clusters are all taken from it by `cut_tree`. Cut N + 1
+    splits one cluster of cut N in two, so its silhouette score only needs
+    the distance sums to the two new clusters, i.e. a product of the
+    distance matrix with 2 columns.
+    """
+    def __init__(self, M :np.ndarray, max_cluster :int =16, weights :typing.Optional[np.ndarray] =None,
+                 linkage :str ="average") -> None :
+        """ Constructor
+
+        :param M: similarity matrix, normalized and symmetric.
+        :param max_cluster: Upper limit of the number of clusters. No less than 2
+                            and less than the number of samples.
+        :param weights: number of samples each row of `M` stands for, or `None` for all 1.
+                        Only the silhouette scores are weighted, the dendrogram
+                        itself is built on the rows as they are.
+        :param linkage: linkage criterion, one of `LINKAGE_METHODS`
+        """
+        super().__init__(M, weights)
+        assert (max_cluster >= 2) , "Upper limit of the number of clusters must be no less than 2"
+        assert (linkage in LINKAGE_METHODS) , "Unknown linkage: {}".format(linkage)
+        self._max_cluster = max_cluster
+        self._linkage = linkage
+        # Dendrogram in the linkage matrix format of `scipy.cluster.hierarchy`, set by `do_clustering`
+        self.linkage_matrix = None
+        self.best_silhouette_score = -np.inf
+
+    def do_clustering(self):
+        """ Implementation of Agglomerative Clustering
+
+        Every cut from 2 to `max_cluster` clusters is scored, and the one
+        which scores the highest on silhouette score is saved. As in
+        `ClusterWrapper_spectral`, one cluster scores 0 and the smaller number
+        of clusters wins a tie.
+        """
+        distance_mat = np.maximum(1 - np.asarray(self._similarity_mat, dtype=np.float64), 0)
+        np.fill_diagonal(distance_mat, 0)
+        self.linkage_matrix = scipy.cluster.hierarchy.linkage(
+            scipy.spatial.distance.squareform(distance_mat, checks=False), method=self._linkage)
+        cuts = scipy.cluster.hierarchy.cut_tree(self.linkage_matrix, n_clusters=range(2, 1 + self._max_cluster))
+
+        if self._weights is None:
+            weights = np.ones(len(distance_mat))
+        else:
+            weights = np.asarray(self._weights, dtype=np.float64)
+        self.best_silhouette_score = 0
+        best_cut = None
+        sums = None
+        for j, N in enumerate(range(2, 1 + self._max_cluster)):
+            labels = cuts[:, j]
+            sums = _refined_sums(distance_mat, weights, labels, cuts[:, j - 1] if j else None, sums)
+            score = _silhouette_from_sums(sums, labels, weights, np.bincount(labels, weights, minlength=N))
+            print("Cut {}: silhouette score is {}".format(N, score))
+            if score > self.best_silhouette_score:
+                self.best_silhouette_score = score
+                self.clusters_result = labels
+                best_cut = N
+
+        print("Best -> Cut {}".format(best_cut))
+        if best_cut is None:
+            # Only one cluster in the result
+            self.clusters_result = np.zeros(self._n_samples())
+            print("Be careful: only 1 cluster in the result!")
+
+
+def central_members(
+    labels         :np.ndarray,
+    k              :int =1,
+    weights        :typing.Optional[np.ndarray] =None,
+    features       :typing.Optional[typing.Union[np.ndarray, scipy.sparse.spmatrix]] =None,
+    similarity_mat :typing.Optional[typing.Union[np.ndarray, scipy.sparse.spmatrix]] =None,
+    block_size     :int =4096
+) -> typing.Dict[typing.Any, np.ndarray] :
+    """ The `k` most central members of each cluster, its medoid first
+
+    The centrality of a member i of cluster c is sum_j w_j s_ij over the
+    members j of c, so the most central member is the medoid of c under
+    the distances 1 - s. It is computed from either
+
+        features        unit-norm feature vectors x with s_ij = <x_i, x_j>
+                        (e.g. `GKA.GKA_SparseWL.normalized_features`, or a
+                        low-rank factor): <x_i, sum_j w_j x_j>, i.e. one
+                        product with the weighted feature sums of the
+                        clusters, linear in the number of samples
+        similarity_mat  the similarity matrix, dense, sparse or a `np.memmap`:
+                        the weighted row sums of the block of each cluster,
+                        read `block_size` rows at a time; quadratic in the
+                        size of each cluster, so give features when there
+                        are any
+
+    :param labels: cluster of each sample
+    :param weights: number of samples each row stands for, or `None` for all 1
+    :return: cluster => row indexes of its `k` most central members
+    """
+    assert ((features is None) != (similarity_mat is None)) , "Give either features or a similarity matrix"
+    clusters, labels = np.unique(labels, return_inverse=True)
+    labels = labels.reshape(-1)
+    weights = np.ones(len(labels)) if weights is None else np.asarray(weights, dtype=np.float64)
+    # Members of each cluster are grouped[begin[c]:begin[c + 1]]
+    grouped = np.argsort(labels, kind="stable")
+    begin = np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=len(clusters)))))
+    if features is not None:
+        indicator = scipy.sparse.csr_matrix(
+            (weights, (np.arange(len(labels)), labels)), shape=(len(labels), len(clusters)))
+        sums = features @ (features.T @ indicator)
+        sums = sums.toarray() if scipy.sparse.issparse(sums) else np.asarray(sums)
+        centrality = sums[np.arange(len(labels)), labels]
+    else:
+        centrality = np.empty(len(labels))
+        for c in range(len(clusters)):
+            members = grouped[begin[c]:begin[c + 1]]
+            for first in range(0, len(members), block_size):
+                rows = members[first:first + block_size]
+                block = similarity_mat[rows][:, members]
+                centrality[rows] = np.asarray(block @ weights[members]).reshape(-1)
+    # Members of each cluster in turn, the most central first
+    order = np.lexsort((-centrality, labels))
+    return {c: order[begin[i]:min(begin[i] + k, begin[i + 1])] for i, c in enumerate(clusters.tolist())}
+
+
+def _refined_sums(
+    distance_mat :np.ndarray,
+    weights      :np.ndarray,
+    labels       :np.ndarray,
+    parent       :typing.Optional[np.ndarray],
+    parent_sums  :typing.Optional[np.ndarray]
+) -> np.ndarray :
+    """ Weighted distance sums of each sample to each cluster of `labels`
+
+    `parent` are the labels of the cut `labels` refines by splitting one
+    cluster in two, with `parent_sums` its distance sums, or `None` to
+    compute all sums.
+    """
+    if parent is None:
+        return distance_mat @ _weighted_indicator(labels, weights)[2]
+    # Cluster of `parent` each cluster of `labels` is in
+    origin = np.zeros(labels.max() + 1, dtype=np.int64)
+    origin[labels] = parent
+    children = np.flatnonzero(origin == np.argmax(np.bincount(origin)))
+    sums = parent_sums[:, origin]
+    indicator = np.where(labels[:, None] == children, weights[:, None], 0.0)
+    sums[:, children] = distance_mat @ indicator
+    return sums
+
 
 class ConvergerWrapper:
     """ Wrapper for methods about detecting outliers
     """
-    def __init__(self, M :np.ndarray, outlier_ratio :float =0.05) -> None :
+    def __init__(self, M :np.ndarray, outlier_ratio :float =0.05, weights :typing.Optional[np.ndarray] =None) -> None :
         """ Constructor
 
         :param M: similarity matrix, normalized and symmetric.
         :param outlier_ratio: When the proportion of outliers is more or equal than `outlier_ratio`, 
                               we assert that the outlier detection algorithm made a mistake, 
                               which means all samples should be clustered.
+        :param weights: number of samples each row of `M` stands for, or `None` for all 1.
         """
         self._similarity_mat = M
         self._outlier_ratio = outlier_ratio
+        self._weights = weights
         self.outliers_result = None
 
     def do_converging(self):
@@ -207,24 +674,666 @@ class ConvergerWrapper:
             # wants to keep consistency of invocation procedure
             return
         
-        distance_mat = 1 - self._similarity_mat
+        samples = self._samples()
         iso = \
             ensemble.IsolationForest(
                 contamination='auto', random_state=42
             )
-        outlier_flags = iso.fit(distance_mat).predict(distance_mat)
+        outlier_flags = self._predict(iso.fit(samples, sample_weight=self._weights), samples)
 
         # When the proportion of outliers is more or equal than `_outlier_ratio`, 
         # we assert that the outer detection algorithm made a mistake, 
         # which means all samples should be clustered. Otherwise those outliers
         # could be remove so that they won't be clustered later.
-        number_of_outliers = len(list(filter(lambda x: x == -1, outlier_flags)))
-        number_of_samples = len(outlier_flags)
+        if self._weights is None:
+            number_of_outliers = len(list(filter(lambda x: x == -1, outlier_flags)))
+            number_of_samples = len(outlier_flags)
+        else:
+            number_of_outliers = np.sum(self._weights[outlier_flags == -1])
+            number_of_samples = np.sum(self._weights)
         if number_of_outliers >= np.floor(number_of_samples * self._outlier_ratio):
             return
         else:
             self.outliers_result = outlier_flags
 
+    def _samples(self) -> np.ndarray :
+        """ Samples of Isolation Forest, one row per sample
+        """
+        return 1 - self._similarity_mat
+
+    def _predict(self, iso :ensemble.IsolationForest, samples :np.ndarray) -> np.ndarray :
+        """ Outlier flags of the samples from the fitted Isolation Forest
+        """
+        return iso.predict(samples)
+
+
+class ConvergerWrapper_lowrank(ConvergerWrapper):
+    """ Outlier detection on a low-rank factor F of the similarity matrix M ~ F F^T
+
+    The rows of F stand in for the rows of the distance matrix 1 - M as the
+    samples of Isolation Forest: distances between rows of F are the
+    kernel-induced distances, and no N x N matrix is built.
+    """
+    def __init__(self, F :np.ndarray, outlier_ratio :float =0.05, weights :typing.Optional[np.ndarray] =None) -> None :
+        """ Constructor
+
+        :param F: factor (samples x rank) of the similarity matrix
+        :param outlier_ratio: see `ConvergerWrapper`
+        :param weights: number of samples each row of `F` stands for, or `None` for all 1.
+        """
+        super().__init__(None, outlier_ratio, weights)
+        self._factor = F
+
+    def _samples(self) -> np.ndarray :
+        return self._factor
+
+
+class ConvergerWrapper_sparse(ConvergerWrapper):
+    """ Outlier detection on a sparse similarity matrix S
+
+    The rows of S are the samples of Isolation Forest, which takes them
+    sparse, since the distance matrix 1 - S is dense. They are the rows of
+    1 - S mirrored: a split drawn uniformly between the minimum and the
+    maximum of a feature isolates the same samples in distribution either
+    way, but not draw for draw. So the flags are only equivalent in
+    distribution to those of `ConvergerWrapper` on 1 - S, and can differ
+    for some samples with the same `random_state`.
+    """
+    def _samples(self) -> scipy.sparse.csr_matrix :
+        return scipy.sparse.csr_matrix(self._similarity_mat)
+
+
+class ConvergerWrapper_blocked(ConvergerWrapper):
+    """ Outlier detection on a similarity matrix M read tile by tile, e.g. a `np.memmap`
+
+    The distance matrix 1 - M is written block by block into a temporary
+    float32 `np.memmap` (the dtype Isolation Forest works in, so it takes
+    the map without a copy), and the samples are scored one block of rows
+    at a time. The result is the same as `ConvergerWrapper`'s.
+    """
+    def __init__(self, M :np.ndarray, outlier_ratio :float =0.05, weights :typing.Optional[np.ndarray] =None,
+                 block_size :int =4096, memmap_dir :typing.Optional[str] =None) -> None :
+        """ Constructor
+
+        :param M: similarity matrix, normalized and symmetric, any dtype
+        :param outlier_ratio: see `ConvergerWrapper`
+        :param weights: number of samples each row of `M` stands for, or `None` for all 1.
+        :param block_size: number of rows of M in memory at once
+        :param memmap_dir: directory of the temporary distance matrix, or `None` for the system default
+        """
+        super().__init__(M, outlier_ratio, weights)
+        assert (block_size > 0) , "Block size must be positive"
+        self._block_size = block_size
+        self._memmap_dir = memmap_dir
+
+    def _samples(self) -> np.ndarray :
+        M = self._similarity_mat
+        distance_mat = temp_memmap(M.shape, np.float32, self._memmap_dir)
+        for begin, block in _row_blocks(M, self._block_size):
+            distance_mat[begin:begin + len(block)] = 1 - np.asarray(block, dtype=np.float64)
+        return distance_mat
+
+    def _predict(self, iso :ensemble.IsolationForest, samples :np.ndarray) -> np.ndarray :
+        return np.concatenate([iso.predict(block) for _, block in _row_blocks(samples, self._block_size)])
+
+
+class ConvergerWrapper_embedding(ConvergerWrapper):
+    """ Outlier detection on a low-dimensional embedding of the similarity matrix M
+
+    The samples of Isolation Forest are the rows of an `n_components`-column
+    embedding instead of the N-dimensional rows of the distance matrix:
+
+        spectral  the spectral embedding `ClusterWrapper_spectral` clusters on
+        mds       classical MDS of the kernel-induced distances
+                  sqrt(2 - 2 M), i.e. the kernel PCA of M
+
+    Both are computed by ARPACK from products with M only, so M may be
+    sparse, or read `block_size` rows at a time (e.g. a `np.memmap`).
+    """
+    def __init__(self, M :np.ndarray, outlier_ratio :float =0.05, weights :typing.Optional[np.ndarray] =None,
+                 method :str ="spectral", n_components :int =32, block_size :typing.Optional[int] =None) -> None :
+        """ Constructor
+
+        :param M: similarity matrix, normalized and symmetric, dense or sparse
+        :param outlier_ratio: see `ConvergerWrapper`
+        :param weights: number of samples each row of `M` stands for, or `None` for all 1.
+        :param method: "spectral" or "mds"
+        :param n_components: dimension of the embedding, at most the number of samples - 1
+        :param block_size: number of rows of M in memory at once, or `None` for all
+        """
+        super().__init__(M, outlier_ratio, weights)
+        assert (method in ("spectral", "mds")) , "Unknown embedding: {}".format(method)
+        assert (n_components >= 1) , "Dimension of the embedding must be positive"
+        self._method = method
+        self._n_components = n_components
+        self._block_size = block_size
+
+    def _matvec(self, x :np.ndarray) -> np.ndarray :
+        M = self._similarity_mat
+        if self._block_size is not None and not scipy.sparse.issparse(M):
+            return blocked_matmul(M, x, self._block_size)
+        return np.asarray(M @ x)
+
+    def _samples(self) -> np.ndarray :
+        M = self._similarity_mat
+        n = M.shape[0]
+        k = min(self._n_components, n - 1)
+        if "spectral" == self._method:
+            self_sim = np.asarray(M.diagonal(), dtype=np.float64)
+            return _implicit_spectral_embedding(self._matvec, self_sim, self._matvec(np.ones(n)), k)[0]
+
+        def centered(x :np.ndarray) -> np.ndarray :
+            # J M J x with the centering matrix J = I - 1 1^T / n
+            y = self._matvec(x - x.mean(axis=0))
+            return y - y.mean(axis=0)
+        B = scipy.sparse.linalg.LinearOperator((n, n), matvec=centered, matmat=centered, dtype=np.float64)
+        v0 = np.random.RandomState(0).uniform(-1, 1, n)
+        vals, vecs = scipy.sparse.linalg.eigsh(B, k=k, which="LA", v0=v0)
+        order = np.argsort(-vals, kind="stable")
+        return vecs[:, order] * np.sqrt(np.maximum(vals[order], 0))
+
+
+class ConvergerWrapper_knn(ConvergerWrapper):
+    """ Outlier detection on the distances of each sample to its k nearest neighbors
+
+    The samples of Isolation Forest are the k smallest distances 1 - M of
+    each sample, in ascending order. A sample standing for w samples (see
+    `weights`) has w - 1 neighbors at the distance to itself, and is w
+    neighbors of the others. M is read `block_size` rows at a time.
+    """
+    def __init__(self, M :np.ndarray, outlier_ratio :float =0.05, weights :typing.Optional[np.ndarray] =None,
+                 k :int =32, block_size :int =4096) -> None :
+        """ Constructor
+
+        :param M: similarity matrix, normalized and symmetric, any dtype
+        :param outlier_ratio: see `ConvergerWrapper`
+        :param weights: number of samples each row of `M` stands for, or `None` for all 1.
+        :param k: number of neighbors, at most the number of samples - 1
+        :param block_size: number of rows of M in memory at once
+        """
+        super().__init__(M, outlier_ratio, weights)
+        assert (k >= 1) , "Number of neighbors must be positive"
+        assert (block_size > 0) , "Block size must be positive"
+        self._k = k
+        self._block_size = block_size
+
+    def _samples(self) -> np.ndarray :
+        M = self._similarity_mat
+        n = M.shape[0]
+        weights = np.ones(n, dtype=np.int64) if self._weights is None else np.asarray(self._weights, dtype=np.int64)
+        k = min(self._k, int(weights.sum()) - 1)
+        # k + 1 candidates: the sample itself may stand for no neighbor
+        m = min(k + 1, n)
+        distances = np.empty((n, k))
+        for begin, block in _row_blocks(M, self._block_size):
+            sim = np.asarray(block, dtype=np.float64)
+            if m < n:
+                candidates = np.argpartition(-sim, m - 1, axis=1)[:, :m]
+            else:
+                candidates = np.broadcast_to(np.arange(n), sim.shape)
+            dist = 1 - np.take_along_axis(sim, candidates, axis=1)
+            order = np.argsort(dist, axis=1, kind="stable")
+            candidates = np.take_along_axis(candidates, order, axis=1)
+            dist = np.take_along_axis(dist, order, axis=1)
+            # Number of neighbors each candidate stands for
+            count = weights[candidates] - (candidates == np.arange(begin, begin + len(sim))[:, None])
+            # Neighbor r (0-based) is the first candidate whose cumulated count exceeds r
+            rank = (np.cumsum(count, axis=1)[:, :, None] <= np.arange(k)).sum(axis=1)
+            distances[begin:begin + len(sim)] = np.take_along_axis(dist, rank, axis=1)
+        return distances
+
+
+# Wrapper rebuilt in a worker process of `ClusterWrapper_spectral._parallel_rounds`
+_sweep_wrapper = None
+# Shared memory blocks the worker's wrapper is attached to
+_sweep_blocks = []
+
+
+def _share_array(value :np.ndarray, blocks :list) -> typing.Tuple[str, tuple, str, str] :
+    """ Copy an array into a new shared memory block, appended to `blocks`
+
+    :return: (block name, shape, dtype, order)
+    """
+    order = "F" if value.flags.f_contiguous and not value.flags.c_contiguous else "C"
+    shm = shared_memory.SharedMemory(create=True, size=value.nbytes)
+    blocks.append(shm)
+    np.ndarray(value.shape, value.dtype, buffer=shm.buf, order=order)[...] = value
+    return shm.name, value.shape, value.dtype.str, order
+
+
+def _attach_array(block :str, shape :tuple, dtype :str, order :str) -> np.ndarray :
+    """ Array in a shared memory block of `_share_array`, kept attached in `_sweep_blocks`
+    """
+    shm = shared_memory.SharedMemory(name=block)
+    _sweep_blocks.append(shm)
+    return np.ndarray(shape, np.dtype(dtype), buffer=shm.buf, order=order)
+
+
+def _share_arrays(obj :object) -> typing.Tuple[list, dict, dict] :
+    """ Copy the array attributes of an object into shared memory
+
+    NumPy arrays are shared as they are, and CSR matrices as their `data`,
+    `indices` and `indptr` arrays. Memory-mapped arrays are left out, as
+    they are already shared by their file.
+
+    :return: (shared memory blocks,
+              name => (CSR matrix type and shape, or `None` for an array,
+                       (block name, shape, dtype, order) of each shared array),
+              name => other attribute)
+    """
+    blocks, shared, plain = [], {}, {}
+    for name, value in vars(obj).items():
+        if type(value) is np.ndarray and 0 < value.nbytes:
+            shared[name] = (None, [_share_array(value, blocks)])
+        elif scipy.sparse.issparse(value) and "csr" == value.format and 0 < value.nnz:
+            shared[name] = ((type(value), value.shape),
+                            [_share_array(a, blocks) for a in (value.data, value.indices, value.indptr)])
+        else:
+            plain[name] = value
+    return blocks, shared, plain
+
+
+def _attach_sweep(cls :type, shared :dict, plain :dict) -> None :
+    """ Worker initializer: rebuild the wrapper around the shared arrays
+    """
+    global _sweep_wrapper
+    obj = cls.__new__(cls)
+    obj.__dict__.update(plain)
+    for name, (csr, specs) in shared.items():
+        arrays = [_attach_array(*spec) for spec in specs]
+        if csr is None:
+            setattr(obj, name, arrays[0])
+        else:
+            csr_type, shape = csr
+            setattr(obj, name, csr_type(tuple(arrays), shape=shape, copy=False))
+    _sweep_wrapper = obj
+
+
+def _sweep_round(N :int) -> typing.Tuple[int, np.ndarray, float, typing.Optional[float]] :
+    """ Worker: labels, silhouette score and its `silhouette_error` of round N
+    """
+    predicted = _sweep_wrapper._spectral_labels(N)
+    score = _sweep_wrapper._score(predicted)
+    return N, predicted, score, _sweep_wrapper.silhouette_error
+
+
+def temp_memmap(shape :typing.Tuple[int, ...], dtype :typing.Any =np.float64, directory :typing.Optional[str] =None) -> np.memmap :
+    """ New `np.memmap` backed by an anonymous temporary file in `directory`
+
+    The file is unlinked right away: its disk space is freed as soon as the
+    map is no longer referenced.
+    """
+    fd, path = tempfile.mkstemp(suffix=".mat", dir=directory)
+    try:
+        os.close(fd)
+        return np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+    finally:
+        os.remove(path)
+
+
+def _row_blocks(M :np.ndarray, block_size :int) -> typing.Iterator[typing.Tuple[int, np.ndarray]] :
+    """ (first row, rows) of each block of `block_size` rows of M
+    """
+    for begin in range(0, len(M), block_size):
+        yield begin, M[begin:begin + block_size]
+
+
+def blocked_matmul(M :np.ndarray, x :np.ndarray, block_size :int) -> np.ndarray :
+    """ M x in float64, reading `block_size` rows of M at a time
+    """
+    return np.concatenate([np.asarray(block, dtype=np.float64) @ x for _, block in _row_blocks(M, block_size)])
+
+
+def blocked_silhouette_score(
+    M          :np.ndarray,
+    labels     :np.ndarray,
+    weights    :typing.Optional[np.ndarray] =None,
+    block_size :int =4096
+) -> float :
+    """ Mean Silhouette Coefficient with distances 1 - M, converting `block_size` rows of M at a time
+
+    Weighted as `weighted_silhouette_score`, and equal to
+    `metrics.silhouette_score` on 1 - M without weights.
+    """
+    if weights is None:
+        weights = np.ones(len(M))
+    labels, weights, indicator = _weighted_indicator(labels, weights)
+    # sums[i, k] = sum of weighted distances from i to cluster k
+    sums = np.concatenate([(1 - np.asarray(block, dtype=np.float64)) @ indicator
+                           for _, block in _row_blocks(M, block_size)])
+    return _silhouette_from_sums(sums, labels, weights, indicator.sum(axis=0))
+
+
+def weighted_silhouette_score(distance_mat :np.ndarray, labels :np.ndarray, weights :typing.Optional[np.ndarray] =None) -> float :
+    """ Mean Silhouette Coefficient where sample i stands for `weights[i]` identical samples
+
+    Equals `metrics.silhouette_score(..., metric='precomputed')` on the matrix
+    with every row/column i repeated `weights[i]` times, without building it.
+    The distance of a sample to its own copies is the diagonal of
+    `distance_mat`, i.e. 0 for a normalized kernel.
+
+    All distance sums from each sample to each cluster come from one product
+    of the distance matrix with the samples x clusters label indicator, i.e.
+    a single BLAS call instead of per-sample reductions.
+    """
+    if weights is None:
+        weights = np.ones(len(labels))
+    labels, weights, indicator = _weighted_indicator(labels, weights)
+    # sums[i, k] = sum of weighted distances from i to cluster k
+    sums = np.asarray(distance_mat) @ indicator
+    return _silhouette_from_sums(sums, labels, weights, indicator.sum(axis=0))
+
+
+def sampled_silhouette_score(
+    distance_mat :np.ndarray,
+    labels       :np.ndarray,
+    weights      :typing.Optional[np.ndarray] =None,
+    sample_size  :int =1000,
+    random_state :int =0
+) -> typing.Tuple[float, float] :
+    """ Estimate of `weighted_silhouette_score` from a sample of about `sample_size` rows
+
+    The sample is stratified by cluster with proportional allocation (at
+    least 2 rows per cluster), and only the sampled rows of `distance_mat`
+    are read, i.e. O(sample_size N) work. The mean Silhouette Coefficient of
+    each cluster is estimated from its sampled rows, and the estimate is the
+    mean of them weighted by cluster size.
+
+    :return: (estimate, half-width of its 95% confidence interval)
+    """
+    if weights is None:
+        weights = np.ones(len(labels))
+    labels, weights, indicator = _weighted_indicator(labels, weights)
+    cluster_weight = indicator.sum(axis=0)
+    cluster_size = np.bincount(labels)
+    allocation = np.minimum(cluster_size,
+        np.maximum(2, np.round(sample_size * cluster_size / len(labels)).astype(int)))
+
+    rs = np.random.RandomState(random_state)
+    rows = np.concatenate([rs.choice(np.flatnonzero(labels == k), n, replace=False)
+                           for k, n in enumerate(allocation)])
+    sums = np.asarray(distance_mat[rows]) @ indicator
+    s = _silhouette_values(sums, labels[rows], cluster_weight)
+
+    estimate = variance = 0.0
+    for k, (begin, end) in enumerate(zip(np.cumsum(allocation) - allocation, np.cumsum(allocation))):
+        w, s_k = weights[rows[begin:end]], s[begin:end]
+        mean = np.sum(w * s_k) / w.sum()
+        share = cluster_weight[k] / cluster_weight.sum()
+        estimate += share * mean
+        n, size = end - begin, cluster_size[k]
+        if 1 < n < size:
+            # Variance of a weighted mean of a sample without replacement
+            variance += share ** 2 * (1 - n / size) * n / (n - 1) \
+                * np.sum((w * (s_k - mean)) ** 2) / w.sum() ** 2
+    return float(estimate), float(1.96 * np.sqrt(variance))
+
+
+def lowrank_silhouette_score(F :np.ndarray, labels :np.ndarray, weights :typing.Optional[np.ndarray] =None) -> float :
+    """ Mean Silhouette Coefficient with distances 1 - F F^T, from the factor F only
+
+    The distance sums from each sample to each cluster are |k| - F (F^T 1_k),
+    i.e. O(N m) work and memory for an N x m factor. The distance of a
+    sample to itself is 0: rows of a Nystroem factor other than the
+    landmarks have |f_i|^2 < 1, so w_i (1 - |f_i|^2) is taken off the sum to
+    its own cluster. Weighted as `weighted_silhouette_score`, and equal to
+    `metrics.silhouette_score` on 1 - F F^T with a zero diagonal (and not
+    clipped at 0) without weights.
+    """
+    if weights is None:
+        weights = np.ones(len(F))
+    labels, weights, indicator = _weighted_indicator(labels, weights)
+    cluster_weight = indicator.sum(axis=0)
+    sums = cluster_weight[None, :] - F @ (F.T @ indicator)
+    sums[np.arange(len(labels)), labels] -= weights * (1 - np.einsum("ij,ij->i", F, F))
+    return _silhouette_from_sums(sums, labels, weights, cluster_weight)
+
+
+def sparse_silhouette_score(S :scipy.sparse.spmatrix, labels :np.ndarray, weights :typing.Optional[np.ndarray] =None) -> float :
+    """ Mean Silhouette Coefficient with distances 1 - S, from the sparse similarity matrix S only
+
+    The distance sums from each sample to each cluster are |k| - S 1_k, i.e.
+    O(nnz(S) K) work for K clusters. Weighted as `weighted_silhouette_score`,
+    and equal to `metrics.silhouette_score` on 1 - S without weights.
+    """
+    if weights is None:
+        weights = np.ones(S.shape[0])
+    labels, weights, indicator = _weighted_indicator(labels, weights)
+    cluster_weight = indicator.sum(axis=0)
+    sums = cluster_weight[None, :] - np.asarray(S @ indicator)
+    return _silhouette_from_sums(sums, labels, weights, cluster_weight)
+
+
+def _implicit_spectral_embedding(
+    matvec   :typing.Callable[[np.ndarray], np.ndarray],
+    self_sim :np.ndarray,
+    row_sum  :np.ndarray,
+    k        :int
+) -> np.ndarray :
+    """ First `k` columns of the spectral embedding of a similarity matrix M given by products only
+
+    The same embedding as `sklearn.cluster.SpectralClustering` computes on M
+    (normalized Laplacian without self-loops, eigenvectors scaled back by the
+    square root of the degrees, deterministic signs), with ARPACK running on
+    the implicit normalized affinity.
+
+    :param matvec: x => M x
+    :param self_sim: diagonal of M
+    :param row_sum: row sums of M
+    :return: (embedding, the `k` smallest eigenvalues of the normalized Laplacian in ascending order)
+    """
+    n = len(self_sim)
+    # M without its diagonal, as `scipy.sparse.csgraph.laplacian` does
+    degree = np.maximum(row_sum - self_sim, np.finfo(np.float64).tiny)
+    dd = np.sqrt(degree)
+    diag = self_sim / degree
+    affinity = scipy.sparse.linalg.LinearOperator(
+        (n, n), matvec=lambda x: matvec(x / dd) / dd - diag * x, dtype=np.float64)
+
+    v0 = np.random.RandomState(0).uniform(-1, 1, n)
+    vals, vecs = scipy.sparse.linalg.eigsh(affinity, k=k, which="LA", v0=v0)
+    order = np.argsort(-vals, kind="stable")
+    embedding = vecs[:, order] / dd[:, None]
+    # deterministic signs: the largest absolute value of each column is positive
+    signs = np.sign(embedding[np.abs(embedding).argmax(axis=0), range(k)])
+    return embedding * np.where(0 == signs, 1, signs), 1 - vals[order]
+
+
+def _laplacian_eigenvalues(M :typing.Union[np.ndarray, scipy.sparse.spmatrix], embedding :np.ndarray) -> np.ndarray :
+    """ Normalized Laplacian eigenvalues of the columns of a spectral embedding of M
+
+    The Rayleigh quotients of the eigenvectors recovered from the embedding
+    (scaled by the square root of the degrees again), one product with M.
+    """
+    self_sim = M.diagonal()
+    degree = np.maximum(np.asarray(M.sum(axis=1)).reshape(-1) - self_sim, np.finfo(np.float64).tiny)
+    dd = np.sqrt(degree)
+    x = embedding * dd[:, None]
+    x /= np.linalg.norm(x, axis=0)
+    u = x / dd[:, None]
+    # normalized affinity without self-loops times x
+    affinity_x = (np.asarray(M @ u) - self_sim[:, None] * u) / dd[:, None]
+    return 1 - np.einsum("ij,ij->j", x, affinity_x)
+
+
+def _eigengap_estimate(eigenvalues :np.ndarray) -> int :
+    """ Number of clusters N (>= 2) with the largest gap between the N-th and (N+1)-th smallest Laplacian eigenvalues
+    """
+    gaps = np.diff(np.sort(eigenvalues))
+    if len(gaps) < 2:
+        return 2
+    return int(np.argmax(gaps[1:])) + 2
+
+
+def _weighted_indicator(labels :np.ndarray, weights :np.ndarray) -> typing.Tuple[np.ndarray, ...] :
+    """ Labels => (dense labels 0..K-1, float weights, samples x clusters indicator scaled by the weights)
+    """
+    labels = np.unique(labels, return_inverse=True)[1].reshape(-1)
+    weights = np.asarray(weights, dtype=np.float64)
+    n_clusters = labels.max() + 1
+    assert (2 <= n_clusters <= weights.sum() - 1) , \
+        "Number of labels is {}. Valid values are 2 to n_samples - 1 (inclusive)".format(n_clusters)
+    indicator = np.zeros((len(labels), n_clusters))
+    indicator[np.arange(len(labels)), labels] = weights
+    return labels, weights, indicator
+
+
+def _silhouette_from_sums(
+    sums           :np.ndarray,
+    labels         :np.ndarray,
+    weights        :np.ndarray,
+    cluster_weight :np.ndarray
+) -> float :
+    """ Weighted mean Silhouette Coefficient from the distance sums of each sample to each cluster
+    """
+    return float(np.sum(weights * _silhouette_values(sums, labels, cluster_weight)) / weights.sum())
+
+
+def _silhouette_values(sums :np.ndarray, labels :np.ndarray, cluster_weight :np.ndarray) -> np.ndarray :
+    """ Silhouette Coefficient of each sample from its distance sums to each cluster
+    """
+    own_weight = cluster_weight[labels]
+    own = np.arange(len(labels)), labels
+    with np.errstate(divide="ignore", invalid="ignore"):
+        a = sums[own] / (own_weight - 1)
+        mean_other = sums / cluster_weight
+        mean_other[own] = np.inf
+        b = mean_other.min(axis=1)
+        s = (b - a) / np.maximum(a, b)
+    # A sample alone in its cluster scores 0
+    return np.nan_to_num(np.where(own_weight > 1, s, 0.0))
+
+
+class ContingencyTable:
+    """ Contingency table of a clustering result against the truth, and the metrics computed from it
+
+    Entry (i, j) of the sparse `table` is the number of items in cluster i
+    of the result and class j of the truth. Building it takes one pass over
+    the labels, and every metric below takes O(clusters x classes) at most,
+    instead of a pass over the N(N-1)/2 pairs of items.
+
+    https://nlp.stanford.edu/IR-book/html/htmledition/evaluation-of-clustering-1.html
+    """
+    def __init__(self, result_lst :typing.List[str], truth_lst :typing.List[str]) -> None :
+        """ Constructor
+
+        :param result_lst: cluster of each item
+        :param truth_lst: class of each item
+        """
+        assert (len(result_lst) == len(truth_lst)) , "Unmatched length!"
+        self.n = len(result_lst)
+        self.clusters, rows = _label_codes(result_lst)
+        self.classes, cols = _label_codes(truth_lst)
+        self.table = scipy.sparse.csr_matrix(
+            (np.ones(self.n, dtype=np.int64), (rows, cols)),
+            shape=(len(self.clusters), len(self.classes)))
+        self.table.sum_duplicates()
+        # Number of items of each cluster and of each class
+        self.cluster_size = np.asarray(self.table.sum(axis=1)).reshape(-1)
+        self.class_size = np.asarray(self.table.sum(axis=0)).reshape(-1)
+
+    def pair_counts(self) -> typing.Tuple[int,int,int,int] :
+        """ TP, TN, FP, FN over all N(N-1)/2 pairs of items, see `Calculate__TFPN`
+        """
+        SS_TP = _pairs(self.table.data)
+        same_cluster = _pairs(self.cluster_size)
+        same_class = _pairs(self.class_size)
+        SD_FP = same_cluster - SS_TP
+        DS_FN = same_class - SS_TP
+        DD_TN = self.n * (self.n - 1) // 2 - SS_TP - SD_FP - DS_FN
+        return SS_TP, DD_TN, SD_FP, DS_FN
+
+    def precision(self) -> float :
+        TP, TN, FP, FN = self.pair_counts()
+        return TP/(TP+FP)
+
+    def recall(self) -> float :
+        TP, TN, FP, FN = self.pair_counts()
+        return TP/(TP+FN)
+
+    def rand_index(self) -> float :
+        TP, TN, FP, FN = self.pair_counts()
+        return (TP+TN)/(TP+FP+FN+TN)
+
+    def f_measure(self, beta :float =1.0) -> float :
+        P = self.precision()
+        R = self.recall()
+        return (1 + beta**2) * P * R / (R + P * beta**2)
+
+    def purity(self) -> float :
+        """ Share of items in the most frequent class of their cluster, see `Calculate__Purity`
+        """
+        return int(self.table.max(axis=1).sum())/self.n
+
+    def inverse_purity(self) -> float :
+        """ Share of items in the most frequent cluster of their class, see `Calculate__Inverse_Purity`
+        """
+        return int(self.table.max(axis=0).sum())/self.n
+
+    def adjusted_rand_index(self) -> float :
+        """ Rand index adjusted for chance (Hubert and Arabie, 1985)
+
+        Equals `sklearn.metrics.adjusted_rand_score`, i.e. 1.0 for identical
+        partitions, including when both are a single cluster.
+        """
+        TP, TN, FP, FN = self.pair_counts()
+        total = TP + TN + FP + FN
+        if 0 == total:
+            return 1.0
+        expected = (TP + FP) * (TP + FN) / total
+        maximum = ((TP + FP) + (TP + FN)) / 2
+        if maximum == expected:
+            return 1.0
+        return (TP - expected) / (maximum - expected)
+
+    def normalized_mutual_info(self) -> float :
+        """ Mutual information normalized by the arithmetic mean of both entropies
+
+        Equals `sklearn.metrics.normalized_mutual_info_score`, i.e. 1.0 when
+        both the result and the truth are a single cluster.
+        """
+        rows, cols = self.table.nonzero()
+        count = self.table.data.astype(np.float64)
+        mutual_info = np.sum(count / self.n
+            * np.log(count * self.n / (self.cluster_size[rows] * self.class_size[cols])))
+        entropy = _entropy(self.cluster_size) + _entropy(self.class_size)
+        if 0 == entropy:
+            return 1.0
+        return float(max(mutual_info, 0.0) / (entropy / 2))
+
+    def bcubed(self) -> typing.Tuple[float, float, float] :
+        """ BCubed precision, recall and F measure (Bagga and Baldwin, 1998)
+
+        The precision of an item is the share of its cluster in its class,
+        the recall the share of its class in its cluster, both averaged over
+        all items; see Amigó et al. (2009).
+        """
+        rows, cols = self.table.nonzero()
+        square = self.table.data.astype(np.float64) ** 2
+        P = float(np.sum(square / self.cluster_size[rows]) / self.n)
+        R = float(np.sum(square / self.class_size[cols]) / self.n)
+        return P, R, 2 * P * R / (P + R)
+
+
+def _label_codes(lst :typing.List[str]) -> typing.Tuple[list, np.ndarray] :
+    """ Labels => (distinct labels in order of appearance, index into them of each label)
+    """
+    codes = {}
+    index = np.fromiter((codes.setdefault(x, len(codes)) for x in lst), dtype=np.int64, count=len(lst))
+    return list(codes), index
+
+
+def _pairs(counts :np.ndarray) -> int :
+    """ Number of pairs within groups of `counts` items, as a Python int
+    """
+    counts = counts.astype(np.int64)
+    return int(np.sum(counts * (counts - 1) // 2))
+
+
+def _entropy(counts :np.ndarray) -> float :
+    p = counts[counts > 0] / counts.sum()
+    return float(-np.sum(p * np.log(p)))
+
 
 def Calculate__TFPN(result_lst :typing.List[str], truth_lst :typing.List[str]) -> typing.Tuple[int,int,int,int] :
     """ Calculate TP, TN, FP, FN
@@ -241,30 +1350,13 @@ def Calculate__TFPN(result_lst :typing.List[str], truth_lst :typing.List[str]) -
     There are two types of errors we can commit.
     A (FP) decision assigns two dissimilar documents to the same cluster.
     A (FN) decision assigns two similar documents to different clusters.
+
+    Counted from the contingency table, see `ContingencyTable.pair_counts`:
+    the pairs in the same cluster and the same class are the pairs within
+    each entry of the table, and the other counts follow from the pairs
+    within each cluster and within each class.
     """
-    assert (len(result_lst) == len(truth_lst)) , "Unmatched length!"
-    L  = len(result_lst)
-    SS_TP = 0 # Same cluster & Same class
-    DD_TN = 0 # Diff cluster & Diff class 
-    SD_FP = 0 # Same cluster & Diff class
-    DS_FN = 0 # Diff cluster & Same class
-
-    for i in range(L):
-        for j in range(1+i , L):
-            if   (result_lst[i] == result_lst[j]) and (truth_lst[i] == truth_lst[j]):
-                # same cluster, same class
-                SS_TP += 1
-            elif (result_lst[i] == result_lst[j]) and (truth_lst[i] != truth_lst[j]):
-                # same cluster, diff class
-                SD_FP += 1
-            elif (result_lst[i] != result_lst[j]) and (truth_lst[i] == truth_lst[j]):
-                # diff cluster, same class
-                DS_FN += 1
-            elif (result_lst[i] != result_lst[j]) and (truth_lst[i] != truth_lst[j]):
-                # diff cluster, diff class
-                DD_TN += 1
-
-    return SS_TP, DD_TN, SD_FP, DS_FN
+    return ContingencyTable(result_lst, truth_lst).pair_counts()
 
 
 def Calculate__Precision(result_lst :typing.List[str], truth_lst :typing.List[str]) -> float :
@@ -272,8 +1364,7 @@ def Calculate__Precision(result_lst :typing.List[str], truth_lst :typing.List[st
 
     https://nlp.stanford.edu/IR-book/html/htmledition/evaluation-of-clustering-1.html
     """
-    TP, TN, FP, FN = Calculate__TFPN(result_lst, truth_lst)
-    return TP/(TP+FP)
+    return ContingencyTable(result_lst, truth_lst).precision()
 
 
 def Calculate__Recall(result_lst :typing.List[str], truth_lst :typing.List[str]) -> float :
@@ -281,8 +1372,7 @@ def Calculate__Recall(result_lst :typing.List[str], truth_lst :typing.List[str])
 
     https://nlp.stanford.edu/IR-book/html/htmledition/evaluation-of-clustering-1.html
     """
-    TP, TN, FP, FN = Calculate__TFPN(result_lst, truth_lst)
-    return TP/(TP+FN)
+    return ContingencyTable(result_lst, truth_lst).recall()
 
 
 def Calculate__Rand_Index(result_lst :typing.List[str], truth_lst :typing.List[str]) -> float :
@@ -291,8 +1381,7 @@ def Calculate__Rand_Index(result_lst :typing.List[str], truth_lst :typing.List[s
 
     https://nlp.stanford.edu/IR-book/html/htmledition/evaluation-of-clustering-1.html
     """
-    TP, TN, FP, FN = Calculate__TFPN(result_lst, truth_lst)
-    return (TP+TN)/(TP+FP+FN+TN)
+    return ContingencyTable(result_lst, truth_lst).rand_index()
 
 
 def Calculate__F_Measure(result_lst :typing.List[str], truth_lst :typing.List[str], beta :float =1.0) -> float :
@@ -307,9 +1396,7 @@ def Calculate__F_Measure(result_lst :typing.List[str], truth_lst :typing.List[st
     weight to recall. In information retrieval, evaluating clustering with $F$ has the advantage 
     that the measure is already familiar to the research community.
     """
-    P = Calculate__Precision(result_lst, truth_lst)
-    R = Calculate__Recall(result_lst, truth_lst)
-    return (1 + beta**2) * P * R / (R + P * beta**2)
+    return ContingencyTable(result_lst, truth_lst).f_measure(beta)
 
 
 def Calculate__Purity(result_lst :typing.List[str], truth_lst :typing.List[str]) -> float :
@@ -327,34 +1414,7 @@ def Calculate__Purity(result_lst :typing.List[str], truth_lst :typing.List[str])
 
     Accuracy EQUALS Purity.
     """
-    assert (len(result_lst) == len(truth_lst)) , "Unmatched length!"
-    N = len(result_lst)
-
-    # Label each item in the list with an integer starting from 0 and represented result & truth as clusters.
-    result = {}
-    truth  = {}
-    for i in range(N):
-        if result_lst[i] not in result:
-            result[result_lst[i]] = set([i])
-        else:
-            result[result_lst[i]].add(i)
-        
-        if truth_lst[i] not in truth:
-            truth[truth_lst[i]] = set([i])
-        else:
-            truth[truth_lst[i]].add(i)
-    
-    # Traverse each cluster in result, find which class in truth is most frequent in the cluster.
-    all_sum = 0
-    for this_cluster in result:
-        max_cnt = 0
-        for this_class in truth:
-            coincidence = len(result[this_cluster] & truth[this_class])
-            if coincidence > max_cnt:
-                max_cnt = coincidence
-        all_sum += max_cnt
-    
-    return all_sum/N
+    return ContingencyTable(result_lst, truth_lst).purity()
 
 
 def Calculate__Inverse_Purity(result_lst :typing.List[str], truth_lst :typing.List[str]) -> float :
@@ -369,7 +1429,25 @@ def Calculate__Inverse_Purity(result_lst :typing.List[str], truth_lst :typing.Li
     simply make one cluster per item, we reach trivially a maximum purity value. 
     Inverse Purity focuses on the cluster with maximum recall for each category.
     """
-    return Calculate__Purity(truth_lst, result_lst)
+    return ContingencyTable(result_lst, truth_lst).inverse_purity()
+
+
+def Calculate__Adjusted_Rand_Index(result_lst :typing.List[str], truth_lst :typing.List[str]) -> float :
+    """ Calculate Adjusted Rand Index, see `ContingencyTable.adjusted_rand_index`
+    """
+    return ContingencyTable(result_lst, truth_lst).adjusted_rand_index()
+
+
+def Calculate__NMI(result_lst :typing.List[str], truth_lst :typing.List[str]) -> float :
+    """ Calculate Normalized Mutual Information, see `ContingencyTable.normalized_mutual_info`
+    """
+    return ContingencyTable(result_lst, truth_lst).normalized_mutual_info()
+
+
+def Calculate__BCubed(result_lst :typing.List[str], truth_lst :typing.List[str]) -> typing.Tuple[float, float, float] :
+    """ Calculate BCubed precision, recall and F measure, see `ContingencyTable.bcubed`
+    """
+    return ContingencyTable(result_lst, truth_lst).bcubed()
 
 
 if __name__ == "__main__":
@@ -3,13 +3,18 @@
 # Written and maintained by Jiang Xiyue <xiyue_jiang@outlook.com>
 
 import os
+import sys
 import argparse
 import r2pipe
 import json
+import numpy
 import subprocess
 from conifg import config
 import re
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "TraceClusterMaker"))
+import TraceIO
+
 TMP_OUTPUT_PATH = config["trace_tmp_path"]
 KEY_BREAKPOINT = "breakpoint"
 KEY_HIT_COUNT = "hit_count"
@@ -17,8 +22,10 @@ PAT_BREAKPOINT_ADDR = re.compile(r'Breakpoint 1 at (0x[a-z0-9]+)')
 
 
 class TracePruner:
-    def __init__(self, trace_dir, breakpoint_hit_count_file, output_dir, target_binary, binary_args):
+    def __init__(self, trace_dir, breakpoint_hit_count_file, output_dir, target_binary, binary_args, compression=None):
         self._trace_dir = trace_dir
+        # None for plain output, or a key of TraceIO.COMPRESSION_SUFFIX
+        self._compression = compression
         self._breakpoint_hit_count_file = breakpoint_hit_count_file
         self._output_dir = output_dir
         self._target_binary = target_binary
@@ -124,6 +131,12 @@ class TracePruner:
     def _get_last_breakpoint_addr_index(self, hit_count, trace_file_lines, breakpoint_addr):
         if hit_count == 0:
             return None
+        if isinstance(trace_file_lines, numpy.ndarray):
+            # packed trace: addresses are already integers
+            hit_indexes = numpy.flatnonzero(trace_file_lines == breakpoint_addr)
+            if len(hit_indexes) < hit_count:
+                return None
+            return int(hit_indexes[hit_count - 1])
         stop_position = hit_count
         breakpoint_addr_int = breakpoint_addr
         curr_position = 0
@@ -147,6 +160,8 @@ class TracePruner:
         """
         trace_file_path = os.path.join(self._trace_dir, trace_filename)
         output_file_path = os.path.join(self._output_dir, trace_filename)
+        if self._compression is not None:
+            output_file_path += TraceIO.COMPRESSION_SUFFIX[self._compression]
 
         breakpoints_hit_count = self._get_breakpoints_hit_count(trace_filename)
 
@@ -154,9 +169,13 @@ class TracePruner:
         # cut_addrs are hexadecimal numbers
         cut_addrs = self._find_call_ins_addrs(breakpoint_addrs)
 
-        trace_file = open(trace_file_path, "r")
-        trace_file_lines = trace_file.readlines()
-        trace_file.close()
+        is_packed = TraceIO.is_packed_trace(trace_file_path)
+        if is_packed:
+            trace_file_lines = TraceIO.load_packed_trace(trace_file_path)
+        else:
+            # may be compressed, lines are bytes
+            with TraceIO.open_trace(trace_file_path) as trace_file:
+                trace_file_lines = trace_file.readlines()
 
         for idx, cut_addr in enumerate(cut_addrs):
             if cut_addr is None:
@@ -168,10 +187,12 @@ class TracePruner:
 
             # Prune the trace with the first valid cut_addr
             stop_idx += 1
-            output_file = open(output_file_path, "w")
-            for line in trace_file_lines[:stop_idx]:
-                output_file.write(line)
-            output_file.close()
+            if is_packed:
+                TraceIO.write_packed_trace(output_file_path, trace_file_lines[:stop_idx], self._compression)
+                return
+            with TraceIO.open_trace_writer(output_file_path, self._compression) as output_file:
+                for line in trace_file_lines[:stop_idx]:
+                    output_file.write(line)
             return
         else:
             print("- Failed to prune \"{}\"".format(trace_filename))
@@ -200,6 +221,8 @@ if __name__ == '__main__':
     parser.add_argument("-o", help="result output dir (auto create if not exists)")
     parser.add_argument("-b", help="target binary")
     parser.add_argument("-a", help="the path of argument file", default=None)
+    parser.add_argument("-z", help="compress the pruned traces",
+                        choices=sorted(TraceIO.COMPRESSION_SUFFIX), default=None)
     args = parser.parse_args()
-    tp = TracePruner(args.i, args.c, args.o, args.b, args.a)  # , args.a)
+    tp = TracePruner(args.i, args.c, args.o, args.b, args.a, args.z)  # , args.a)
     tp.start()
@@ -3,27 +3,49 @@
 # Written and maintained by Jiang Zhiyuan <supermolejzy@gmail.com>
 
 import os
+import sys
 import argparse
+import numpy
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "TraceClusterMaker"))
+import TraceIO
 
 DEBUG = 0
 
+# Entries whose hex text contains this are dropped (stack addresses are 0x7fff........)
+STACK_HEX = 0x7fff
+
+
+def _has_stack_hex(addrs):
+    # same test as `b"7fff" in line` on the hex text: any nibble-aligned 16-bit window equals 0x7fff
+    found = numpy.zeros(len(addrs), dtype=bool)
+    for shift in range(0, 64 - 12, 4):
+        found |= ((addrs >> numpy.uint64(shift)) & numpy.uint64(0xffff)) == STACK_HEX
+    return found
+
 class TraceShrinker():
-    def __init__(self, ori_traces_path, shrinked_traces_path):
+    def __init__(self, ori_traces_path, shrinked_traces_path, compression=None):
         self._input_dir = ori_traces_path
         self._output_dir = shrinked_traces_path
+        # None for plain output, or a key of TraceIO.COMPRESSION_SUFFIX
+        self._compression = compression
 
         if not os.path.exists(self._output_dir):
             os.makedirs(self._output_dir)
 
     @staticmethod
-    def _remove_stack_trace(input_file, output_path):
-        final_content = ""
-        original_content = ""
-        with open(input_file, 'rb') as f:
-            original_content = f.readlines()
-
-        with open(output_path, 'ab') as f:
-            for line in original_content:
+    def _remove_stack_trace(input_file, output_path, compression=None):
+        # packed input stays packed: filter its address array as the text lines below;
+        # the header holds the count, so the output is overwritten instead of appended to
+        if TraceIO.is_packed_trace(input_file):
+            addrs = TraceIO.load_packed_trace(input_file)
+            TraceIO.write_packed_trace(output_path, addrs[~_has_stack_hex(addrs)], compression)
+            return
+
+        # input may be compressed, it is decompressed while streaming
+        with TraceIO.open_trace(input_file) as fin, \
+                TraceIO.open_trace_writer(output_path, compression, append=True) as f:
+            for line in fin:
                 if b"7fff" in line:
                     continue
                 else:
@@ -35,8 +57,10 @@ class TraceShrinker():
             for trace in traces:
                 trace_file = os.path.join(self._input_dir, trace)
                 shrinked_trace_file = os.path.join(self._output_dir, trace)
+                if self._compression is not None:
+                    shrinked_trace_file += TraceIO.COMPRESSION_SUFFIX[self._compression]
 
-                self._remove_stack_trace(trace_file, shrinked_trace_file)
+                self._remove_stack_trace(trace_file, shrinked_trace_file, self._compression)
 
 
 
@@ -48,10 +72,12 @@ def main():
 
     parser.add_argument("-i", help="original traces dir")
     parser.add_argument("-o", help="output shrinked traces storage dir")
+    parser.add_argument("-z", help="compress the shrinked traces",
+                        choices=sorted(TraceIO.COMPRESSION_SUFFIX), default=None)
 
     args = parser.parse_args()
 
-    T = TraceShrinker(args.i, args.o)
+    T = TraceShrinker(args.i, args.o, args.z)
     T.shrink_wrapper()
 
     print("Finished!")
@@ -1,6 +1,10 @@
 import argparse
 from graphviz import Digraph
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "TraceClusterMaker"))
+import TraceIO
 
 class Painter():
     def __init__(self, original_poc=None, decreased_poc=None, output_dir=None, paint_mode=0):
@@ -57,24 +61,28 @@ class Painter():
         else:
             return 9
 
+    @staticmethod
+    def _read_trace(trace_file):
+        # both hex text traces and packed traces (see TraceClusterMaker/TraceIO.py)
+        return TraceIO.load_trace(trace_file).tolist()
+
     @staticmethod
     def _add_width_for_graph(trace_file, dot_item):
         edges_width = {}
 
-        with open(trace_file, 'rb') as f:
-            content = f.readlines()
-            for i in range(len(content) - 1):
-                front_node = int(content[i].decode('utf-8', 'ignore').split('\n')[0], 16)
-                next_node = int(content[i + 1].decode('utf-8', 'ignore').split('\n')[0], 16)
+        content = Painter._read_trace(trace_file)
+        for i in range(len(content) - 1):
+            front_node = content[i]
+            next_node = content[i + 1]
 
-                if (front_node, next_node) in edges_width.keys():
-                    edges_width[(front_node, next_node)] += 1
-                else:
-                    edges_width[(front_node, next_node)] = 1
+            if (front_node, next_node) in edges_width.keys():
+                edges_width[(front_node, next_node)] += 1
+            else:
+                edges_width[(front_node, next_node)] = 1
 
-            for edge in edges_width.keys():
-                width = Painter._lookup_bucket(edges_width[edge])
-                dot_item.edge(str(edge[0]), str(edge[1]), style='setlinewidth(%d)' % width)
+        for edge in edges_width.keys():
+            width = Painter._lookup_bucket(edges_width[edge])
+            dot_item.edge(str(edge[0]), str(edge[1]), style='setlinewidth(%d)' % width)
 
     @staticmethod
     def _parse_edges_from_trace(trace_file):
@@ -83,14 +91,13 @@ class Painter():
         if trace_file is None:
             print("Weird!\n")
 
-        with open(trace_file, 'rb') as f:
-            content = f.readlines()
-            for i in range(len(content) - 1):
-                front_node = int(content[i].decode('utf-8', 'ignore').split('\n')[0], 16)
-                next_node = int(content[i + 1].decode('utf-8', 'ignore').split('\n')[0], 16)
+        content = Painter._read_trace(trace_file)
+        for i in range(len(content) - 1):
+            front_node = content[i]
+            next_node = content[i + 1]
 
-                edge = (front_node, next_node)
-                edges.add(edge)
+            edge = (front_node, next_node)
+            edges.add(edge)
 
         return edges
 
@@ -98,14 +105,13 @@ class Painter():
     def _parse_nodes_from_trace(trace_file):
         nodes = set()
 
-        with open(trace_file, 'rb') as f:
-            content = f.readlines()
-            for i in range(len(content) - 1):
-                front_node = int(content[i].decode('utf-8', 'ignore').split('\n')[0], 16)
-                next_node = int(content[i + 1].decode('utf-8', 'ignore').split('\n')[0], 16)
+        content = Painter._read_trace(trace_file)
+        for i in range(len(content) - 1):
+            front_node = content[i]
+            next_node = content[i + 1]
 
-                nodes.add(front_node)
-                nodes.add(next_node)
+            nodes.add(front_node)
+            nodes.add(next_node)
 
         return nodes
 
@@ -181,14 +187,13 @@ class Painter():
     def draw_graph(self):
         dot = Digraph()
 
-        with open(self._poc_ori, 'rb') as f:
-            content = f.readlines()
-            for i in range(len(content) - 1):
-                front_node = int(content[i].decode('utf-8', 'ignore').split('\n')[0], 16)
-                next_node = int(content[i + 1].decode('utf-8', 'ignore').split('\n')[0], 16)
+        content = Painter._read_trace(self._poc_ori)
+        for i in range(len(content) - 1):
+            front_node = content[i]
+            next_node = content[i + 1]
 
-                dot.node(str(front_node), str(front_node))
-                dot.node(str(next_node), str(next_node))
+            dot.node(str(front_node), str(front_node))
+            dot.node(str(next_node), str(next_node))
 
         if self._paint_mode == 0:
             inter_edges, pruned_edges, new_edges = Painter._different_edges_between_traces(self._poc_ori, self._poc_de)
@@ -0,0 +1,54 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from sklearn import metrics
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "TraceClusterMaker"))
+import cluster
+
+
+def make_case(n_samples :int, n_clusters :int, seed :int) -> tuple :
+    """ Synthetic distance matrix 1 - X X^T of normalized, clustered feature vectors, and noisy labels
+    """
+    rs = np.random.RandomState(seed)
+    centers = 4 * rs.randn(n_clusters, 16)
+    labels = rs.randint(n_clusters, size=n_samples)
+    X = centers[labels] + rs.randn(n_samples, 16)
+    X /= np.linalg.norm(X, axis=1)[:, None]
+    distance_mat = np.maximum(1 - X @ X.T, 0)
+    np.fill_diagonal(distance_mat, 0)
+    # 10% of the samples in a random cluster
+    noisy = rs.rand(n_samples) < 0.1
+    labels[noisy] = rs.randint(n_clusters, size=noisy.sum())
+    return distance_mat, labels
+
+
+def timed(f, *args, **kwargs) -> tuple :
+    start = time.perf_counter()
+    result = f(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the silhouette scores of cluster.py with scikit-learn")
+    parser.add_argument("--sizes", help="numbers of samples", type=int, nargs="+", default=[500, 2000, 5000])
+    parser.add_argument("--clusters", help="number of clusters", type=int, default=10)
+    parser.add_argument("--sample", help="sample size of the sampled estimate", type=int, default=1000)
+    parser.add_argument("--repeat", help="number of samples drawn to check the confidence intervals", type=int, default=20)
+    args = parser.parse_args()
+
+    print("{:>7} {:>12} {:>10} {:>10} {:>10} {:>22} {:>9}".format(
+        "N", "|diff|", "sklearn", "indicator", "sampled", "estimate", "coverage"))
+    for i, n in enumerate(args.sizes):
+        D, labels = make_case(n, args.clusters, i)
+        exact, t_sklearn = timed(metrics.silhouette_score, D, labels, metric="precomputed")
+        score, t_indicator = timed(cluster.weighted_silhouette_score, D, labels)
+        (estimate, error), t_sampled = timed(cluster.sampled_silhouette_score, D, labels, sample_size=args.sample)
+        # Share of the confidence intervals of repeated samples covering the exact score
+        covered = [abs(e - exact) <= h + 1e-9 for e, h in (
+            cluster.sampled_silhouette_score(D, labels, sample_size=args.sample, random_state=r)
+            for r in range(args.repeat))]
+        print("{:>7} {:>12.3e} {:>9.4f}s {:>9.4f}s {:>9.4f}s {:>13.4f} +/- {:.4f} {:>9.2f}".format(
+            n, abs(exact - score), t_sklearn, t_indicator, t_sampled, estimate, error, np.mean(covered)))